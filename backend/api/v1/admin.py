@@ -1,11 +1,21 @@
 # Файл: api/v1/admin.py (НОВЫЙ ФАЙЛ)
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+import asyncio
+import os
+import tempfile
+from datetime import date
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy.ext.asyncio import AsyncSession
 from models import pydantic_models
-from crud import user_crud, analysis_crud
+from crud import user_crud, analysis_crud, job_crud, metrics_crud, export_crud
+from core import tasks, result_cache, user_cache, export
 from core.security import get_current_user
-from database import get_db
+from core.pagination import page_params
+from database import get_async_db
 
 router = APIRouter(prefix="/v1/admin", tags=["Администратор / Управление Системой"])
 
@@ -27,10 +37,10 @@ def get_admin_user(current_user: pydantic_models.User = Depends(get_current_user
     summary="Получить список всех пользователей системы"
 )
 async def list_all_users(
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         admin_user: pydantic_models.User = Depends(get_admin_user)  # Защита маршрута
 ):
-    users = user_crud.get_all_users(db)
+    users = await user_crud.get_all_users_async(db)
     return users
 
 
@@ -43,7 +53,7 @@ async def list_all_users(
 async def change_user_role(
         user_id: int,
         role_update: pydantic_models.UserRoleUpdate,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         admin_user: pydantic_models.User = Depends(get_admin_user)
 ):
     valid_roles = ['admin', 'diagnostician', 'clinician']
@@ -53,7 +63,34 @@ async def change_user_role(
             detail=f"Недопустимая роль. Доступные роли: {', '.join(valid_roles)}"
         )
 
-    updated_user = user_crud.update_user_role(db, user_id, role_update.role)
+    updated_user = await user_crud.update_user_role_async(db, user_id, role_update.role)
+
+    if not updated_user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Пользователь не найден.")
+
+    return updated_user
+
+
+# --- 2.1. Управление Пользователями: Блокировка ---
+@router.patch(
+    "/users/{user_id}/active",
+    response_model=pydantic_models.User,
+    summary="Заблокировать или разблокировать пользователя по ID"
+)
+async def change_user_active(
+        user_id: int,
+        active_update: pydantic_models.UserActiveUpdate,
+        db: AsyncSession = Depends(get_async_db),
+        admin_user: pydantic_models.User = Depends(get_admin_user)
+):
+    """
+    Заблокированный пользователь получает 403 на любой запрос, в том числе
+    с ранее выданным токеном (кэш авторизации сбрасывается во всех процессах).
+    """
+    if user_id == admin_user.id and not active_update.is_active:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Нельзя заблокировать свою учетную запись.")
+
+    updated_user = await user_crud.set_user_active_async(db, user_id, active_update.is_active)
 
     if not updated_user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Пользователь не найден.")
@@ -64,16 +101,34 @@ async def change_user_role(
 # --- 3. Общие Данные: Просмотр всех анализов (Для полного обзора) ---
 @router.get(
     "/analyses/all",
-    response_model=list[pydantic_models.AnalysisFull],
-    summary="Получить полный список всех анализов в системе"
+    response_model=pydantic_models.AnalysisPage,
+    summary="Получить полный список всех анализов в системе (постранично)"
 )
 async def list_all_analyses(
-        db: Session = Depends(get_db),
+        page: dict = Depends(page_params),
+        db: AsyncSession = Depends(get_async_db),
+        admin_user: pydantic_models.User = Depends(get_admin_user)
+):
+    analyses, next_cursor = await analysis_crud.get_all_analyses_async(db, **page)
+    return {"items": analyses, "next_cursor": next_cursor}
+
+
+@router.delete(
+    "/analyses/{analysis_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    summary="Удалить анализ (с результатом и задачами очереди)"
+)
+async def delete_analysis(
+        analysis_id: int,
+        db: AsyncSession = Depends(get_async_db),
         admin_user: pydantic_models.User = Depends(get_admin_user)
 ):
-    # Добавим в crud/analysis_crud.py функцию get_all_analyses
-    analyses = analysis_crud.get_all_analyses(db)
-    return analyses
+    """
+    Освобождает ссылку на файл снимка. Файл без ссылок и его пирамиду тайлов
+    удаляет сборщик мусора (python -m manage sweep-blobs).
+    """
+    if not await analysis_crud.delete_analysis_async(db, analysis_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Анализ не найден.")
 
 
 @router.get(  # <--- ДОБАВЛЕН ДЕКОРАТОР @
@@ -82,12 +137,174 @@ async def list_all_analyses(
     summary="Получить метрики точности модели CV на основе обратной связи от врачей"
 )
 async def get_model_feedback_metrics(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     admin_user: pydantic_models.User = Depends(get_admin_user)
 ):
     """
     Показывает, насколько хорошо модель CV справляется с реальной диагностикой
     по мнению врачей (ключевой показатель для ретренинга).
     """
-    metrics = analysis_crud.get_feedback_metrics(db)
-    return metrics
\ No newline at end of file
+    metrics = await analysis_crud.get_feedback_metrics_async(db)
+    return metrics
+
+
+# Все метрики читаются из агрегатов, обновляемых при подтверждении заключения
+@router.get(
+    "/model/feedback_metrics/timeseries",
+    response_model=list[pydantic_models.ModelMetricsPoint],
+    summary="Точность модели CV по дням или неделям"
+)
+async def get_model_feedback_timeseries(
+    period: Literal["day", "week"] = Query("day"),
+    date_from: Optional[date] = Query(None, description="Начало периода (включительно)"),
+    date_to: Optional[date] = Query(None, description="Конец периода (не включительно)"),
+    model_version: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_async_db),
+    admin_user: pydantic_models.User = Depends(get_admin_user)
+):
+    return await db.run_sync(metrics_crud.get_timeseries, period, date_from, date_to, model_version)
+
+
+@router.get(
+    "/model/feedback_metrics/by_diagnosis",
+    response_model=list[pydantic_models.DiagnosisMetrics],
+    summary="Подтвержденные и отклоненные врачами выводы по каждому диагнозу системы"
+)
+async def get_model_feedback_by_diagnosis(
+    db: AsyncSession = Depends(get_async_db),
+    admin_user: pydantic_models.User = Depends(get_admin_user)
+):
+    return await db.run_sync(metrics_crud.get_by_diagnosis)
+
+
+@router.get(
+    "/model/feedback_metrics/by_model_version",
+    response_model=list[pydantic_models.ModelVersionMetrics],
+    summary="Точность по версиям модели CV"
+)
+async def get_model_feedback_by_model_version(
+    db: AsyncSession = Depends(get_async_db),
+    admin_user: pydantic_models.User = Depends(get_admin_user)
+):
+    return await db.run_sync(metrics_crud.get_by_model_version)
+
+
+# --- 4. Очередь инференса: состояние и dead-letter ---
+@router.get(
+    "/jobs/stats",
+    response_model=pydantic_models.JobQueueStats,
+    summary="Количество задач очереди инференса по статусам"
+)
+async def get_job_queue_stats(
+        db: AsyncSession = Depends(get_async_db),
+        admin_user: pydantic_models.User = Depends(get_admin_user)
+):
+    return await db.run_sync(job_crud.get_queue_stats)
+
+
+@router.get(
+    "/jobs/dead",
+    response_model=list[pydantic_models.InferenceJob],
+    summary="Список задач, исчерпавших попытки (dead-letter)"
+)
+async def list_dead_jobs(
+        db: AsyncSession = Depends(get_async_db),
+        admin_user: pydantic_models.User = Depends(get_admin_user)
+):
+    return await db.run_sync(job_crud.get_dead_jobs)
+
+
+@router.post(
+    "/jobs/{job_id}/retry",
+    response_model=pydantic_models.InferenceJob,
+    summary="Вернуть задачу из dead-letter в очередь"
+)
+async def retry_dead_job(
+        job_id: int,
+        db: AsyncSession = Depends(get_async_db),
+        admin_user: pydantic_models.User = Depends(get_admin_user)
+):
+    db_job = await db.run_sync(job_crud.retry_dead_job, job_id)
+    if not db_job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Задача в dead-letter не найдена.")
+
+    tasks.notify_new_jobs()
+    return db_job
+
+
+
+# --- 5. Кэш результатов CV ---
+@router.get(
+    "/cache/stats",
+    response_model=pydantic_models.CacheStats,
+    summary="Статистика кэша результатов CV (попадания/промахи)"
+)
+async def get_result_cache_stats(
+        admin_user: pydantic_models.User = Depends(get_admin_user)
+):
+    """
+    Счетчики попаданий относятся к текущему процессу, размер дискового
+    уровня — к общему файлу кэша.
+    """
+    return result_cache.get_cache().stats()
+
+
+@router.get(
+    "/cache/users/stats",
+    response_model=pydantic_models.UserCacheStats,
+    summary="Статистика кэша авторизованных пользователей (текущий процесс)"
+)
+async def get_user_cache_stats(
+        admin_user: pydantic_models.User = Depends(get_admin_user)
+):
+    return user_cache.get_cache().stats()
+
+
+# --- 6. Выгрузка подтвержденных результатов для переобучения модели ---
+@router.get(
+    "/export/results",
+    summary="Выгрузить подтвержденные результаты (NDJSON, CSV или Parquet)"
+)
+async def export_confirmed_results(
+        fmt: Literal["ndjson", "csv", "parquet"] = Query("ndjson", alias="format"),
+        date_from: Optional[date] = Query(None, description="Дата анализа от (включительно)"),
+        date_to: Optional[date] = Query(None, description="Дата анализа до (не включительно)"),
+        model_version: Optional[str] = Query(None),
+        db: AsyncSession = Depends(get_async_db),
+        admin_user: pydantic_models.User = Depends(get_admin_user)
+):
+    """
+    Строки читаются курсором порциями по EXPORT_BATCH_SIZE и сразу отдаются
+    клиенту: память не растет с объемом выгрузки. Parquet собирается во
+    временном файле (формат требует записи метаданных в конце) и отдается после.
+    """
+    try:
+        export.ensure_format(fmt)
+    except export.ExportFormatUnavailable as e:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail=str(e))
+
+    filters = {"date_from": date_from, "date_to": date_to, "model_version": model_version}
+    headers = {"Content-Disposition": f'attachment; filename="{export.filename(fmt)}"'}
+    fields = export_crud.EXPORT_FIELDS
+
+    if fmt == "parquet":
+        fd, path = tempfile.mkstemp(suffix=".parquet")
+        os.close(fd)
+        try:
+            writer = export.ParquetWriter(path, fields, export_crud.EXPORT_TYPES)
+            async for rows in export_crud.iter_confirmed_results_async(db, **filters):
+                await asyncio.to_thread(writer.write, rows)
+            await asyncio.to_thread(writer.close)
+        except BaseException:
+            os.remove(path)
+            raise
+        return FileResponse(path, media_type=export.MEDIA_TYPES[fmt], headers=headers,
+                            background=BackgroundTask(os.remove, path))
+
+    async def body():
+        if fmt == "csv":
+            yield export.csv_chunk([fields])
+        async for rows in export_crud.iter_confirmed_results_async(db, **filters):
+            yield export.ndjson_chunk(fields, rows) if fmt == "ndjson" else export.csv_chunk(rows)
+
+    return StreamingResponse(body(), media_type=export.MEDIA_TYPES[fmt], headers=headers)
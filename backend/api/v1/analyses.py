@@ -1,37 +1,44 @@
 # Файл: api/v1/analyses.py
 
-from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile, Form
-from sqlalchemy.orm import Session
-import os
-
-from database import get_db
+from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile, Form, Header, Query, Response
+from fastapi.responses import FileResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from PIL import Image
+import asyncio
+import io
+
+from database import get_async_db
 from crud import analysis_crud
+from models import sql_models
+from core import tasks, storage, pyramid, rle
 from core.security import get_current_user
+from core.pagination import page_params
 from models.pydantic_models import *
 
 router = APIRouter()
 
 # --- Конфигурация для сохранения файлов ---
-# В реальной жизни лучше использовать S3 или сетевое хранилище.
-UPLOAD_FOLDER = "data/uploads"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Файлы сохраняются в контентно-адресуемое хранилище (см. core/storage.py).
+UPLOAD_FOLDER = storage.UPLOAD_FOLDER
 
 
 @router.post(
     "/upload_analysis",
-    status_code=status.HTTP_201_CREATED,
+    status_code=status.HTTP_202_ACCEPTED,
     summary="Загрузка медицинского изображения и запуск CV анализа"
 )
 async def upload_file_and_run_cv(
         # File для загружаемого файла, Form для других полей
         file: UploadFile = File(...),
         patient_mrn: str = Form(...),
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: User = Depends(get_current_user)  # Защита маршрута
 ):
     """
     Позволяет Врачу-диагносту загрузить снимок и привязать его к пациенту.
-    Запускает автоматический анализ CV (заглушку).
+    Ставит автоматический анализ CV (заглушку) в фоновую очередь и сразу
+    возвращает ID анализа. Статус можно узнать через GET /{analysis_id}/status.
     """
 
     # 1. Проверка роли (только диагносты могут загружать)
@@ -41,13 +48,11 @@ async def upload_file_and_run_cv(
             detail="Доступно только для Врачей-диагностов."
         )
 
-    # 2. Сохранение файла на сервере
-    file_location = os.path.join(UPLOAD_FOLDER, file.filename)
+    # 2. Сохранение файла в хранилище (по SHA-256, без дублей; запись вне event loop)
     try:
-        # Чтение файла по частям и запись на диск
-        with open(file_location, "wb") as f:
-            while chunk := await file.read(1024 * 1024):  # Чтение по 1MB
-                f.write(chunk)
+        stored = await storage.save_upload(db, file)
+    except storage.UploadTooLargeError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -56,32 +61,124 @@ async def upload_file_and_run_cv(
     finally:
         await file.close()
 
-    # 3. Создание записи в БД и запуск CV (через CRUD)
+    # 3. Создание записи в БД и постановка задачи CV в очередь
+    return await create_analysis_from_upload(db, stored, patient_mrn, current_user)
+
+
+async def create_analysis_from_upload(db: AsyncSession, stored: storage.StoredUpload, patient_mrn: str, current_user: User):
+    """
+    Создает анализ для файла, уже сохраненного в хранилище, и будит воркер CV.
+    Общий шаг для обычной и возобновляемой (api/v1/uploads.py) загрузки.
+    """
     try:
-        new_analysis = analysis_crud.create_analysis_and_run_cv(
+        new_analysis = await analysis_crud.create_analysis_async(
             db=db,
             patient_mrn=patient_mrn,
             diagnostician_id=current_user.id,
-            image_path=file_location
+            image_path=stored.path,
+            image_digest=stored.digest,
+            image_size=stored.size
         )
-
-        return {
-            "message": "Файл успешно загружен и анализ запущен.",
-            "analysis_id": new_analysis.id,
-            "patient_mrn": patient_mrn,
-            "system_diagnosis": new_analysis.results.system_diagnosis  # Доступ к результатам
-        }
-
     except ValueError as e:
         # Если пациент не найден
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
     except Exception as e:
-        # Ошибка при работе с БД или CV
+        # Ошибка при работе с БД
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка обработки анализа: {e}"
         )
 
+    # Запрос не ждет инференса: задачу выполнит воркер
+    tasks.notify_new_jobs()
+
+    return {
+        "message": "Файл успешно загружен, анализ поставлен в очередь.",
+        "analysis_id": new_analysis.id,
+        "patient_mrn": patient_mrn,
+        "status": new_analysis.status,
+        "image_digest": stored.digest
+    }
+
+
+# --- Пакетная загрузка исследования (много файлов или ZIP-архив) ---
+@router.post(
+    "/bulk_upload",
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Пакетная загрузка снимков одного исследования (файлы или ZIP)"
+)
+async def bulk_upload_and_run_cv(
+        patient_mrn: str = Form(...),
+        files: list[UploadFile] = File(None),
+        archive: UploadFile = File(None),
+        db: AsyncSession = Depends(get_async_db),
+        current_user: User = Depends(get_current_user)
+):
+    """
+    Принимает несколько файлов (поле files) и/или один ZIP-архив (поле archive).
+    Архив распаковывается потоково, все анализы создаются одной транзакцией,
+    а задачи CV попадают в очередь вместе (и обрабатываются батчами).
+    """
+    if current_user.role != 'diagnostician':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Доступно только для Врачей-диагностов."
+        )
+    if not files and archive is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Не переданы файлы.")
+
+    # 1. Сохранение всех файлов в хранилище
+    try:
+        stored = await storage.save_uploads(db, files or [])
+        if archive is not None:
+            stored += await storage.save_archive(db, archive)
+    except storage.UploadTooLargeError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except storage.InvalidArchiveError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при сохранении файлов: {e}"
+        )
+    finally:
+        for upload in (files or []) + ([archive] if archive is not None else []):
+            await upload.close()
+
+    if not stored:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="В запросе нет файлов изображений.")
+
+    # 2. Все анализы — одной транзакцией
+    try:
+        new_analyses = await analysis_crud.create_analyses_bulk_async(
+            db=db,
+            patient_mrn=patient_mrn,
+            diagnostician_id=current_user.id,
+            images=[(item.path, item.digest, item.size) for item, _ in stored]
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка обработки анализов: {e}"
+        )
+
+    # 3. Будим воркер: задачи всего исследования будут захвачены одной порцией
+    tasks.notify_new_jobs()
+
+    return {
+        "message": f"Загружено файлов: {len(new_analyses)}, анализы поставлены в очередь.",
+        "patient_mrn": patient_mrn,
+        "analyses": [
+            {
+                "analysis_id": analysis.id,
+                "filename": filename,
+                "status": analysis.status,
+                "image_digest": analysis.image_digest
+            }
+            for analysis, (_, filename) in zip(new_analyses, stored)
+        ]
+    }
+
 
 # Файл: api/v1/analyses.py (Обновлен)
 
@@ -94,15 +191,17 @@ async def upload_file_and_run_cv(
 # --- 1. Требование: История анализов ---
 @router.get(
     "/my_history",
-    response_model=list[AnalysisFull],
+    response_model=AnalysisPage,
     summary="Просмотр истории анализов врача-диагноста"
 )
 async def get_my_analysis_history(
-        db: Session = Depends(get_db),
+        page: dict = Depends(page_params),
+        db: AsyncSession = Depends(get_async_db),
         current_user: User = Depends(get_current_user)
 ):
     """
-    Возвращает список всех анализов, проведенных текущим авторизованным диагностом.
+    Возвращает страницу анализов, проведенных текущим авторизованным диагностом
+    (новые сначала). Следующая страница — с параметром cursor=next_cursor.
     """
     if current_user.role not in ['diagnostician', 'admin']:
         raise HTTPException(
@@ -110,8 +209,8 @@ async def get_my_analysis_history(
             detail="Доступно только для Диагностов и Администраторов."
         )
 
-    analyses = analysis_crud.get_analyses_for_diagnostician(db, current_user.id)
-    return analyses
+    analyses, next_cursor = await analysis_crud.get_analyses_for_diagnostician_async(db, current_user.id, **page)
+    return {"items": analyses, "next_cursor": next_cursor}
 
 
 # --- 2. Требование: Просмотр одного анализа ---
@@ -122,14 +221,14 @@ async def get_my_analysis_history(
 )
 async def get_single_analysis(
         analysis_id: int,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: User = Depends(get_current_user)
 ):
     """
     Получает детали анализа, включая изображение, сегментацию и результаты CV.
     Проверка: доступ только для тех, кто проводил анализ, или администратора.
     """
-    analysis = analysis_crud.get_analysis_by_id(db, analysis_id)
+    analysis = await analysis_crud.get_analysis_by_id_async(db, analysis_id)
 
     if not analysis:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Анализ не найден.")
@@ -144,6 +243,54 @@ async def get_single_analysis(
     return analysis
 
 
+# --- Статус фоновой обработки анализа ---
+@router.get(
+    "/{analysis_id}/status",
+    response_model=AnalysisStatus,
+    summary="Получение статуса обработки анализа моделью CV"
+)
+async def get_analysis_status(
+        analysis_id: int,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: User = Depends(get_current_user)
+):
+    """
+    Возвращает статус обработки: queued / running / done / failed.
+    """
+    analysis = await analysis_crud.get_analysis_by_id_async(db, analysis_id)
+
+    if not analysis:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Анализ не найден.")
+
+    is_owner = analysis.diagnostician_id == current_user.id
+    is_admin_or_clinician = current_user.role in ['admin', 'clinician']
+
+    if not is_owner and not is_admin_or_clinician:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Нет доступа к данному анализу.")
+
+    return {
+        "analysis_id": analysis.id,
+        "status": analysis.status,
+        "error_message": analysis.error_message,
+        "system_diagnosis": analysis.results.system_diagnosis if analysis.results else None
+    }
+
+
+def ensure_results_ready(analysis) -> None:
+    """
+    409, если у анализа еще нет результатов CV: анализ в очереди или
+    обрабатывается (ответ на загрузку — 202 до завершения CV) либо
+    обработка завершилась ошибкой.
+    """
+    if analysis.results is not None:
+        return
+    if analysis.status == sql_models.ANALYSIS_STATUS_FAILED:
+        detail = f"Обработка анализа завершилась ошибкой: {analysis.error_message}"
+    else:
+        detail = "Результаты анализа еще не готовы."
+    raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=detail)
+
+
 # --- 3. Требование: Корректировка и подтверждение диагноза + Обратная связь ---
 @router.post(
     "/{analysis_id}/confirm",
@@ -153,7 +300,7 @@ async def get_single_analysis(
 async def confirm_diagnosis(
         analysis_id: int,
         data: ConclusionUpdate,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: User = Depends(get_current_user)
 ):
     """
@@ -163,7 +310,7 @@ async def confirm_diagnosis(
     if current_user.role != 'diagnostician':
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Доступно только для Диагностов.")
 
-    analysis = analysis_crud.get_analysis_by_id(db, analysis_id)
+    analysis = await analysis_crud.get_analysis_by_id_async(db, analysis_id)
 
     if not analysis:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Анализ не найден.")
@@ -172,14 +319,208 @@ async def confirm_diagnosis(
     if analysis.diagnostician_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Вы не являетесь автором этого анализа.")
 
+    ensure_results_ready(analysis)
+
     # Конвертируем bool в int для БД: True(корректно) -> 1, False(ошибочно) -> 0
     feedback_int = 1 if data.is_correct else 0
 
-    updated_analysis = analysis_crud.update_analysis_conclusion(
+    updated_analysis = await analysis_crud.update_analysis_conclusion_async(
         db=db,
         analysis_id=analysis_id,
         conclusion=data.conclusion,
         feedback=feedback_int
     )
 
-    return updated_analysis
\ No newline at end of file
+    return updated_analysis
+
+
+# --- Тайловый просмотр изображения (пирамида разрешений) ---
+# Тайлы и миниатюра неизменны для данного содержимого файла (адресуются по SHA-256),
+# поэтому браузер может кэшировать их без повторной проверки.
+TILE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+async def _get_accessible_analysis(db: AsyncSession, analysis_id: int, current_user: User,
+                                   with_segmentation: bool = False):
+    """Анализ, доступный текущему пользователю (автор, администратор или клиницист)."""
+    analysis = await analysis_crud.get_analysis_by_id_async(db, analysis_id, with_segmentation)
+
+    if not analysis:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Анализ не найден.")
+
+    is_owner = analysis.diagnostician_id == current_user.id
+    is_admin_or_clinician = current_user.role in ['admin', 'clinician']
+
+    if not is_owner and not is_admin_or_clinician:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Нет доступа к данному анализу.")
+
+    return analysis
+
+
+async def _get_pyramid_meta(analysis) -> dict:
+    """
+    Метаданные пирамиды. Обычно пирамида уже построена воркером после CV;
+    если нет (старый анализ или сбой), она строится здесь, вне event loop.
+    """
+    if not analysis.image_digest:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Для анализа нет тайлов.")
+
+    meta = pyramid.load_meta(analysis.image_digest)
+    if meta is not None:
+        return meta
+
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(
+            storage.get_io_pool(), pyramid.ensure_pyramid, analysis.image_path, analysis.image_digest
+        )
+    except pyramid.PyramidError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
+
+@router.get(
+    "/{analysis_id}/pyramid",
+    response_model=PyramidInfo,
+    summary="Уровни пирамиды изображения для тайлового просмотрщика"
+)
+async def get_analysis_pyramid(
+        analysis_id: int,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: User = Depends(get_current_user)
+):
+    analysis = await _get_accessible_analysis(db, analysis_id, current_user)
+    return await _get_pyramid_meta(analysis)
+
+
+@router.get(
+    "/{analysis_id}/thumbnail",
+    summary="Миниатюра изображения (не больше 256x256)"
+)
+async def get_analysis_thumbnail(
+        analysis_id: int,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: User = Depends(get_current_user)
+):
+    analysis = await _get_accessible_analysis(db, analysis_id, current_user)
+    await _get_pyramid_meta(analysis)
+    return FileResponse(
+        pyramid.thumbnail_path(analysis.image_digest),
+        media_type="image/png",
+        headers={"Cache-Control": TILE_CACHE_CONTROL}
+    )
+
+
+@router.get(
+    "/{analysis_id}/tiles/{level}/{x}/{y}",
+    summary="Тайл 256x256 изображения (PNG)",
+    responses={304: {"description": "Тайл не изменился (If-None-Match)"}}
+)
+async def get_analysis_tile(
+        analysis_id: int,
+        level: int,
+        x: int,
+        y: int,
+        if_none_match: Optional[str] = Header(None),
+        db: AsyncSession = Depends(get_async_db),
+        current_user: User = Depends(get_current_user)
+):
+    """
+    Возвращает тайл уровня level (0 — полное разрешение) в столбце x и строке y.
+    С диска читается только окно тайла (memory-mapped), полный снимок не декодируется.
+    """
+    analysis = await _get_accessible_analysis(db, analysis_id, current_user)
+    meta = await _get_pyramid_meta(analysis)
+
+    etag = pyramid.tile_etag(analysis.image_digest, level, x, y)
+    headers = {"ETag": etag, "Cache-Control": TILE_CACHE_CONTROL}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    loop = asyncio.get_running_loop()
+    try:
+        png = await loop.run_in_executor(
+            storage.get_io_pool(), pyramid.read_tile, analysis.image_digest, meta, level, x, y
+        )
+    except pyramid.TileNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+    return Response(content=png, media_type="image/png", headers=headers)
+
+
+# --- Маска сегментации: наложение и статистика областей (из RLE) ---
+OVERLAY_MAX_SIZE = 4096
+
+
+def _get_segmentation_rle(analysis) -> bytes:
+    if not analysis.results or not analysis.results.segmentation_rle:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Маска сегментации недоступна.")
+    return analysis.results.segmentation_rle
+
+
+# Декодирование RLE, отрисовка и кодирование PNG занимают процессор на время,
+# пропорциональное размеру маски, и выполняются в пуле ввода-вывода, как тайлы
+def _render_overlay_png(data: bytes, width: Optional[int], height: Optional[int]) -> bytes:
+    mask = rle.decode(data)
+    overlay = rle.render_overlay(mask, width or mask.width, height or mask.height)
+    buffer = io.BytesIO()
+    Image.fromarray(overlay).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _region_stats(data: bytes, limit: int) -> dict:
+    mask = rle.decode(data)
+    found = rle.regions(mask)
+    return {
+        "mask_width": mask.width,
+        "mask_height": mask.height,
+        "total_area": mask.area,
+        "coverage": round(mask.area / (mask.width * mask.height), 6) if mask.width * mask.height else 0.0,
+        "region_count": len(found),
+        "regions": found[:limit],
+    }
+
+
+@router.get(
+    "/{analysis_id}/segmentation/overlay",
+    summary="Наложение маски сегментации (PNG с прозрачностью) в заданном разрешении"
+)
+async def get_segmentation_overlay(
+        analysis_id: int,
+        width: Optional[int] = Query(None, ge=1, le=OVERLAY_MAX_SIZE),
+        height: Optional[int] = Query(None, ge=1, le=OVERLAY_MAX_SIZE),
+        db: AsyncSession = Depends(get_async_db),
+        current_user: User = Depends(get_current_user)
+):
+    """
+    Рисует маску поверх прозрачного фона в разрешении width x height
+    (по умолчанию — разрешение маски), чтобы клиент наложил ее на снимок
+    или миниатюру. Плотная маска в исходном разрешении не восстанавливается.
+    """
+    analysis = await _get_accessible_analysis(db, analysis_id, current_user, with_segmentation=True)
+    data = _get_segmentation_rle(analysis)
+
+    png = await asyncio.get_running_loop().run_in_executor(
+        storage.get_io_pool(), _render_overlay_png, data, width, height
+    )
+    return Response(content=png, media_type="image/png",
+                    headers={"Cache-Control": "private, max-age=3600"})
+
+
+@router.get(
+    "/{analysis_id}/segmentation/regions",
+    response_model=SegmentationRegions,
+    summary="Площадь, рамки и центры связных областей маски"
+)
+async def get_segmentation_regions(
+        analysis_id: int,
+        limit: int = Query(100, ge=1, le=10000),
+        db: AsyncSession = Depends(get_async_db),
+        current_user: User = Depends(get_current_user)
+):
+    """Статистика считается по отрезкам RLE (4-связность), координаты — в пикселях маски."""
+    analysis = await _get_accessible_analysis(db, analysis_id, current_user, with_segmentation=True)
+    data = _get_segmentation_rle(analysis)
+
+    return await asyncio.get_running_loop().run_in_executor(
+        storage.get_io_pool(), _region_stats, data, limit
+    )
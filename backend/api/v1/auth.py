@@ -2,13 +2,13 @@
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from datetime import timedelta
 
-from database import get_db
+from database import get_async_db
 from crud import user_crud
-from core import security
+from core import passwords, security
 from models import pydantic_models
 
 router = APIRouter()
@@ -19,18 +19,35 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="v1/auth/token")
 
 # --- Функция для получения JWT токена при входе ---
 @router.post("/token", response_model=pydantic_models.Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
     """
     Авторизация пользователя (логин и пароль) и выдача Access Token.
     """
-    user = user_crud.get_user_by_username(db, username=form_data.username)
-
-    if not user or not security.verify_password(form_data.password, user.hashed_password):
+    user = await user_crud.get_user_by_username_async(db, username=form_data.username)
+
+    verified, new_hash = False, None
+    if user:
+        # Соединение с БД возвращается в пул: вход может ждать своей очереди
+        # на bcrypt, и занятые соединения остановили бы остальные запросы
+        await db.commit()
+        # bcrypt выполняется в пуле потоков и не блокирует остальные запросы
+        try:
+            verified, new_hash = await passwords.verify_password_async(form_data.password, user.hashed_password)
+        except passwords.PasswordHashBusyError as e:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e),
+                                headers={"Retry-After": "1"})
+
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверное имя пользователя или пароль",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if not user.is_active:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Учетная запись отключена.")
+    if new_hash:
+        # Хеш создан с прежней стоимостью bcrypt — сохраняем пересчитанный
+        await user_crud.update_user_password_hash_async(db, user.id, new_hash)
 
     # Создание токена
     access_token_expires = timedelta(minutes=security.ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -56,13 +73,13 @@ async def read_users_me(
 
 # Добавляем роутер с помощью @router.post
 @router.post("/register", response_model=pydantic_models.User, status_code=status.HTTP_201_CREATED)
-async def register_new_user(user_data: pydantic_models.UserCreate, db: Session = Depends(get_db)):
+async def register_new_user(user_data: pydantic_models.UserCreate, db: AsyncSession = Depends(get_async_db)):
     """
     Регистрация нового пользователя.
     Пользователям по умолчанию присваивается роль 'diagnostician'.
     """
     # 1. Проверка на существование пользователя
-    db_user = user_crud.get_user_by_username(db, username=user_data.username)
+    db_user = await user_crud.get_user_by_username_async(db, username=user_data.username)
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -73,6 +90,10 @@ async def register_new_user(user_data: pydantic_models.UserCreate, db: Session =
     user_data.role = 'diagnostician'  # Принудительно устанавливаем роль
 
     # 3. Создание пользователя (CRUD уже содержит логику хеширования и усечения пароля)
-    new_user = user_crud.create_user(db, user=user_data)
+    try:
+        new_user = await user_crud.create_user_async(db, user=user_data)
+    except passwords.PasswordHashBusyError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e),
+                            headers={"Retry-After": "1"})
 
     return new_user
\ No newline at end of file
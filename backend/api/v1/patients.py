@@ -1,29 +1,69 @@
 # Файл: api/v1/patients.py (НОВЫЙ ФАЙЛ)
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status, Header, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from models import pydantic_models
-from crud import analysis_crud
+from crud import analysis_crud, patient_crud
+from core import history_cache
 from core.security import get_current_user
-from database import get_db
+from api.v1.analyses import ensure_results_ready
+from core.pagination import page_params
+from database import get_async_db
 
 router = APIRouter(prefix="/v1/patients", tags=["Клиницист / Управление Пациентами"])
 
+# Браузер хранит ответ, но перед показом сверяет его ETag (ответ 304 без тела)
+HISTORY_CACHE_CONTROL = "private, no-cache"
+
 
 # --- 1. Требование: Поиск и История ЭМК ---
+@router.get(
+    "/search",
+    response_model=list[pydantic_models.PatientSearchHit],
+    summary="Поиск пациентов по началу MRN, фамилии или имени (подсказки при вводе)"
+)
+async def search_patients(
+        q: str = Query(..., min_length=1, max_length=100, description="Начало MRN, фамилии и/или имени"),
+        limit: int = Query(patient_crud.SEARCH_LIMIT_DEFAULT, ge=1, le=patient_crud.SEARCH_LIMIT_MAX),
+        db: AsyncSession = Depends(get_async_db),
+        current_user: pydantic_models.User = Depends(get_current_user)
+):
+    """
+    Каждое слово запроса должно быть началом слова в MRN, фамилии или имени
+    ("иван пет" найдет "Иванов Петр"). Первыми идут пациенты, чей MRN
+    начинается с запроса, затем — точная фамилия, начало фамилии, начало
+    имени, прочее (цифры MRN).
+    """
+    if current_user.role not in ['clinician', 'admin']:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Доступно только для Клиницистов и Администраторов."
+        )
+    return await patient_crud.search_patients_async(db, q, limit)
+
+
 @router.get(
     "/{medical_record_number}/history",
     response_model=pydantic_models.PatientHistory,
-    summary="Получение полной истории анализов пациента по MRN"
+    summary="Получение полной истории анализов пациента по MRN",
+    responses={304: {"description": "История не изменилась (If-None-Match)"}}
 )
 async def get_patient_emr_history(
         medical_record_number: str,
-        db: Session = Depends(get_db),
+        page: dict = Depends(page_params),
+        if_none_match: Optional[str] = Header(None),
+        db: AsyncSession = Depends(get_async_db),
         current_user: pydantic_models.User = Depends(get_current_user)
 ):
     """
     Клиницист/Администратор просматривает все проведенные анализы
-    и заключения для конкретного пациента по его MRN.
+    и заключения для конкретного пациента по его MRN (постранично, новые сначала).
+
+    ETag — MRN, версия истории пациента и параметры страницы. Повторный просмотр
+    без изменений стоит одного запроса версии по индексу MRN: 304, если
+    у клиента та же версия, иначе готовый ответ из кэша процесса.
     """
     if current_user.role not in ['clinician', 'admin']:
         raise HTTPException(
@@ -31,13 +71,29 @@ async def get_patient_emr_history(
             detail="Доступно только для Клиницистов и Администраторов."
         )
 
-    patient_data = analysis_crud.get_patient_history_by_mrn(db, medical_record_number)
+    not_found = HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                              detail=f"Пациент с MRN: {medical_record_number} не найден.")
+
+    version = await analysis_crud.get_patient_history_version_async(db, medical_record_number)
+    if version is None:
+        raise not_found
+
+    key = history_cache.make_key(medical_record_number, version, page)
+    headers = {"ETag": history_cache.make_etag(key), "Cache-Control": HISTORY_CACHE_CONTROL}
+    if if_none_match and headers["ETag"] in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
 
-    if not patient_data:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                            detail=f"Пациент с MRN: {medical_record_number} не найден.")
+    cache = history_cache.get_cache()
+    body = cache.get(key)
+    if body is None:
+        # Версия прочитана раньше анализов: ответ под ключом версии не старше нее
+        patient_data = await analysis_crud.get_patient_history_by_mrn_async(db, medical_record_number, **page)
+        if not patient_data:
+            raise not_found
+        body = pydantic_models.PatientHistory.model_validate(patient_data, from_attributes=True).model_dump_json().encode()
+        cache.put(key, body)
 
-    return patient_data
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 # --- 2. Требование: Назначение Лечения ---
@@ -49,7 +105,7 @@ async def get_patient_emr_history(
 async def prescribe_treatment(
         analysis_id: int,
         data: pydantic_models.TreatmentUpdate,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: pydantic_models.User = Depends(get_current_user)
 ):
     """
@@ -61,7 +117,12 @@ async def prescribe_treatment(
             detail="Доступно только для Клиницистов."
         )
 
-    updated_analysis = analysis_crud.update_analysis_treatment_plan(
+    analysis = await analysis_crud.get_analysis_by_id_async(db, analysis_id)
+    if not analysis:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Анализ не найден.")
+    ensure_results_ready(analysis)
+
+    updated_analysis = await analysis_crud.update_analysis_treatment_plan_async(
         db=db,
         analysis_id=analysis_id,
         treatment_plan=data.treatment_plan,
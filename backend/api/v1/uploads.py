@@ -0,0 +1,233 @@
+# Файл: api/v1/uploads.py
+
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from api.v1.analyses import create_analysis_from_upload
+from core import storage
+from core.security import get_current_user
+from crud import upload_crud
+from database import get_async_db, run_write
+from models import pydantic_models, sql_models
+
+router = APIRouter(prefix="/v1/uploads", tags=["Возобновляемая загрузка"])
+
+# Максимальный размер одного блока (тело одного PUT-запроса)
+UPLOAD_MAX_CHUNK_SIZE = int(os.environ.get("UPLOAD_MAX_CHUNK_SIZE", str(64 * 1024 * 1024)))
+# Через сколько часов незавершенная сессия удаляется
+UPLOAD_SESSION_TTL_HOURS = int(os.environ.get("UPLOAD_SESSION_TTL_HOURS", "24"))
+
+
+# --- Хелперы ---
+def get_diagnostician(current_user: pydantic_models.User = Depends(get_current_user)):
+    if current_user.role != 'diagnostician':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Доступно только для Врачей-диагностов."
+        )
+    return current_user
+
+
+async def _get_own_session(db: AsyncSession, session_id: str, current_user: pydantic_models.User,
+                           require_open: bool = True):
+    db_session = await db.run_sync(upload_crud.get_upload_session, session_id)
+    if not db_session or db_session.owner_id != current_user.id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Сессия загрузки не найдена.")
+    if require_open and db_session.status != sql_models.UPLOAD_STATUS_OPEN:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Сессия загрузки уже завершена.")
+    return db_session
+
+
+def _session_status(db: Session, db_session: sql_models.UploadSession) -> dict:
+    """Вызывается через AsyncSession.run_sync (несколько запросов upload_crud)."""
+    received = upload_crud.get_received_chunks(db, db_session.id)
+    return {
+        "id": db_session.id,
+        "patient_mrn": db_session.patient_mrn,
+        "filename": db_session.filename,
+        "total_size": db_session.total_size,
+        "chunk_size": db_session.chunk_size,
+        "chunk_count": upload_crud.chunk_count(db_session),
+        "received_chunks": received,
+        "received_bytes": sum(upload_crud.expected_chunk_size(db_session, i) for i in received),
+        "status": db_session.status,
+        "analysis_id": db_session.analysis_id,
+    }
+
+
+async def _cleanup_expired_sessions(db: AsyncSession) -> None:
+    for db_session in await db.run_sync(upload_crud.get_expired_upload_sessions, UPLOAD_SESSION_TTL_HOURS):
+        await storage.delete_session_file(db_session.id)
+        await run_write(db, upload_crud.delete_upload_session, db_session)
+
+
+# --- 1. Создание сессии ---
+@router.post(
+    "",
+    response_model=pydantic_models.UploadSessionStatus,
+    status_code=status.HTTP_201_CREATED,
+    summary="Создать сессию возобновляемой загрузки"
+)
+async def create_upload_session(
+        data: pydantic_models.UploadSessionCreate,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: pydantic_models.User = Depends(get_diagnostician)
+):
+    """
+    Клиент заранее сообщает размер файла и блока, затем загружает блоки
+    (в любом порядке и параллельно) через PUT /{session_id}/chunks/{index}.
+    """
+    if data.total_size <= 0 or data.total_size > storage.MAX_UPLOAD_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Размер файла должен быть от 1 до {storage.MAX_UPLOAD_SIZE} байт."
+        )
+    if data.chunk_size <= 0 or data.chunk_size > UPLOAD_MAX_CHUNK_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Размер блока должен быть от 1 до {UPLOAD_MAX_CHUNK_SIZE} байт."
+        )
+
+    await _cleanup_expired_sessions(db)
+
+    db_session = await run_write(
+        db, upload_crud.create_upload_session,
+        owner_id=current_user.id,
+        patient_mrn=data.patient_mrn,
+        filename=data.filename,
+        total_size=data.total_size,
+        chunk_size=data.chunk_size
+    )
+    await storage.create_session_file(db_session.id, db_session.total_size)
+    return await db.run_sync(_session_status, db_session)
+
+
+# --- 2. Загрузка блока ---
+@router.put(
+    "/{session_id}/chunks/{chunk_index}",
+    response_model=pydantic_models.UploadSessionStatus,
+    summary="Загрузить блок файла (тело запроса — сырые байты блока)"
+)
+async def upload_chunk(
+        session_id: str,
+        chunk_index: int,
+        request: Request,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: pydantic_models.User = Depends(get_diagnostician)
+):
+    """
+    Блок пишется сразу в нужное место собираемого файла, без буферизации
+    в памяти. Повторная загрузка того же блока перезаписывает его.
+    """
+    db_session = await _get_own_session(db, session_id, current_user)
+
+    if chunk_index < 0 or chunk_index >= upload_crud.chunk_count(db_session):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Недопустимый номер блока.")
+
+    expected = upload_crud.expected_chunk_size(db_session, chunk_index)
+    try:
+        # Пока блок пишется и записывается в БД, /complete не начнет хешировать файл
+        async with storage.lock_session_file(session_id) as fd:
+            written = await storage.write_session_chunk(
+                fd, chunk_index * db_session.chunk_size, request.stream(), expected
+            )
+            if written != expected:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Получено {written} байт, ожидалось {expected}. Повторите загрузку блока."
+                )
+            if not await run_write(db, upload_crud.record_chunk, session_id, chunk_index, written):
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Сессия загрузки уже завершена.")
+    except storage.SessionFileLockError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except storage.UploadTooLargeError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+
+    return await db.run_sync(_session_status, db_session)
+
+
+# --- 3. Прогресс ---
+@router.get(
+    "/{session_id}",
+    response_model=pydantic_models.UploadSessionStatus,
+    summary="Прогресс загрузки: какие блоки уже получены"
+)
+async def get_upload_session_status(
+        session_id: str,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: pydantic_models.User = Depends(get_diagnostician)
+):
+    db_session = await _get_own_session(db, session_id, current_user, require_open=False)
+    return await db.run_sync(_session_status, db_session)
+
+
+# --- 4. Завершение: сборка файла и запуск анализа ---
+@router.post(
+    "/{session_id}/complete",
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Завершить загрузку и поставить анализ CV в очередь"
+)
+async def complete_upload_session(
+        session_id: str,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: pydantic_models.User = Depends(get_diagnostician)
+):
+    """
+    Проверяет, что получены все блоки, переносит собранный файл в хранилище
+    и создает анализ так же, как POST /v1/analyses/upload_analysis.
+    """
+    db_session = await _get_own_session(db, session_id, current_user)
+
+    received = await db.run_sync(upload_crud.get_received_chunks, session_id)
+    missing = sorted(set(range(upload_crud.chunk_count(db_session))) - set(received))
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Не получены блоки: {missing[:20]}{' ...' if len(missing) > 20 else ''}"
+        )
+
+    # Блоки не пишутся, пока файл хешируется и переносится в хранилище: запись
+    # блока держит разделяемую блокировку файла сессии, завершение — исключительную
+    try:
+        async with storage.lock_session_file(session_id, exclusive=True):
+            # Сессию завершает только один запрос: параллельный /complete получит 409
+            if not await run_write(db, upload_crud.claim_upload_session, session_id):
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Сессия загрузки уже завершается.")
+            try:
+                stored = await storage.finalize_session_file(db, session_id)
+            except Exception:
+                # Собранный файл на месте: завершение можно повторить
+                await db.rollback()
+                await run_write(db, upload_crud.release_upload_session, session_id)
+                raise
+    except storage.SessionFileLockError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+    try:
+        response = await create_analysis_from_upload(db, stored, db_session.patient_mrn, current_user)
+    except Exception:
+        # Файл уже перенесен в хранилище: сессию не восстановить
+        await db.rollback()
+        await run_write(db, upload_crud.delete_upload_session, db_session)
+        raise
+    await run_write(db, upload_crud.complete_upload_session, db_session, response["analysis_id"])
+    return response
+
+
+# --- 5. Отмена ---
+@router.delete(
+    "/{session_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    summary="Отменить сессию загрузки"
+)
+async def abort_upload_session(
+        session_id: str,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: pydantic_models.User = Depends(get_diagnostician)
+):
+    db_session = await _get_own_session(db, session_id, current_user)
+    await storage.delete_session_file(session_id)
+    await run_write(db, upload_crud.delete_upload_session, db_session)
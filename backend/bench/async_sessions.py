@@ -0,0 +1,232 @@
+# Файл: bench/async_sessions.py
+#
+# Нагрузочный тест: синхронная Session внутри async-обработчиков (каждый
+# запрос к БД блокирует event loop) против AsyncSession (aiosqlite).
+# Сервер uvicorn запускается отдельным процессом с двумя наборами
+# одинаковых маршрутов — /sync/... и /async/..., клиент шлет смесь:
+#     история диагноста (страница)   80%
+#     подтверждение заключения       20%
+# Параллельно внешний писатель (как воркер CV в отдельном процессе)
+# периодически держит блокировку записи SQLite: подтверждение ждет ее
+# освобождения (busy_timeout). С синхронной сессией это ожидание
+# останавливает event loop и все остальные запросы, с AsyncSession ждет
+# только сам запрос на запись.
+#
+# Запуск (из каталога backend):
+#     python -m bench.async_sessions --concurrency 32 --seconds 10
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+import numpy as np
+from fastapi import Depends, FastAPI
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+
+import migrations
+from crud import analysis_crud
+from database import make_async_engine, make_engine
+from models import sql_models
+
+SEED_ANALYSES = 100_000
+DIAGNOSTICIANS = 50
+MIX = [("history", 0.8), ("confirm", 0.2)]
+REQUEST_TIMEOUT = 10.0  # Ответ дольше — ошибка (зависание сервера)
+
+
+# --- Сервер ---
+def create_app(db_path: str) -> FastAPI:
+    SyncSessionLocal = sessionmaker(autoflush=False, bind=make_engine(f"sqlite:///{db_path}"))
+    AsyncSessionLocal = async_sessionmaker(make_async_engine(f"sqlite+aiosqlite:///{db_path}"),
+                                           autoflush=False, expire_on_commit=False)
+
+    def get_sync_db():
+        db = SyncSessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def get_async_db():
+        async with AsyncSessionLocal() as db:
+            yield db
+
+    app = FastAPI()
+
+    # Прежний вариант: async def + синхронная сессия
+    @app.get("/sync/history/{user_id}")
+    async def sync_history(user_id: int, db: Session = Depends(get_sync_db)):
+        analyses, _ = analysis_crud.get_analyses_for_diagnostician(db, user_id, limit=50)
+        return len(analyses)
+
+    @app.post("/sync/confirm/{analysis_id}")
+    async def sync_confirm(analysis_id: int, db: Session = Depends(get_sync_db)):
+        analysis_crud.update_analysis_conclusion(db, analysis_id, "ok", 1)
+        return analysis_id
+
+
+    # Новый вариант: AsyncSession
+    @app.get("/async/history/{user_id}")
+    async def async_history(user_id: int, db: AsyncSession = Depends(get_async_db)):
+        analyses, _ = await analysis_crud.get_analyses_for_diagnostician_async(db, user_id, limit=50)
+        return len(analyses)
+
+    @app.post("/async/confirm/{analysis_id}")
+    async def async_confirm(analysis_id: int, db: AsyncSession = Depends(get_async_db)):
+        await analysis_crud.update_analysis_conclusion_async(db, analysis_id, "ok", 1)
+        return analysis_id
+
+    return app
+
+
+def seed(db_path: str) -> None:
+    engine = make_engine(f"sqlite:///{db_path}")
+    migrations.upgrade(engine)
+    with engine.begin() as conn:
+        conn.execute(sql_models.User.__table__.insert(), [
+            {"id": i, "username": f"bench{i}", "role": "diagnostician"} for i in range(1, DIAGNOSTICIANS + 1)
+        ])
+        conn.execute(sql_models.Patient.__table__.insert(), [{"id": 1, "medical_record_number": "BENCH"}])
+        conn.execute(sql_models.Analysis.__table__.insert(), [
+            {"id": i, "patient_id": 1, "diagnostician_id": i % DIAGNOSTICIANS + 1, "image_path": f"{i}.png",
+             "status": sql_models.ANALYSIS_STATUS_DONE}
+            for i in range(1, SEED_ANALYSES + 1)
+        ])
+        conn.execute(sql_models.Result.__table__.insert(), [
+            {"analysis_id": i, "system_diagnosis": f"bench-{i % 7}", "model_version": "bench"}
+            for i in range(1, SEED_ANALYSES + 1)
+        ])
+    engine.dispose()
+
+
+# --- Клиент ---
+async def load(base_url: str, mode: str, concurrency: int, seconds: float) -> dict:
+    latencies = {name: [] for name, _ in MIX}
+    errors = 0
+    names, weights = zip(*MIX)
+    stop = time.monotonic() + seconds
+
+    async def client(index: int, http: httpx.AsyncClient):
+        nonlocal errors
+        rng = random.Random(index)
+        while time.monotonic() < stop:
+            name = rng.choices(names, weights)[0]
+            if name == "history":
+                request = http.get(f"/{mode}/history/{rng.randint(1, DIAGNOSTICIANS)}")
+            else:
+                request = http.post(f"/{mode}/confirm/{rng.randint(1, SEED_ANALYSES)}")
+            started = time.perf_counter()
+            try:
+                response = await request
+            except httpx.TimeoutException:
+                errors += 1
+                continue
+            if response.status_code != 200:
+                errors += 1
+                continue
+            latencies[name].append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=REQUEST_TIMEOUT) as http:
+        await asyncio.gather(*(client(i, http) for i in range(concurrency)))
+
+    return {"latencies": latencies, "errors": errors, "seconds": seconds}
+
+
+def external_writer(db_path: str, hold_ms: float, period_ms: float, stop: threading.Event) -> None:
+    """Раз в period_ms захватывает блокировку записи и держит ее hold_ms."""
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+    while not stop.wait(max(0.0, period_ms - hold_ms) / 1000):
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("UPDATE patients SET first_name = 'bench' WHERE id = 1")
+        time.sleep(hold_ms / 1000)
+        conn.execute("COMMIT")
+    conn.close()
+
+
+def report(mode: str, result: dict) -> None:
+    every = [value for values in result["latencies"].values() for value in values]
+    total = len(every)
+    parts = [f"все p50={np.percentile(every, 50) * 1000:6.1f} p99={np.percentile(every, 99) * 1000:7.1f}"] if every else []
+    for name, values in result["latencies"].items():
+        if values:
+            p50, p99 = np.percentile(values, [50, 99]) * 1000
+            parts.append(f"{name} p50={p50:6.1f} p99={p99:7.1f}")
+    print(f"{mode:<6} {total / result['seconds']:7.0f} запр/с   {'   '.join(parts)}   ошибок: {result['errors']}")
+
+
+def wait_ready(base_url: str, server: subprocess.Popen) -> None:
+    for _ in range(200):
+        if server.poll() is not None:
+            raise RuntimeError("Сервер завершился при запуске.")
+        try:
+            httpx.get(base_url + "/docs", timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise RuntimeError("Сервер не запустился.")
+
+
+def run_mode(db_path: str, mode: str, args) -> dict:
+    """
+    Отдельный процесс сервера на каждый вариант: зависание синхронного
+    варианта (исчерпан пул соединений) не влияет на измерение второго.
+    """
+    server = subprocess.Popen([sys.executable, "-m", "bench.async_sessions",
+                               "--serve", db_path, "--port", str(args.port)],
+                              stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{args.port}"
+    stop = threading.Event()
+    writer = threading.Thread(target=external_writer, daemon=True,
+                              args=(db_path, args.writer_hold_ms, args.writer_period_ms, stop))
+    try:
+        wait_ready(base_url, server)
+        if args.writer_period_ms > 0:
+            writer.start()
+        return asyncio.run(load(base_url, mode, args.concurrency, args.seconds))
+    finally:
+        stop.set()
+        if writer.is_alive():
+            writer.join()
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="p50/p99 обработчиков: синхронная Session против AsyncSession")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--writer-hold-ms", type=float, default=50.0, help="Сколько внешний писатель держит блокировку")
+    parser.add_argument("--writer-period-ms", type=float, default=250.0, help="Как часто (0 — без внешнего писателя)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--serve", default=None, help=argparse.SUPPRESS)  # Путь к БД: режим сервера
+    args = parser.parse_args()
+
+    if args.serve:
+        import uvicorn
+        uvicorn.run(create_app(args.serve), host="127.0.0.1", port=args.port, log_level="warning")
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "bench.db")
+        print(f"Наполнение БД: {SEED_ANALYSES} анализов...")
+        seed(db_path)
+
+        print(f"Клиентов: {args.concurrency}, длительность: {args.seconds} с, внешний писатель: "
+              f"{args.writer_hold_ms:g} мс из каждых {args.writer_period_ms:g} мс; задержки в мс")
+        for mode in ("sync", "async"):
+            report(mode, run_mode(db_path, mode, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# Файл: bench/auth_cache.py
+#
+# Бенчмарк проверки пользователя (core/security.get_current_user): время
+# на запрос с кэшем авторизованных пользователей (core/user_cache.py) и
+# без него (каждый запрос читает пользователя из БД). Сессия AsyncSession
+# открывается на каждый вызов, как в обработчиках API.
+#
+# Запуск (из каталога backend):
+#     python -m bench.auth_cache --users 1000 --requests 20000
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import migrations
+from crud import user_crud  # noqa: F401 — до core.security (взаимный импорт)
+from core import security, user_cache
+from database import make_async_engine, make_engine
+from models import sql_models
+
+
+def seed(db_path: str, users: int) -> None:
+    engine = make_engine(f"sqlite:///{db_path}")
+    migrations.upgrade(engine)
+    with engine.begin() as conn:
+        conn.execute(sql_models.User.__table__.insert(), [
+            {"id": i, "username": f"bench{i}", "role": "diagnostician", "is_active": True}
+            for i in range(1, users + 1)
+        ])
+    engine.dispose()
+
+
+async def measure(db_path: str, users: int, requests: int, cache: user_cache.UserCache) -> np.ndarray:
+    engine = make_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    SessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+    tokens = [security.create_access_token({"sub": str(i)}) for i in range(1, users + 1)]
+    rng = random.Random(0)
+    user_cache._cache = cache  # Подменяем кэш процесса на время замера
+    latencies = []
+    try:
+        for _ in range(requests):
+            token = rng.choice(tokens)
+            started = time.perf_counter()
+            async with SessionLocal() as db:
+                await security.get_current_user(db=db, token=token)
+            latencies.append(time.perf_counter() - started)
+    finally:
+        user_cache._cache = None
+        await engine.dispose()
+    return np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Стоимость get_current_user с кэшем пользователей и без")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "bench.db")
+        seed(db_path, args.users)
+        print(f"Пользователей: {args.users}, запросов: {args.requests}; задержки в мкс")
+        variants = [
+            ("без кэша", user_cache.UserCache(ttl=0)),
+            ("кэш", user_cache.UserCache()),
+        ]
+        for name, cache in variants:
+            latencies = asyncio.run(measure(db_path, args.users, args.requests, cache)) * 1e6
+            p50, p99 = np.percentile(latencies, [50, 99])
+            stats = cache.stats()
+            print(f"{name:<9} среднее={latencies.mean():7.0f} p50={p50:7.0f} p99={p99:7.0f}   "
+                  f"попаданий: {stats['hit_rate']:.1%}")
+
+
+if __name__ == "__main__":
+    main()
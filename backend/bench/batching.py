@@ -0,0 +1,72 @@
+# Файл: bench/batching.py
+#
+# Бенчмарк движка микро-батчинга: пропускная способность и задержки
+# для разных максимальных размеров батча.
+#
+# Запуск (из каталога backend):
+#     python -m bench.batching --requests 2048 --concurrency 64
+
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from core.inference import BatchingEngine, load_model
+
+
+def run_one(batch_size: int, image_paths: list, n_requests: int, concurrency: int, max_wait_ms: float) -> dict:
+    engine = BatchingEngine(load_model(), max_batch_size=batch_size, max_wait_ms=max_wait_ms)
+    engine.start()
+    latencies = []
+
+    def call(i: int):
+        started = time.perf_counter()
+        engine.infer(image_paths[i % len(image_paths)])
+        latencies.append(time.perf_counter() - started)
+
+    # Прогрев
+    engine.infer(image_paths[0])
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(call, range(n_requests)))
+    elapsed = time.perf_counter() - started
+    engine.stop()
+
+    lat_ms = np.array(latencies) * 1000
+    return {
+        "batch_size": batch_size,
+        "throughput_rps": n_requests / elapsed,
+        "p50_ms": float(np.percentile(lat_ms, 50)),
+        "p95_ms": float(np.percentile(lat_ms, 95)),
+        "p99_ms": float(np.percentile(lat_ms, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк микро-батчинга CV")
+    parser.add_argument("--requests", type=int, default=2048)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--batch-sizes", type=str, default="1,4,16,64")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        image_paths = []
+        rng = np.random.default_rng(0)
+        for i in range(32):
+            path = os.path.join(tmp, f"image_{i}.png")
+            rng.integers(0, 256, 512 * 1024, dtype=np.uint8).tofile(path)
+            image_paths.append(path)
+
+        print(f"{'batch':>6} {'req/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for batch_size in (int(b) for b in args.batch_sizes.split(",")):
+            r = run_one(batch_size, image_paths, args.requests, args.concurrency, args.max_wait_ms)
+            print(f"{r['batch_size']:>6} {r['throughput_rps']:>10.1f} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
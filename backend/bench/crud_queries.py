@@ -0,0 +1,474 @@
+# Файл: bench/crud_queries.py
+#
+# Микробенчмарки функций crud/analysis_crud.py и crud/user_crud.py на
+# синтетических данных в объемах рабочей системы (bench/synthetic.py).
+# Аргументы подбираются по перекосу данных: самый активный пациент и
+# диагност («тяжелый»), медианный, случайные id; глубокие страницы — по
+# курсору из середины истории. Для каждого вызова — p50/p99 и план каждого
+# его запроса (EXPLAIN QUERY PLAN, core/query_plan.py).
+#
+# Записи выполняются внутри внешней транзакции, которая откатывается в
+# конце (commit функций CRUD становится точкой сохранения): БД с данными
+# не меняется и переиспользуется между запусками.
+#
+# --save сохраняет результат в JSON, --baseline сравнивает с ним: регрессия —
+# p50 хуже больше чем на --threshold, изменившийся план запроса или новая
+# проблема плана (полное чтение таблицы, сортировка без индекса); код выхода 1.
+#
+# Запуск (из каталога backend):
+#     python -m bench.synthetic --db data/synthetic.db          # один раз: 10M анализов
+#     python -m bench.crud_queries --db data/synthetic.db --save bench/baselines/crud_queries.json
+#     python -m bench.crud_queries --db data/synthetic.db --baseline bench/baselines/crud_queries.json
+# Без --db данные генерируются во временную БД (--analyses и др.).
+
+import argparse
+import asyncio
+import datetime
+import inspect
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import migrations
+from bench import synthetic
+from crud import analysis_crud, user_crud
+from core import inference, query_plan
+from core.pagination import decode_cursor, encode_cursor
+from database import make_async_engine, make_engine
+from models import pydantic_models
+
+# Функции, которые измеряются через другие (обертки и общие шаги)
+COVERED_BY = {
+    "paginate_analyses": "get_all_analyses, get_analyses_for_diagnostician",
+    "paginate_analyses_async": "get_all_analyses_async",
+    "create_analysis_async": "create_analysis (run_write)",
+    "create_analyses_bulk_async": "create_analyses_bulk (run_write)",
+    "update_analysis_conclusion_async": "update_analysis_conclusion (run_write)",
+    "update_analysis_treatment_plan_async": "update_analysis_treatment_plan (run_write)",
+    "create_user_async": "create_user",
+    "update_user_role_async": "update_user_role (run_write)",
+    "update_user_password_hash_async": "update_user_password_hash (run_write)",
+    "set_user_active_async": "set_user_active (run_write)",
+}
+# Команды без плана (управление транзакцией)
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+class Case:
+    """
+    Один измеряемый вызов: fn(db, *args), args — из make_args(db, rng)
+    (вне замера). repeat — сколько раз выполнить, если не кончится время.
+    """
+
+    def __init__(self, name: str, fn, make_args=lambda db, rng: (), repeat: int = None, is_async: bool = False):
+        self.name = name
+        self.fn = fn
+        self.make_args = make_args
+        self.repeat = repeat
+        self.is_async = is_async
+
+    @property
+    def function(self) -> str:
+        return self.name.split(" ")[0]
+
+
+# --- Аргументы по распределению данных ---
+class Sample:
+    """Характерные пациенты, диагносты и курсоры синтетической БД."""
+
+    def __init__(self, db: Session, image_path: str):
+        self.image_path = image_path
+        self.max_patient = db.execute(text("SELECT max(id) FROM patients")).scalar()
+        self.max_analysis = db.execute(text("SELECT max(id) FROM analyses")).scalar()
+        self.heavy_patient, self.median_patient = self._heavy_and_median(db, "patient_id")
+        self.heavy_diagnostician, self.median_diagnostician = self._heavy_and_median(db, "diagnostician_id")
+        self.heavy_mrn, self.median_mrn = (
+            db.execute(text("SELECT medical_record_number FROM patients WHERE id = :id"), {"id": i}).scalar()
+            for i in (self.heavy_patient, self.median_patient)
+        )
+        self.users = [row[0] for row in db.execute(text("SELECT id FROM users ORDER BY id"))]
+        self.usernames = [row[0] for row in db.execute(text("SELECT username FROM users ORDER BY id"))]
+        self.diagnosticians = [row[0] for row in db.execute(
+            text("SELECT id FROM users WHERE role = 'diagnostician' ORDER BY id"))]
+        self.last_date = db.execute(text("SELECT max(date_of_analysis) FROM analyses")).scalar()
+        self.last_date = datetime.datetime.fromisoformat(self.last_date)
+        # Курсоры из середины истории: страница на глубине половины списка
+        self.cursor_all = self._middle_cursor(db, "1 = 1", {})
+        self.cursor_patient = self._middle_cursor(db, "patient_id = :id", {"id": self.heavy_patient})
+        self.cursor_diagnostician = self._middle_cursor(db, "diagnostician_id = :id", {"id": self.heavy_diagnostician})
+
+    @staticmethod
+    def _heavy_and_median(db: Session, column: str):
+        counts = db.execute(text(
+            f"SELECT {column}, count(*) AS c FROM analyses GROUP BY {column} ORDER BY c DESC, {column}"
+        )).all()
+        return counts[0][0], counts[len(counts) // 2][0]
+
+    @staticmethod
+    def _middle_cursor(db: Session, condition: str, params: dict):
+        count = db.execute(text(f"SELECT count(*) FROM analyses WHERE {condition}"), params).scalar()
+        date, analysis_id = db.execute(text(
+            f"SELECT date_of_analysis, id FROM analyses WHERE {condition} "
+            f"ORDER BY date_of_analysis DESC, id DESC LIMIT 1 OFFSET :offset"
+        ), {**params, "offset": count // 2}).one()
+        return decode_cursor(encode_cursor(datetime.datetime.fromisoformat(date), analysis_id))
+
+    def random_patient_mrn(self, rng) -> str:
+        return f"MRN-{rng.randint(1, self.max_patient):07d}"
+
+    def random_analysis(self, rng) -> int:
+        return rng.randint(1, self.max_analysis)
+
+
+def _new_analysis(db, sample: Sample, rng) -> tuple:
+    """Анализ без результата (аргумент run_cv_for_analysis, создается вне замера)."""
+    analysis = analysis_crud.create_analysis(db, sample.random_patient_mrn(rng), rng.choice(sample.diagnosticians),
+                                             sample.image_path, enqueue=False)
+    return (analysis.id,)
+
+
+def make_cases(sample: Sample) -> list:
+    s = sample
+    week_ago = s.last_date - datetime.timedelta(days=7)
+    counter = iter(range(10 ** 9))
+
+    def images(rng):
+        batch = next(counter)
+        return [(s.image_path, f"{batch:032x}{i:032x}", 1024) for i in range(10)]
+
+    return [
+        # analysis_crud: пациенты
+        Case("get_patient_by_mrn", analysis_crud.get_patient_by_mrn, lambda db, rng: (s.random_patient_mrn(rng),)),
+        Case("create_patient", analysis_crud.create_patient, lambda db, rng: (f"BENCH-{next(counter)}",)),
+        Case("bump_history_version", analysis_crud.bump_history_version,
+             lambda db, rng: (rng.randint(1, s.max_patient),)),
+        # analysis_crud: создание анализов и CV
+        Case("create_analysis", analysis_crud.create_analysis,
+             lambda db, rng: (s.random_patient_mrn(rng), rng.choice(s.diagnosticians), s.image_path)),
+        Case("create_analyses_bulk (10 файлов)", analysis_crud.create_analyses_bulk,
+             lambda db, rng: (s.random_patient_mrn(rng), rng.choice(s.diagnosticians), images(rng))),
+        Case("run_cv_for_analysis (заглушка CV)", analysis_crud.run_cv_for_analysis,
+             lambda db, rng: _new_analysis(db, s, rng)),
+        Case("create_analysis_and_run_cv (заглушка CV)", analysis_crud.create_analysis_and_run_cv,
+             lambda db, rng: (s.random_patient_mrn(rng), rng.choice(s.diagnosticians), s.image_path)),
+        # analysis_crud: чтение
+        Case("get_analysis_by_id", analysis_crud.get_analysis_by_id, lambda db, rng: (s.random_analysis(rng),)),
+        Case("get_analyses_for_diagnostician (тяжелый)", analysis_crud.get_analyses_for_diagnostician,
+             lambda db, rng: (s.heavy_diagnostician,)),
+        Case("get_analyses_for_diagnostician (медианный)", analysis_crud.get_analyses_for_diagnostician,
+             lambda db, rng: (s.median_diagnostician,)),
+        Case("get_analyses_for_diagnostician (тяжелый, середина)",
+             lambda db, user_id: analysis_crud.get_analyses_for_diagnostician(db, user_id, cursor=s.cursor_diagnostician),
+             lambda db, rng: (s.heavy_diagnostician,)),
+        Case("get_analyses_for_diagnostician (тяжелый, confirmed=false)",
+             lambda db, user_id: analysis_crud.get_analyses_for_diagnostician(db, user_id, confirmed=False),
+             lambda db, rng: (s.heavy_diagnostician,)),
+        Case("get_patient_history_by_mrn (тяжелый)", analysis_crud.get_patient_history_by_mrn,
+             lambda db, rng: (s.heavy_mrn,)),
+        Case("get_patient_history_by_mrn (медианный)", analysis_crud.get_patient_history_by_mrn,
+             lambda db, rng: (s.median_mrn,)),
+        Case("get_patient_history_by_mrn (тяжелый, середина)",
+             lambda db, mrn: analysis_crud.get_patient_history_by_mrn(db, mrn, cursor=s.cursor_patient),
+             lambda db, rng: (s.heavy_mrn,)),
+        Case("get_all_analyses", analysis_crud.get_all_analyses),
+        Case("get_all_analyses (середина)", lambda db: analysis_crud.get_all_analyses(db, cursor=s.cursor_all)),
+        Case("get_all_analyses (confirmed=true)", lambda db: analysis_crud.get_all_analyses(db, confirmed=True)),
+        Case("get_all_analyses (confirmed=false)", lambda db: analysis_crud.get_all_analyses(db, confirmed=False)),
+        Case("get_all_analyses (за неделю)",
+             lambda db: analysis_crud.get_all_analyses(db, date_from=week_ago, limit=200)),
+        Case("get_feedback_metrics", analysis_crud.get_feedback_metrics),
+        # analysis_crud: обновления
+        Case("update_analysis_conclusion", analysis_crud.update_analysis_conclusion,
+             lambda db, rng: (s.random_analysis(rng), "Заключение (бенчмарк)", rng.randint(0, 1))),
+        Case("update_analysis_treatment_plan", analysis_crud.update_analysis_treatment_plan,
+             lambda db, rng: (s.random_analysis(rng), "План (бенчмарк)", rng.choice(s.users))),
+        # user_crud
+        Case("get_user_by_username", user_crud.get_user_by_username, lambda db, rng: (rng.choice(s.usernames),)),
+        Case("get_user_by_id", user_crud.get_user_by_id, lambda db, rng: (rng.choice(s.users),)),
+        Case("create_user (bcrypt)", user_crud.create_user, lambda db, rng: (pydantic_models.UserCreate(
+            username=f"bench_{next(counter)}", password="bench-password", role="clinician"),), repeat=3),
+        Case("get_all_users", user_crud.get_all_users),
+        Case("get_all_users (последняя страница)",
+             lambda db: user_crud.get_all_users(db, skip=max(0, len(s.users) - 100))),
+        Case("update_user_password_hash", user_crud.update_user_password_hash,
+             lambda db, rng: (rng.choice(s.users), "$2b$12$" + "x" * 53)),
+        Case("update_user_role", user_crud.update_user_role,
+             lambda db, rng: (rng.choice(s.users), rng.choice(["clinician", "diagnostician"]))),
+        Case("set_user_active", user_crud.set_user_active, lambda db, rng: (rng.choice(s.users), True)),
+    ]
+
+
+def make_async_cases(sample: Sample) -> list:
+    """Чтения через AsyncSession (aiosqlite), как в обработчиках API."""
+    s = sample
+    return [
+        Case("get_patient_by_mrn_async", analysis_crud.get_patient_by_mrn_async,
+             lambda db, rng: (s.random_patient_mrn(rng),), is_async=True),
+        Case("get_analysis_by_id_async (с маской)",
+             lambda db, analysis_id: analysis_crud.get_analysis_by_id_async(db, analysis_id, with_segmentation=True),
+             lambda db, rng: (s.random_analysis(rng),), is_async=True),
+        Case("get_analyses_for_diagnostician_async (тяжелый)", analysis_crud.get_analyses_for_diagnostician_async,
+             lambda db, rng: (s.heavy_diagnostician,), is_async=True),
+        Case("get_all_analyses_async", analysis_crud.get_all_analyses_async, is_async=True),
+        Case("get_patient_history_version_async", analysis_crud.get_patient_history_version_async,
+             lambda db, rng: (s.random_patient_mrn(rng),), is_async=True),
+        Case("get_patient_history_by_mrn_async (тяжелый)", analysis_crud.get_patient_history_by_mrn_async,
+             lambda db, rng: (s.heavy_mrn,), is_async=True),
+        Case("get_feedback_metrics_async", analysis_crud.get_feedback_metrics_async, is_async=True),
+        Case("get_user_by_username_async", user_crud.get_user_by_username_async,
+             lambda db, rng: (rng.choice(s.usernames),), is_async=True),
+        Case("get_user_by_id_async", user_crud.get_user_by_id_async,
+             lambda db, rng: (rng.choice(s.users),), is_async=True),
+        Case("get_all_users_async", user_crud.get_all_users_async, is_async=True),
+    ]
+
+
+def uncovered(cases: list) -> list:
+    """Публичные функции модулей CRUD, которых нет среди замеров."""
+    measured = {case.function for case in cases}
+    names = []
+    for module in (analysis_crud, user_crud):
+        for name, fn in inspect.getmembers(module, inspect.isfunction):
+            if fn.__module__ == module.__name__ and not name.startswith("_") \
+                    and name not in measured and name not in COVERED_BY:
+                names.append(f"{module.__name__}.{name}")
+    return names
+
+
+# --- Замер ---
+def make_rollback_engine(db_path: str):
+    """
+    Движок, в котором commit внутри внешней транзакции не доходит до БД.
+    pysqlite сам начинает транзакцию только перед изменением данных, и
+    SAVEPOINT вне ее фиксируется при RELEASE, поэтому BEGIN выдается явно
+    (рецепт из документации SQLAlchemy для pysqlite).
+    """
+    engine = make_engine(f"sqlite:///{db_path}")
+
+    @event.listens_for(engine, "connect")
+    def _no_implicit_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+    return engine
+
+
+def _plans(engine, statements) -> tuple:
+    """План каждого запроса (без повторов) и проблемы планов."""
+    plans, problems = [], []
+    for statement, parameters in statements:
+        if not statement.lstrip().upper().startswith(EXPLAINABLE):
+            continue
+        plan = query_plan.explain(engine, statement, parameters)
+        if plan and plan not in plans:
+            plans.append(plan)
+            problems += [p for p in query_plan.plan_problems(plan) if p not in problems]
+    return plans, problems
+
+
+def _summary(latencies: list, plans: list, problems: list) -> dict:
+    latencies = np.array(latencies) * 1000
+    return {
+        "calls": len(latencies),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "plans": plans,
+        "problems": problems,
+    }
+
+
+def run_sync_case(case: Case, db: Session, engine, rng, repeat: int, budget: float) -> dict:
+    # Первый вызов — прогрев и сбор запросов для планов
+    args = case.make_args(db, rng)
+    db.expunge_all()
+    with query_plan.capture_statements(engine) as statements:
+        case.fn(db, *args)
+    plans, problems = _plans(engine, statements)
+
+    latencies = []
+    deadline = time.perf_counter() + budget
+    for _ in range(case.repeat or repeat):
+        args = case.make_args(db, rng)
+        db.expunge_all()  # Как в новой сессии запроса: объекты не берутся из identity map
+        started = time.perf_counter()
+        case.fn(db, *args)
+        latencies.append(time.perf_counter() - started)
+        if time.perf_counter() > deadline:
+            break
+    return _summary(latencies, plans, problems)
+
+
+async def run_async_case(case: Case, db: AsyncSession, engine, plan_engine, rng, repeat: int,
+                         budget: float) -> dict:
+    """plan_engine — синхронный движок той же БД (EXPLAIN вне event loop)."""
+    args = case.make_args(db, rng)
+    db.expunge_all()
+    with query_plan.capture_statements(engine.sync_engine) as statements:
+        await case.fn(db, *args)
+    await db.rollback()
+    plans, problems = _plans(plan_engine, statements)
+
+    latencies = []
+    deadline = time.perf_counter() + budget
+    for _ in range(case.repeat or repeat):
+        args = case.make_args(db, rng)
+        db.expunge_all()
+        started = time.perf_counter()
+        await case.fn(db, *args)
+        await db.rollback()  # Соединение возвращается в пул, как в конце запроса API
+        latencies.append(time.perf_counter() - started)
+        if time.perf_counter() > deadline:
+            break
+    return _summary(latencies, plans, problems)
+
+
+def run_all(db_path: str, image_path: str, repeat: int, budget: float, only: str) -> dict:
+    engine = make_rollback_engine(db_path)
+    results = {}
+    with engine.connect() as conn:
+        outer = conn.begin()
+        db = Session(bind=conn, autoflush=False, join_transaction_mode="create_savepoint")
+        started = time.perf_counter()
+        sample = Sample(db, image_path)
+        print(f"Выбор аргументов: {time.perf_counter() - started:.1f} с; тяжелый пациент {sample.heavy_mrn}, "
+              f"диагност {sample.heavy_diagnostician}")
+        cases = make_cases(sample)
+        async_cases = make_async_cases(sample)
+        for name in uncovered(cases + async_cases):
+            print(f"НЕ ИЗМЕРЯЕТСЯ: {name}")
+
+        rng = random.Random(0)
+        for case in cases:
+            if only and only not in case.name:
+                continue
+            results[case.name] = run_sync_case(case, db, engine, rng, repeat, budget)
+            print_row(case.name, results[case.name])
+        db.close()
+        outer.rollback()  # Данные синтетической БД не меняются
+
+    async def run_async_cases():
+        async_engine = make_async_engine(f"sqlite+aiosqlite:///{db_path}")
+        rng = random.Random(0)
+        async with AsyncSession(async_engine, expire_on_commit=False) as db:
+            for case in async_cases:
+                if only and only not in case.name:
+                    continue
+                results[case.name] = await run_async_case(case, db, async_engine, engine, rng, repeat, budget)
+                print_row(case.name, results[case.name])
+        await async_engine.dispose()
+
+    asyncio.run(run_async_cases())
+    engine.dispose()
+    return results
+
+
+# --- Отчет и базовый замер ---
+def print_row(name: str, row: dict) -> None:
+    flag = "ПЛАН" if row["problems"] else "    "
+    print(f"{name:<58} {row['calls']:5d} {row['p50_ms']:9.2f} {row['p99_ms']:9.2f}  {flag}")
+    for problem in row["problems"]:
+        print(f"{'':>60}{problem}")
+
+
+def compare(current: dict, baseline: dict, threshold: float, min_delta_ms: float) -> list:
+    problems = []
+    for name, base in baseline["cases"].items():
+        cur = current["cases"].get(name)
+        if cur is None:
+            continue  # Не запускался (--only) или переименован
+        if cur["p50_ms"] > base["p50_ms"] * (1 + threshold) and cur["p50_ms"] - base["p50_ms"] >= min_delta_ms:
+            problems.append(f"{name}: p50 {base['p50_ms']:.2f} -> {cur['p50_ms']:.2f} мс")
+        if cur["plans"] != base["plans"]:
+            problems.append(f"{name}: план изменился")
+            for plan in cur["plans"]:
+                if plan not in base["plans"]:
+                    problems.append("    " + " | ".join(plan))
+        for problem in cur["problems"]:
+            if problem not in base["problems"]:
+                problems.append(f"{name}: {problem}")
+    return problems
+
+
+def dataset(db_path: str) -> dict:
+    """Объем данных; БД, созданная до новых миграций, сначала догоняет схему."""
+    engine = make_engine(f"sqlite:///{db_path}")
+    migrations.upgrade(engine)
+    with engine.connect() as conn:
+        counts = {table: conn.exec_driver_sql(f"SELECT count(*) FROM {table}").scalar()
+                  for table in ("users", "patients", "analyses", "results")}
+    engine.dispose()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время и планы запросов analysis_crud/user_crud на больших данных")
+    parser.add_argument("--db", default=None, help="БД из bench.synthetic (по умолчанию — сгенерировать временную)")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--patients", type=int, default=100000)
+    parser.add_argument("--analyses", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=50, help="Вызовов каждой функции")
+    parser.add_argument("--budget", type=float, default=5, help="Не дольше стольких секунд на функцию")
+    parser.add_argument("--only", default="", help="Только замеры, в имени которых есть подстрока")
+    parser.add_argument("--save", default=None, help="Сохранить результат в JSON (базовый замер)")
+    parser.add_argument("--baseline", default=None, help="Сравнить с базовым замером (JSON)")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Допустимое ухудшение p50 (доля)")
+    parser.add_argument("--min-delta-ms", type=float, default=1, help="Меньшие изменения p50 не считаются")
+    args = parser.parse_args()
+
+    db_path = os.path.abspath(args.db) if args.db else None
+    save_path = os.path.abspath(args.save) if args.save else None
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Кэш результатов CV (data/cache) и изображение для run_cv_for_analysis — во временном каталоге
+        os.chdir(workdir)
+        image_path = os.path.join(workdir, "scan.png")
+        Image.fromarray(np.random.default_rng(0).integers(0, 256, (512, 512), dtype=np.uint8)).save(image_path)
+        if db_path is None:
+            db_path = os.path.join(workdir, "synthetic.db")
+            synthetic.generate(f"sqlite:///{db_path}", args.users, args.patients, args.analyses)
+        counts = dataset(db_path)
+        print(f"Данные: {', '.join(f'{table} {count}' for table, count in counts.items())}")
+        print(f"{'вызов':<58} {'раз':>5} {'p50, мс':>9} {'p99, мс':>9}")
+        try:
+            cases = run_all(db_path, image_path, args.repeat, args.budget, args.only)
+        finally:
+            inference.shutdown()
+
+    result = {"created": datetime.datetime.utcnow().isoformat(timespec="seconds"), "dataset": counts,
+              "cases": cases}
+    if save_path:
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        with open(save_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"Результат сохранен: {save_path}")
+
+    if baseline is not None:
+        if baseline["dataset"] != counts:
+            print(f"ВНИМАНИЕ: объем данных отличается от базового замера ({baseline['dataset']}), сравнение неточно")
+        problems = compare(result, baseline, args.threshold, args.min_delta_ms)
+        if problems:
+            print(f"РЕГРЕССИЯ (порог {args.threshold:.0%}):")
+            for problem in problems:
+                print(f"  {problem}")
+            sys.exit(1)
+        print(f"Регрессий нет (порог {args.threshold:.0%}, базовый замер {baseline['created']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+# Файл: bench/export_memory.py
+#
+# Пиковая память (RSS) и время выгрузки подтвержденных результатов в NDJSON:
+#     all    — все строки запроса загружаются списком (.all()), затем пишутся
+#     stream — курсор порциями (crud/export_crud.iter_confirmed_results), как manage export-results
+#     api    — GET /v1/admin/export/results (AsyncSession.stream), тело пишется в файл
+#              по мере отправки; роутер вызывается в процессе (ASGI, без сети),
+#              проверка администратора подменена
+# Каждый вариант выполняется в отдельном процессе, чтобы пики не смешивались.
+#
+# Запуск (из каталога backend):
+#     python -m bench.export_memory --rows 1000000
+
+import argparse
+import asyncio
+import datetime
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from fastapi import FastAPI
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import Session
+
+import migrations
+from crud import export_crud, user_crud  # noqa: F401 — user_crud до core.security (взаимный импорт)
+from api.v1 import admin
+from core import export
+from database import get_async_db, make_async_engine, make_engine
+from models import pydantic_models, sql_models
+
+SEED_CHUNK = 20000
+
+
+def seed(db_path: str, rows: int) -> None:
+    engine = make_engine(f"sqlite:///{db_path}")
+    migrations.upgrade(engine)
+    start = datetime.datetime(2023, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(sql_models.User.__table__.insert(), [{"id": 1, "username": "bench", "role": "diagnostician"}])
+        conn.execute(sql_models.Patient.__table__.insert(), [{"id": 1, "medical_record_number": "BENCH"}])
+        for first in range(1, rows + 1, SEED_CHUNK):
+            ids = range(first, min(first + SEED_CHUNK, rows + 1))
+            conn.execute(sql_models.Analysis.__table__.insert(), [
+                {"id": i, "patient_id": 1, "diagnostician_id": 1, "image_path": f"data/uploads/{i}.png",
+                 "image_digest": f"{i:064x}", "date_of_analysis": start + datetime.timedelta(minutes=i),
+                 "status": sql_models.ANALYSIS_STATUS_DONE}
+                for i in ids
+            ])
+            conn.execute(sql_models.Result.__table__.insert(), [
+                {"analysis_id": i, "system_diagnosis": f"bench-{i % 7}", "model_version": f"v{i % 3}",
+                 "diagnostician_conclusion": f"Заключение врача по анализу {i}", "is_confirmed": True,
+                 "feedback_correct": i % 2}
+                for i in ids
+            ])
+    engine.dispose()
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux: КБ
+
+
+# --- Варианты (выполняются в дочернем процессе) ---
+def run_all(db_path: str, output: str) -> int:
+    engine = make_engine(f"sqlite:///{db_path}")
+    with engine.connect() as conn, open(output, "wb") as out:
+        rows = conn.execute(export_crud.confirmed_results_query()).all()
+        out.write(export.ndjson_chunk(export_crud.EXPORT_FIELDS, rows))
+    engine.dispose()
+    return len(rows)
+
+
+def run_stream(db_path: str, output: str) -> int:
+    engine = make_engine(f"sqlite:///{db_path}")
+    exported = 0
+    with Session(engine) as db, open(output, "wb") as out:
+        for rows in export_crud.iter_confirmed_results(db):
+            out.write(export.ndjson_chunk(export_crud.EXPORT_FIELDS, rows))
+            exported += len(rows)
+    engine.dispose()
+    return exported
+
+
+async def _run_api(db_path: str, output: str) -> int:
+    engine = make_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    SessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+    async def get_db():
+        async with SessionLocal() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(admin.router)
+    app.dependency_overrides[get_async_db] = get_db
+    app.dependency_overrides[admin.get_admin_user] = lambda: pydantic_models.User(
+        id=1, username="admin", role="admin", is_active=True)
+
+    # Прямой вызов ASGI: httpx.ASGITransport собирает ответ целиком до возврата
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+             "scheme": "http", "path": "/v1/admin/export/results", "raw_path": b"/v1/admin/export/results",
+             "query_string": b"", "root_path": "", "headers": [], "server": ("bench", 80),
+             "client": ("127.0.0.1", 1)}
+    requested = False
+    disconnected = asyncio.Event()
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    exported = 0
+    with open(output, "wb") as out:
+        async def send(message):
+            nonlocal exported
+            if message["type"] == "http.response.start":
+                assert message["status"] == 200, message
+            elif message["type"] == "http.response.body":
+                out.write(message.get("body", b""))
+                exported += message.get("body", b"").count(b"\n")
+
+        await app(scope, receive, send)
+    disconnected.set()
+    await engine.dispose()
+    return exported
+
+
+VARIANTS = {
+    "all": run_all,
+    "stream": run_stream,
+    "api": lambda db_path, output: asyncio.run(_run_api(db_path, output)),
+}
+
+
+def child(variant: str, db_path: str, output: str) -> None:
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    exported = VARIANTS[variant](db_path, output)
+    elapsed = time.perf_counter() - started
+    print(f"{exported} {elapsed:.3f} {baseline:.1f} {peak_rss_mb():.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Память и время выгрузки: список против курсора порциями")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--child", nargs=3, default=None, help=argparse.SUPPRESS)  # вариант, БД, файл
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "bench.db")
+        output = os.path.join(workdir, "export.ndjson")
+        started = time.perf_counter()
+        seed(db_path, args.rows)
+        print(f"Подтвержденных результатов: {args.rows} (заполнение {time.perf_counter() - started:.0f} с), "
+              f"порция: {export.EXPORT_BATCH_SIZE}")
+        for variant in VARIANTS:
+            out = subprocess.run([sys.executable, "-m", "bench.export_memory", "--child", variant, db_path, output],
+                                 check=True, capture_output=True, text=True).stdout.split()
+            exported, elapsed, baseline, peak = int(out[0]), float(out[1]), float(out[2]), float(out[3])
+            size_mb = os.path.getsize(output) / 1024 / 1024
+            print(f"{variant:<7} строк={exported} время={elapsed:6.1f} с  ({exported / elapsed:8.0f} строк/с)  "
+                  f"RSS: до={baseline:6.1f} МБ пик={peak:7.1f} МБ  (+{peak - baseline:6.1f})  файл={size_mb:.0f} МБ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,462 @@
+# Файл: bench/load.py
+#
+# Нагрузочный тест приложения целиком, в процессе: main.app (с lifespan —
+# миграции, модель, встроенный воркер CV) вызывается через httpx.ASGITransport,
+# без сети. Виртуальные пользователи без пауз выполняют смесь сценариев:
+#     login            POST /v1/auth/token (bcrypt)
+#     upload           POST /v1/analyses/upload_analysis (новый файл -> задача CV)
+#     my_history       GET  /v1/analyses/my_history
+#     patient_history  GET  /v1/patients/{mrn}/history
+#     confirm          POST /v1/analyses/{id}/confirm
+#     prescribe        POST /v1/patients/analyses/{id}/prescribe
+#     admin_metrics    GET  /v1/admin/model/feedback_metrics
+# Стоимость инференса задается синтетической задержкой заглушки модели
+# (--cv-latency-ms -> CV_STUB_LATENCY_MS).
+#
+# Результат — пропускная способность и p50/p95/p99 по сценариям. --save
+# сохраняет его в JSON (базовый замер), --baseline сравнивает с базовым:
+# при ухудшении больше --threshold код выхода 1. Базовый замер имеет смысл
+# только на той же машине и с той же конфигурацией (она хранится в файле).
+# --sql-profile включает профилировщик SQL (core/sql_profiler.py): число
+# запросов к БД по маршрутам; N+1 или превышение бюджета — код выхода 1.
+#
+# Запуск (из каталога backend):
+#     python -m bench.load --users 16 --seconds 30 --save bench/baselines/load.json
+#     python -m bench.load --users 16 --seconds 30 --baseline bench/baselines/load.json
+
+import argparse
+import asyncio
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+import numpy as np
+from PIL import Image
+
+PASSWORD = "bench-password"
+SEED_CHUNK = 5000
+
+FLOW_WEIGHTS = {
+    "login": 2,
+    "upload": 10,
+    "my_history": 25,
+    "patient_history": 25,
+    "confirm": 10,
+    "prescribe": 8,
+    "admin_metrics": 5,
+}
+
+
+# --- Данные ---
+def make_image() -> bytes:
+    """PNG 512x512 со случайным шумом (одна на прогон, см. Context.next_upload)."""
+    noise = np.random.default_rng(0).integers(0, 256, (512, 512), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(noise).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def seed(url: str, diagnosticians: int, clinicians: int, patients: int, analyses: int) -> dict:
+    """
+    Пользователи (пароль PASSWORD), пациенты и выполненные анализы с
+    неподтвержденными результатами. Возвращает id и MRN для сценариев.
+    """
+    from core import passwords
+    from database import make_engine
+    from models import sql_models
+
+    hashed = passwords.pwd_context.hash(PASSWORD)  # Один хеш на всех: bcrypt дорог
+    engine = make_engine(url)
+    rng = random.Random(0)
+    with engine.begin() as conn:
+        first_user = conn.execute(sql_models.User.__table__.select().with_only_columns(
+            sql_models.User.id).order_by(sql_models.User.id.desc()).limit(1)).scalar() + 1
+        users = {"diagnostician": [], "clinician": []}
+        rows = []
+        for role, count in (("diagnostician", diagnosticians), ("clinician", clinicians)):
+            for i in range(count):
+                user_id = first_user + len(rows)
+                users[role].append(user_id)
+                rows.append({"id": user_id, "username": f"{role}{i}", "hashed_password": hashed,
+                             "role": role, "is_active": True})
+        conn.execute(sql_models.User.__table__.insert(), rows)
+
+        mrns = [f"LOAD-{i:06d}" for i in range(1, patients + 1)]
+        conn.execute(sql_models.Patient.__table__.insert(), [
+            {"id": i, "medical_record_number": mrn, "last_name": f"Пациент{i}", "first_name": "Тест",
+             "date_of_birth": "1970-01-01"}
+            for i, mrn in enumerate(mrns, start=1)
+        ])
+
+        owned = defaultdict(list)  # Анализы каждого диагноста (подтверждает только автор)
+        started = datetime.datetime.utcnow() - datetime.timedelta(days=365)
+        for first in range(1, analyses + 1, SEED_CHUNK):
+            ids = range(first, min(first + SEED_CHUNK, analyses + 1))
+            authors = [rng.choice(users["diagnostician"]) for _ in ids]
+            for analysis_id, author in zip(ids, authors):
+                owned[author].append(analysis_id)
+            conn.execute(sql_models.Analysis.__table__.insert(), [
+                {"id": i, "patient_id": rng.randint(1, patients), "diagnostician_id": author,
+                 "image_path": f"data/uploads/seed-{i}.png", "status": sql_models.ANALYSIS_STATUS_DONE,
+                 "date_of_analysis": started + datetime.timedelta(minutes=i)}
+                for i, author in zip(ids, authors)
+            ])
+            conn.execute(sql_models.Result.__table__.insert(), [
+                {"analysis_id": i, "system_diagnosis": f"seed-{i % 3}", "model_version": "seed",
+                 "is_confirmed": False, "feedback_correct": -1}
+                for i in ids
+            ])
+    engine.dispose()
+    return {"users": users, "mrns": mrns, "owned": dict(owned), "analyses": analyses}
+
+
+# --- Сценарии ---
+class Context:
+    """Токены, данные сида и общие для виртуальных пользователей счетчики."""
+
+    def __init__(self, seeded: dict, tokens: dict, image: bytes):
+        self.seeded = seeded
+        self.tokens = tokens  # id пользователя -> заголовки с Bearer-токеном
+        self.image = image
+        self.uploads = 0
+        self.uploaded_ids = []
+
+    def next_upload(self) -> bytes:
+        # Хвост после IEND игнорируется декодерами, но меняет SHA-256:
+        # каждый файл новый (без дедупликации и кэша результатов CV)
+        self.uploads += 1
+        return self.image + f"load-{os.getpid()}-{self.uploads}".encode()
+
+
+async def flow_login(http, ctx, rng):
+    role = rng.choice(["diagnostician", "clinician"])
+    index = rng.randrange(len(ctx.seeded["users"][role]))
+    return await http.post("/v1/auth/token", data={"username": f"{role}{index}", "password": PASSWORD})
+
+
+async def flow_upload(http, ctx, rng):
+    user_id = rng.choice(ctx.seeded["users"]["diagnostician"])
+    response = await http.post(
+        "/v1/analyses/upload_analysis", headers=ctx.tokens[user_id],
+        files={"file": ("scan.png", ctx.next_upload(), "image/png")},
+        data={"patient_mrn": rng.choice(ctx.seeded["mrns"])},
+    )
+    if response.status_code == 202:
+        ctx.uploaded_ids.append(response.json()["analysis_id"])
+    return response
+
+
+async def flow_my_history(http, ctx, rng):
+    user_id = rng.choice(ctx.seeded["users"]["diagnostician"])
+    return await http.get("/v1/analyses/my_history", headers=ctx.tokens[user_id])
+
+
+async def flow_patient_history(http, ctx, rng):
+    user_id = rng.choice(ctx.seeded["users"]["clinician"])
+    return await http.get(f"/v1/patients/{rng.choice(ctx.seeded['mrns'])}/history", headers=ctx.tokens[user_id])
+
+
+async def flow_confirm(http, ctx, rng):
+    user_id = rng.choice(list(ctx.seeded["owned"]))
+    analysis_id = rng.choice(ctx.seeded["owned"][user_id])
+    return await http.post(f"/v1/analyses/{analysis_id}/confirm", headers=ctx.tokens[user_id],
+                           json={"conclusion": "Заключение (нагрузочный тест)", "is_correct": rng.random() < 0.8})
+
+
+async def flow_prescribe(http, ctx, rng):
+    user_id = rng.choice(ctx.seeded["users"]["clinician"])
+    analysis_id = rng.randint(1, ctx.seeded["analyses"])
+    return await http.post(f"/v1/patients/analyses/{analysis_id}/prescribe", headers=ctx.tokens[user_id],
+                           json={"treatment_plan": "План лечения (нагрузочный тест)"})
+
+
+async def flow_admin_metrics(http, ctx, rng):
+    return await http.get("/v1/admin/model/feedback_metrics", headers=ctx.tokens["admin"])
+
+
+FLOWS = {
+    "login": flow_login,
+    "upload": flow_upload,
+    "my_history": flow_my_history,
+    "patient_history": flow_patient_history,
+    "confirm": flow_confirm,
+    "prescribe": flow_prescribe,
+    "admin_metrics": flow_admin_metrics,
+}
+
+
+# --- Нагрузка ---
+async def run_load(http, ctx, weights: dict, users: int, seconds: float, seed_value: int) -> dict:
+    """
+    users виртуальных пользователей seconds секунд выполняют сценарии
+    (выбор по весам). Возвращает {сценарий: [(задержка, ok), ...]}.
+    """
+    names, flow_weights = list(weights), list(weights.values())
+    samples = defaultdict(list)
+    deadline = time.perf_counter() + seconds
+
+    async def virtual_user(index: int):
+        rng = random.Random(seed_value * 1000 + index)
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, flow_weights)[0]
+            started = time.perf_counter()
+            try:
+                response = await FLOWS[name](http, ctx, rng)
+                ok = response.status_code < 400
+                if not ok:
+                    print(f"{name}: {response.status_code} {response.text[:200]}")
+            except Exception as e:
+                ok = False
+                print(f"{name}: {type(e).__name__}: {e}")
+            samples[name].append((time.perf_counter() - started, ok))
+
+    await asyncio.gather(*(virtual_user(i) for i in range(users)))
+    return samples
+
+
+def summarize(samples: list, seconds: float) -> dict:
+    latencies = np.array([latency for latency, _ in samples]) * 1000
+    errors = sum(1 for _, ok in samples if not ok)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (0.0, 0.0, 0.0)
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "rps": round(len(samples) / seconds, 2),
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+    }
+
+
+async def cv_progress(uploaded_ids: list) -> int:
+    """Сколько загруженных за прогон анализов уже обработано CV."""
+    from sqlalchemy import func, select
+
+    from database import SessionLocal
+    from models import sql_models
+
+    Analysis = sql_models.Analysis
+
+    def count():
+        with SessionLocal() as db:
+            return db.scalar(select(func.count()).select_from(Analysis).filter(
+                Analysis.id.in_(uploaded_ids), Analysis.status == sql_models.ANALYSIS_STATUS_DONE))
+
+    return await asyncio.to_thread(count)
+
+
+async def benchmark(args, weights: dict) -> dict:
+    # Модули приложения читают конфигурацию из окружения при импорте (см. main)
+    import main
+    from core import inference, passwords, security, sql_profiler
+    from database import DATABASE_URL, async_engine
+
+    async with main.app.router.lifespan_context(main.app):
+        started = time.perf_counter()
+        seeded = seed(DATABASE_URL, args.diagnosticians, args.clinicians, args.patients, args.analyses)
+        print(f"Заполнение: {time.perf_counter() - started:.1f} с")
+
+        def headers(user_id, role):
+            token = security.create_access_token({"sub": str(user_id), "role": role})
+            return {"Authorization": f"Bearer {token}"}
+
+        tokens = {user_id: headers(user_id, role)
+                  for role, ids in seeded["users"].items() for user_id in ids}
+        tokens["admin"] = headers(1, "admin")  # Создан при запуске (main.ensure_admin_user)
+        ctx = Context(seeded, tokens, make_image())
+
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as http:
+            if args.warmup > 0:
+                await run_load(http, ctx, weights, args.users, args.warmup, seed_value=1)
+            ctx.uploaded_ids.clear()
+            sql_profiler.profiles.clear()
+
+            samples = await run_load(http, ctx, weights, args.users, args.seconds, seed_value=2)
+            sql = sql_profiler.summary() if args.sql_profile else None
+            cv_done = await cv_progress(ctx.uploaded_ids)
+
+            # Очередь CV после снятия нагрузки: сколько секунд до обработки всех загрузок
+            drain_started = time.perf_counter()
+            drained = cv_done
+            while drained < len(ctx.uploaded_ids) and time.perf_counter() - drain_started < args.drain_timeout:
+                await asyncio.sleep(0.2)
+                drained = await cv_progress(ctx.uploaded_ids)
+
+        flows = {name: summarize(samples[name], args.seconds) for name in weights if samples[name]}
+        total = summarize([s for name in weights for s in samples[name]], args.seconds)
+        cv = {
+            "uploaded": len(ctx.uploaded_ids),
+            "done_during_run": cv_done,
+            "done_per_s": round(cv_done / args.seconds, 2),
+            "drain_s": round(time.perf_counter() - drain_started, 2),
+            "drained": drained == len(ctx.uploaded_ids),
+        }
+        config = {
+            "users": args.users,
+            "seconds": args.seconds,
+            "flows": weights,
+            "diagnosticians": args.diagnosticians,
+            "clinicians": args.clinicians,
+            "patients": args.patients,
+            "analyses": args.analyses,
+            "cv_latency_ms": inference.get_engine().model.latency_ms,
+            "cv_latency_per_image_ms": inference.get_engine().model.latency_per_image_ms,
+            "cv_max_batch_size": inference.CV_MAX_BATCH_SIZE,
+            "bcrypt_rounds": passwords.BCRYPT_ROUNDS,
+        }
+    await async_engine.dispose()
+    result = {"config": config, "flows": flows, "total": total, "cv": cv}
+    if sql is not None:
+        result["sql"] = sql
+    return result
+
+
+# --- Базовый замер ---
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "sqlite": sqlite3.sqlite_version,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float, min_delta_ms: float) -> list:
+    """
+    Ухудшения относительно базового замера: p95 выше больше чем на threshold
+    (и не меньше чем на min_delta_ms — шум быстрых запросов), пропускная
+    способность ниже больше чем на threshold, доля ошибок выше.
+    """
+    problems = []
+    rows = [(name, baseline["flows"][name], current["flows"].get(name)) for name in baseline["flows"]]
+    rows.append(("total", baseline["total"], current["total"]))
+    for name, base, cur in rows:
+        if cur is None:
+            problems.append(f"{name}: нет в текущем прогоне")
+            continue
+        if cur["p95_ms"] > base["p95_ms"] * (1 + threshold) and cur["p95_ms"] - base["p95_ms"] >= min_delta_ms:
+            problems.append(f"{name}: p95 {base['p95_ms']:.1f} -> {cur['p95_ms']:.1f} мс")
+        if cur["rps"] < base["rps"] * (1 - threshold):
+            problems.append(f"{name}: пропускная способность {base['rps']:.1f} -> {cur['rps']:.1f} запросов/с")
+        if cur["error_rate"] > base["error_rate"] + 0.01:
+            problems.append(f"{name}: доля ошибок {base['error_rate']:.2%} -> {cur['error_rate']:.2%}")
+    base_cv, cur_cv = baseline.get("cv"), current["cv"]
+    if base_cv and cur_cv["done_per_s"] < base_cv["done_per_s"] * (1 - threshold):
+        problems.append(f"CV: обработано {base_cv['done_per_s']:.1f} -> {cur_cv['done_per_s']:.1f} анализов/с")
+    return problems
+
+
+def print_report(result: dict) -> None:
+    print(f"{'сценарий':<16} {'запросов':>8} {'ошибок':>6} {'запр/с':>8} {'p50':>8} {'p95':>8} {'p99':>8}  (мс)")
+    for name, row in [*result["flows"].items(), ("total", result["total"])]:
+        print(f"{name:<16} {row['requests']:8d} {row['errors']:6d} {row['rps']:8.1f} "
+              f"{row['p50_ms']:8.1f} {row['p95_ms']:8.1f} {row['p99_ms']:8.1f}")
+    cv = result["cv"]
+    print(f"CV: загружено {cv['uploaded']}, обработано за прогон {cv['done_during_run']} "
+          f"({cv['done_per_s']:.1f}/с), очередь разобрана за {cv['drain_s']:.1f} с"
+          f"{'' if cv['drained'] else ' (НЕ разобрана)'}")
+    if "sql" in result:
+        print(f"{'маршрут':<56} {'запросов':>8} {'SQL p50':>7} {'max':>4} {'бюджет':>6} {'БД p50, мс':>10} {'N+1':>5}")
+        for key, row in result["sql"].items():
+            print(f"{key:<56} {row['requests']:8d} {row['queries_p50']:7d} {row['queries_max']:4d} "
+                  f"{row['budget']:6d} {row['db_ms_p50']:10.2f} {row['nplus1']:5d}")
+
+
+def parse_flows(spec: str) -> dict:
+    """"upload,my_history" или "upload=5,my_history=20"; по умолчанию — FLOW_WEIGHTS."""
+    if not spec:
+        return dict(FLOW_WEIGHTS)
+    weights = {}
+    for item in spec.split(","):
+        name, _, weight = item.strip().partition("=")
+        if name not in FLOWS:
+            raise SystemExit(f"Неизвестный сценарий: {name}. Доступные: {', '.join(FLOWS)}")
+        weights[name] = float(weight) if weight else FLOW_WEIGHTS[name]
+    return weights
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест API в процессе с базовыми замерами")
+    parser.add_argument("--users", type=int, default=16, help="Виртуальных пользователей (одновременных запросов)")
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=3, help="Секунд прогрева до замера")
+    parser.add_argument("--flows", default="", help='Сценарии и веса: "upload=5,my_history=20"')
+    parser.add_argument("--diagnosticians", type=int, default=20)
+    parser.add_argument("--clinicians", type=int, default=20)
+    parser.add_argument("--patients", type=int, default=1000)
+    parser.add_argument("--analyses", type=int, default=20000, help="Выполненных анализов до начала")
+    parser.add_argument("--cv-latency-ms", type=float, default=50, help="Синтетическое время прохода модели")
+    parser.add_argument("--cv-latency-per-image-ms", type=float, default=5)
+    parser.add_argument("--bcrypt-rounds", type=int, default=None, help="По умолчанию — как в приложении")
+    parser.add_argument("--drain-timeout", type=float, default=60, help="Сколько ждать разбора очереди CV")
+    parser.add_argument("--save", default=None, help="Сохранить результат в JSON (базовый замер)")
+    parser.add_argument("--baseline", default=None, help="Сравнить с базовым замером (JSON)")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Допустимое ухудшение (доля)")
+    parser.add_argument("--min-delta-ms", type=float, default=5, help="Меньшие изменения p95 не считаются")
+    parser.add_argument("--sql-profile", action="store_true",
+                        help="Профилировщик SQL (SQL_PROFILER=log): запросы к БД по маршрутам, N+1")
+    args = parser.parse_args()
+    weights = parse_flows(args.flows)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    save_path = os.path.abspath(args.save) if args.save else None
+    workdir = tempfile.TemporaryDirectory()
+    # Окружение — до импорта модулей приложения; data/ (хранилище, кэш CV) — во временном каталоге
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir.name, 'load.db')}"
+    os.environ["CV_STUB_LATENCY_MS"] = str(args.cv_latency_ms)
+    os.environ["CV_STUB_LATENCY_PER_IMAGE_MS"] = str(args.cv_latency_per_image_ms)
+    if args.bcrypt_rounds is not None:
+        os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    if args.sql_profile:
+        os.environ["SQL_PROFILER"] = "log"
+    os.chdir(workdir.name)
+    try:
+        result = asyncio.run(benchmark(args, weights))
+    finally:
+        workdir.cleanup()
+
+    result = {"created": datetime.datetime.utcnow().isoformat(timespec="seconds"),
+              "environment": environment(), **result}
+    print_report(result)
+    sql_problems = [key for key, row in result.get("sql", {}).items() if row["nplus1"] or row["over_budget"]]
+
+    if save_path:
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        with open(save_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"Результат сохранен: {save_path}")
+
+    if baseline is not None:
+        for section in ("config", "environment"):
+            if baseline[section] != result[section]:
+                print(f"ВНИМАНИЕ: {section} отличается от базового замера ({args.baseline}), сравнение неточно")
+        problems = compare(result, baseline, args.threshold, args.min_delta_ms)
+        if problems:
+            print(f"РЕГРЕССИЯ (порог {args.threshold:.0%}):")
+            for problem in problems:
+                print(f"  {problem}")
+            sys.exit(1)
+        print(f"Регрессий нет (порог {args.threshold:.0%}, базовый замер {baseline['created']})")
+
+    if sql_problems:
+        print(f"N+1 или превышен бюджет запросов к БД (core/sql_profiler.py): {', '.join(sql_problems)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
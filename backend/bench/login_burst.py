@@ -0,0 +1,181 @@
+# Файл: bench/login_burst.py
+#
+# Нагрузочный тест: задержка обычных запросов API во время всплеска из 100
+# одновременных входов. Сервер uvicorn (отдельный процесс) с двумя
+# вариантами входа:
+#     /inline/token — bcrypt прямо в async-обработчике (прежний вариант)
+#     /pool/token   — bcrypt в пуле потоков (core/passwords.verify_password_async)
+# и легким маршрутом /ping/{user_id} (чтение пользователя из БД), который
+# клиенты-зонды запрашивают все время теста.
+#
+# Запуск (из каталога backend):
+#     python -m bench.login_burst --logins 100 --probes 4
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+import migrations
+from bench.async_sessions import wait_ready
+from crud import user_crud
+from core import passwords, security
+from database import make_async_engine, make_engine
+from models import sql_models
+
+USERS = 100
+PASSWORD = "bench-password"
+REQUEST_TIMEOUT = 120.0
+
+
+# --- Сервер ---
+def create_app(db_path: str) -> FastAPI:
+    SessionLocal = async_sessionmaker(make_async_engine(f"sqlite+aiosqlite:///{db_path}"),
+                                      autoflush=False, expire_on_commit=False)
+
+    async def get_db():
+        async with SessionLocal() as db:
+            yield db
+
+    app = FastAPI()
+
+    @app.post("/inline/token")
+    async def inline_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+        user = await user_crud.get_user_by_username_async(db, form_data.username)
+        if not user or not security.verify_password(form_data.password, user.hashed_password):
+            raise HTTPException(status_code=401)
+        return {"id": user.id}
+
+    @app.post("/pool/token")
+    async def pool_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+        user = await user_crud.get_user_by_username_async(db, form_data.username)
+        if not user:
+            raise HTTPException(status_code=401)
+        await db.commit()  # Как в api/v1/auth.py: соединение не занято на время bcrypt
+        verified, _ = await passwords.verify_password_async(form_data.password, user.hashed_password)
+        if not verified:
+            raise HTTPException(status_code=401)
+        return {"id": user.id}
+
+    @app.get("/ping/{user_id}")
+    async def ping(user_id: int, db: AsyncSession = Depends(get_db)):
+        user = await user_crud.get_user_by_id_async(db, user_id)
+        return {"id": user.id}
+
+    return app
+
+
+def seed(db_path: str) -> None:
+    engine = make_engine(f"sqlite:///{db_path}")
+    migrations.upgrade(engine)
+    hashed = security.get_password_hash(PASSWORD)  # Один хеш на всех: стоимость проверки та же
+    with engine.begin() as conn:
+        conn.execute(sql_models.User.__table__.insert(), [
+            {"id": i, "username": f"bench{i}", "hashed_password": hashed, "role": "diagnostician", "is_active": True}
+            for i in range(1, USERS + 1)
+        ])
+    engine.dispose()
+
+
+# --- Клиент ---
+async def load(base_url: str, mode: str, logins: int, probes: int, warmup: float) -> dict:
+    probe_samples = []  # (время начала, задержка)
+    login_latencies = []
+    errors = 0
+    done = asyncio.Event()
+
+    async def probe(index: int, http: httpx.AsyncClient):
+        nonlocal errors
+        while not done.is_set():
+            started = time.perf_counter()
+            response = await http.get(f"/ping/{index % USERS + 1}")
+            if response.status_code != 200:
+                errors += 1
+            probe_samples.append((started, time.perf_counter() - started))
+            await asyncio.sleep(0.01)
+
+    async def login(index: int, http: httpx.AsyncClient):
+        nonlocal errors
+        started = time.perf_counter()
+        response = await http.post(f"/{mode}/token",
+                                   data={"username": f"bench{index % USERS + 1}", "password": PASSWORD})
+        if response.status_code != 200:
+            errors += 1
+        login_latencies.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=logins + probes)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=REQUEST_TIMEOUT) as http:
+        probe_tasks = [asyncio.create_task(probe(i, http)) for i in range(probes)]
+        await asyncio.sleep(warmup)
+        burst_start = time.perf_counter()
+        await asyncio.gather(*(login(i, http) for i in range(logins)))
+        burst_end = time.perf_counter()
+        done.set()
+        await asyncio.gather(*probe_tasks)
+
+    during = [latency for started, latency in probe_samples if burst_start <= started < burst_end]
+    before = [latency for started, latency in probe_samples if started < burst_start]
+    return {"before": before, "during": during, "logins": login_latencies,
+            "burst": burst_end - burst_start, "errors": errors}
+
+
+def report(mode: str, result: dict) -> None:
+    def fmt(values):
+        if not values:
+            return "—"
+        p50, p99 = np.percentile(values, [50, 99]) * 1000
+        return f"p50={p50:7.1f} p99={p99:7.1f} max={max(values) * 1000:7.1f}"
+
+    print(f"{mode:<6} зонд до всплеска: {fmt(result['before'])}")
+    print(f"{'':<6} зонд во время:    {fmt(result['during'])}   запросов: {len(result['during'])}")
+    print(f"{'':<6} вход:             {fmt(result['logins'])}   всплеск: {result['burst']:.1f} с, "
+          f"ошибок: {result['errors']}")
+
+
+def run_mode(db_path: str, mode: str, args) -> dict:
+    server = subprocess.Popen([sys.executable, "-m", "bench.login_burst",
+                               "--serve", db_path, "--port", str(args.port)],
+                              stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        wait_ready(base_url, server)
+        return asyncio.run(load(base_url, mode, args.logins, args.probes, args.warmup))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Задержка API во время всплеска входов: bcrypt в обработчике против пула")
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--probes", type=int, default=4, help="Клиентов с легкими запросами")
+    parser.add_argument("--warmup", type=float, default=1.0)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--serve", default=None, help=argparse.SUPPRESS)  # Путь к БД: режим сервера
+    args = parser.parse_args()
+
+    if args.serve:
+        import uvicorn
+        uvicorn.run(create_app(args.serve), host="127.0.0.1", port=args.port, log_level="warning")
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "bench.db")
+        seed(db_path)
+        print(f"Входов: {args.logins}, зондов: {args.probes}, bcrypt rounds={passwords.BCRYPT_ROUNDS}, "
+              f"потоков хеширования: {passwords.PASSWORD_HASH_WORKERS}; задержки в мс")
+        for mode in ("inline", "pool"):
+            report(mode, run_mode(db_path, mode, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# Файл: bench/pagination.py
+#
+# Бенчмарк списков анализов: время получения страницы на разной глубине
+# для OFFSET и для курсорной пагинации (crud/analysis_crud.paginate_analyses).
+#
+# Запуск (из каталога backend):
+#     python -m bench.pagination --rows 200000 --page-size 50
+
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import joinedload, sessionmaker
+
+from crud.analysis_crud import paginate_analyses
+from models import sql_models
+
+
+def seed(db, rows: int, diagnostician_id: int = 1) -> None:
+    db.execute(insert(sql_models.User), [{"id": diagnostician_id, "username": "bench", "role": "diagnostician"}])
+    db.execute(insert(sql_models.Patient), [{"id": 1, "medical_record_number": "BENCH"}])
+    start = datetime.datetime(2020, 1, 1)
+    batch = []
+    for i in range(1, rows + 1):
+        batch.append({
+            "id": i,
+            "patient_id": 1,
+            "diagnostician_id": diagnostician_id,
+            "date_of_analysis": start + datetime.timedelta(minutes=i // 3),  # Есть совпадающие даты
+            "image_path": f"bench/{i}.png",
+            "status": sql_models.ANALYSIS_STATUS_DONE,
+        })
+        if len(batch) == 10000:
+            db.execute(insert(sql_models.Analysis), batch)
+            batch = []
+    if batch:
+        db.execute(insert(sql_models.Analysis), batch)
+    db.commit()
+
+
+def base_query(db):
+    return (
+        db.query(sql_models.Analysis)
+        .filter(sql_models.Analysis.diagnostician_id == 1)
+        .options(joinedload(sql_models.Analysis.patient), joinedload(sql_models.Analysis.results))
+    )
+
+
+def timed(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OFFSET против курсорной пагинации")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--page-size", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        engine = create_engine(f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+        sql_models.Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        seed(db, args.rows)
+
+        # Курсоры на нужной глубине получаем, пройдя страницы заранее
+        depths = [1, 10, 100, 1000, args.rows // args.page_size - 1]
+        cursors = {}
+        cursor, page = None, 1
+        while page <= max(depths):
+            if page in depths:
+                cursors[page] = cursor
+            rows, next_cursor = paginate_analyses(base_query(db), limit=args.page_size, cursor=cursor)
+            cursor = (rows[-1].date_of_analysis, rows[-1].id)
+            db.expunge_all()
+            page += 1
+
+        print(f"{'страница':>9} | {'OFFSET, мс':>10} | {'курсор, мс':>10}")
+        for page in depths:
+            offset_ms = timed(lambda: base_query(db).order_by(
+                sql_models.Analysis.date_of_analysis.desc(), sql_models.Analysis.id.desc()
+            ).offset((page - 1) * args.page_size).limit(args.page_size).all())
+            cursor_ms = timed(lambda: paginate_analyses(base_query(db), limit=args.page_size, cursor=cursors[page]))
+            db.expunge_all()
+            print(f"{page:>9} | {offset_ms:>10.2f} | {cursor_ms:>10.2f}")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# Файл: bench/patient_history.py
+#
+# Бенчмарк GET /v1/patients/{mrn}/history: полный запрос с JOIN против
+# ответа из кэша процесса (core/history_cache.py) и 304 по If-None-Match.
+# Настоящий роутер api/v1/patients.py вызывается в процессе (ASGI, без сети);
+# проверка токена подменена.
+#
+# Запуск (из каталога backend):
+#     python -m bench.patient_history --analyses 200 --limit 50 --requests 500
+
+import argparse
+import asyncio
+import datetime
+import os
+import tempfile
+import time
+
+import httpx
+import numpy as np
+from fastapi import FastAPI
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import migrations
+from crud import user_crud  # noqa: F401 — до core.security (взаимный импорт)
+from api.v1 import patients
+from core import history_cache
+from core.security import get_current_user
+from database import get_async_db, make_async_engine, make_engine
+from models import pydantic_models, sql_models
+
+MRN = "BENCH"
+
+
+def seed(db_path: str, analyses: int) -> None:
+    engine = make_engine(f"sqlite:///{db_path}")
+    migrations.upgrade(engine)
+    start = datetime.datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(sql_models.User.__table__.insert(), [{"id": 1, "username": "bench", "role": "diagnostician"}])
+        conn.execute(sql_models.Patient.__table__.insert(), [{"id": 1, "medical_record_number": MRN}])
+        conn.execute(sql_models.Analysis.__table__.insert(), [
+            {"id": i, "patient_id": 1, "diagnostician_id": 1, "image_path": f"data/uploads/{i}.png",
+             "date_of_analysis": start + datetime.timedelta(hours=i), "status": sql_models.ANALYSIS_STATUS_DONE}
+            for i in range(1, analyses + 1)
+        ])
+        conn.execute(sql_models.Result.__table__.insert(), [
+            {"analysis_id": i, "system_diagnosis": f"bench-{i % 7}", "model_version": "bench",
+             "diagnostician_conclusion": "Заключение " * 5, "is_confirmed": True, "feedback_correct": 1}
+            for i in range(1, analyses + 1)
+        ])
+    engine.dispose()
+
+
+def create_app(engine) -> FastAPI:
+    SessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+    async def get_db():
+        async with SessionLocal() as db:
+            yield db
+
+    clinician = pydantic_models.User(id=2, username="clinician", role="clinician", is_active=True)
+    app = FastAPI()
+    app.include_router(patients.router)
+    app.dependency_overrides[get_async_db] = get_db
+    app.dependency_overrides[get_current_user] = lambda: clinician
+    return app
+
+
+async def measure(db_path: str, variant: str, limit: int, requests: int) -> np.ndarray:
+    # Без кэша: ответ больше предела и не сохраняется
+    history_cache._cache = history_cache.HistoryCache(max_bytes=0 if variant == "full" else 32 * 1024 * 1024)
+    engine = make_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    app = create_app(engine)
+    latencies = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as http:
+        url = f"/v1/patients/{MRN}/history"
+        first = await http.get(url, params={"limit": limit})
+        headers = {"If-None-Match": first.headers["etag"]} if variant == "304" else {}
+        for _ in range(requests):
+            started = time.perf_counter()
+            response = await http.get(url, params={"limit": limit}, headers=headers)
+            latencies.append(time.perf_counter() - started)
+            assert response.status_code == (304 if variant == "304" else 200)
+    history_cache._cache = None
+    await engine.dispose()
+    return np.array(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="История пациента: JOIN против кэша ответа и 304")
+    parser.add_argument("--analyses", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=50, help="Размер страницы")
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "bench.db")
+        seed(db_path, args.analyses)
+        print(f"Анализов у пациента: {args.analyses}, страница: {args.limit}, запросов: {args.requests}; мс")
+        for variant, title in (("full", "без кэша"), ("cached", "кэш"), ("304", "304")):
+            latencies = asyncio.run(measure(db_path, variant, args.limit, args.requests))
+            p50, p99 = np.percentile(latencies, [50, 99])
+            print(f"{title:<9} p50={p50:6.2f} p99={p99:6.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# Файл: bench/patient_search.py
+#
+# Бенчмарк поиска пациентов при вводе (crud/patient_crud.search_patients):
+# запросы — последовательные префиксы фамилии ("и", "ив", "ива", ...),
+# "фамилия имя", префиксы MRN и его цифр. Для сравнения — тот же поиск
+# через LIKE по префиксам без индекса FTS (несколько запросов) и через
+# AsyncSession, как в обработчике API.
+#
+# Запуск (из каталога backend):
+#     python -m bench.patient_search --patients 1000000 --queries 300
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+from sqlalchemy import and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import migrations
+from crud import patient_crud
+from database import make_async_engine, make_engine
+from models import sql_models
+
+SEED_CHUNK = 50000
+
+_STEMS_A = ["Ив", "Пет", "Сид", "Смир", "Кузн", "Попов", "Вас", "Соко", "Мих", "Нов", "Фед", "Мор", "Вол", "Алекс",
+            "Леб", "Сем", "Ег", "Пав", "Коз", "Степ", "Ник", "Ор", "Анд", "Мак", "Зах", "Зайц", "Бел", "Гор"]
+_STEMS_B = ["ан", "ер", "ор", "ил", "ен", "ар", "ол", "ук", "ат", "ин", "ец", "ав", "ем", "ош"]
+_ENDINGS = ["ов", "ев", "ин", "ский", "енко", "ых"]
+_FIRST_NAMES = ["Александр", "Алексей", "Анна", "Андрей", "Артём", "Виктория", "Дмитрий", "Екатерина", "Елена",
+                "Иван", "Ирина", "Мария", "Максим", "Михаил", "Наталья", "Никита", "Ольга", "Павел", "Пётр",
+                "Светлана", "Сергей", "Татьяна", "Юлия", "Яна"]
+
+
+def make_names(rng: random.Random, count: int):
+    """
+    ~2300 фамилий с частотой по закону Ципфа: самая частая — ~1% пациентов
+    (у Иванова в реальных данных ~1.3%), сотня самых частых — ~38%.
+    """
+    last_names = [a + b + e for a in _STEMS_A for b in _STEMS_B for e in _ENDINGS]
+    weights = [1 / (rank + 20) for rank in range(len(last_names))]
+    rng.shuffle(last_names)
+    return rng.choices(last_names, weights, k=count), rng.choices(_FIRST_NAMES, k=count)
+
+
+def seed(db_path: str, patients: int) -> None:
+    engine = make_engine(f"sqlite:///{db_path}")
+    migrations.upgrade(engine)  # Индекс FTS создан миграцией и заполняется триггерами
+    rng = random.Random(0)
+    last_names, first_names = make_names(rng, patients)
+    with engine.begin() as conn:
+        for first in range(0, patients, SEED_CHUNK):
+            conn.execute(sql_models.Patient.__table__.insert(), [
+                {"id": i + 1, "medical_record_number": f"MRN-{i + 1:07d}", "last_name": last_names[i],
+                 "first_name": first_names[i], "date_of_birth": f"19{50 + i % 50}-01-01"}
+                for i in range(first, min(first + SEED_CHUNK, patients))
+            ])
+    engine.dispose()
+
+
+def make_queries(db: Session, rng: random.Random, count: int):
+    """Что набирает пользователь: все префиксы фамилии, затем имя; префиксы MRN."""
+    patients = db.query(sql_models.Patient).filter(
+        sql_models.Patient.id.in_([rng.randint(1, db.query(sql_models.Patient).count()) for _ in range(count)])
+    ).all()
+    queries = {"фамилия, 1-2 буквы": [], "фамилия, 3+ букв": [], "фамилия имя": [], "MRN": [], "цифры MRN": []}
+    for patient in patients:
+        for length in range(1, len(patient.last_name) + 1):
+            group = "фамилия, 1-2 буквы" if length <= 2 else "фамилия, 3+ букв"
+            queries[group].append(patient.last_name[:length])
+        queries["фамилия имя"].append(f"{patient.last_name} {patient.first_name[:2]}")
+        queries["MRN"].append(patient.medical_record_number[:rng.randint(6, 11)])
+        digits = patient.medical_record_number[4:]
+        queries["цифры MRN"].append(digits[:rng.randint(3, 7)])
+    return queries
+
+
+def measure(db: Session, queries, search) -> np.ndarray:
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        hits = search(db, query)
+        latencies.append(time.perf_counter() - started)
+        assert hits or query.startswith("MRN"), query  # Каждый запрос взят у существующего пациента
+    return np.array(latencies) * 1000
+
+
+async def measure_async(db_path: str, queries) -> np.ndarray:
+    """Как в обработчике API: search_patients_async через AsyncSession (aiosqlite)."""
+    engine = make_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    latencies = []
+    async with AsyncSession(engine) as db:
+        for query in queries:
+            started = time.perf_counter()
+            await patient_crud.search_patients_async(db, query)
+            latencies.append(time.perf_counter() - started)
+    await engine.dispose()
+    return np.array(latencies) * 1000
+
+
+def like_search(db: Session, query: str):
+    """Поиск без индекса: LIKE по префиксу (регистр как введен: lower() SQLite — только ASCII)."""
+    columns = [getattr(sql_models.Patient, c) for c in patient_crud.SEARCH_COLUMNS]
+    return db.query(sql_models.Patient).filter(
+        and_(*(or_(*(c.like(term + "%") for c in columns)) for term in query.split()))
+    ).order_by(sql_models.Patient.last_name, sql_models.Patient.first_name).limit(
+        patient_crud.SEARCH_LIMIT_DEFAULT).all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Поиск пациентов при вводе: FTS5 против LIKE")
+    parser.add_argument("--patients", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=300, help="Пациентов, чьи данные набираются")
+    parser.add_argument("--like-queries", type=int, default=10, help="Запросов LIKE без индекса")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "bench.db")
+        started = time.perf_counter()
+        seed(db_path, args.patients)
+        print(f"Пациентов: {args.patients} (заполнение с индексом {time.perf_counter() - started:.0f} с, "
+              f"БД {os.path.getsize(db_path) / 1024 / 1024:.0f} МБ); мс")
+
+        engine = make_engine(f"sqlite:///{db_path}")
+        with Session(engine) as db:
+            queries = make_queries(db, random.Random(1), args.queries)
+            measure(db, queries["фамилия, 3+ букв"][:50], patient_crud.search_patients)  # Прогрев кэша страниц
+            for group, group_queries in queries.items():
+                latencies = measure(db, group_queries, patient_crud.search_patients)
+                p50, p99 = np.percentile(latencies, [50, 99])
+                print(f"FTS   {group:<20} запросов={len(latencies):5d} p50={p50:6.2f} p99={p99:6.2f} "
+                      f"max={latencies.max():6.2f}")
+            latencies = asyncio.run(measure_async(db_path, queries["фамилия, 3+ букв"]))
+            p50, p99 = np.percentile(latencies, [50, 99])
+            print(f"async {'фамилия, 3+ букв':<20} запросов={len(latencies):5d} p50={p50:6.2f} p99={p99:6.2f} "
+                  f"max={latencies.max():6.2f}")
+            like = measure(db, queries["фамилия, 3+ букв"][:args.like_queries], like_search)
+            print(f"LIKE  {'фамилия, 3+ букв':<20} запросов={len(like):5d} p50={np.percentile(like, 50):6.2f}")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+# Файл: bench/synthetic.py
+#
+# Генератор синтетических данных в объемах рабочей системы для бенчмарков
+# запросов (bench/crud_queries.py) и ручной проверки планов:
+#     пользователи — диагносты, клиницисты, администраторы;
+#     пациенты — имена как в bench/patient_search.py (фамилии по закону Ципфа);
+#     анализы и результаты — с перекосом: у хронических пациентов и самых
+#     активных диагностов анализов на порядки больше, чем у медианных;
+#     число анализов в день растет со временем; новые версии модели
+#     приходят по датам; большинство старых результатов подтверждены.
+# БД создается всеми миграциями (вместе с индексами и FTS пациентов),
+# агрегаты метрик обратной связи пересчитываются в конце. ANALYZE не
+# выполняется: планы запросов — как в рабочей БД без статистики.
+#
+# Запуск (из каталога backend; 10M анализов — ~10 мин и 4 ГБ):
+#     python -m bench.synthetic --db data/synthetic.db --users 10000 --patients 1000000 --analyses 10000000
+
+import argparse
+import datetime
+import os
+import random
+import time
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+import migrations
+from bench.patient_search import make_names
+from crud import metrics_crud
+from database import make_engine
+from models import sql_models
+
+CHUNK = 200000
+
+# Доли ролей пользователей
+ROLE_SHARES = (("diagnostician", 0.3), ("clinician", 0.69), ("admin", 0.01))
+# Перекос активности: вес ранга r равен 1 / (r + смещение). При 1M пациентов
+# и 10M анализов у самого активного пациента ~1500 анализов, у медианного — 3
+# (у 8% пациентов анализов нет); самый активный из 3000 диагностов — ~49 000
+# анализов (0.5%), медианный — ~1600
+PATIENT_SKEW_OFFSET = 1000
+DIAGNOSTICIAN_SKEW_OFFSET = 50
+HISTORY_YEARS = 5
+
+# Диагнозы заглушки CV (core/cv_stub.py) и их частоты
+DIAGNOSES = (
+    ("Без патологий (Заглушка CV)", 0.7),
+    ("Вероятная пневмония (Заглушка CV)", 0.22),
+    ("Подозрение на новообразование (Заглушка CV)", 0.08),
+)
+# Версии модели: (доля истории с начала, с которой версия используется)
+MODEL_VERSIONS = (("stub-0", 0.0), ("stub-1", 0.45), ("stub-2", 0.8))
+CONFIRMED_SHARE = 0.75  # Подтверждены врачом (кроме последних двух недель — там меньше)
+CORRECT_SHARE = 0.86  # Вывод системы корректен по мнению врача
+FAILED_SHARE = 0.002
+QUEUED_TAIL = 200  # Самые новые анализы еще в очереди
+
+
+class SkewedIds:
+    """Случайные id из 1..count с весом 1 / (ранг + offset); ранги id перемешаны один раз."""
+
+    def __init__(self, rng: np.random.Generator, count: int, offset: int):
+        self.rng = rng
+        weights = 1.0 / (np.arange(count) + offset)
+        self.p = weights / weights.sum()
+        self.ids = rng.permutation(count) + 1
+
+    def sample(self, size: int) -> np.ndarray:
+        return self.ids[self.rng.choice(len(self.ids), size=size, p=self.p)]
+
+
+def _timestamps(values: np.ndarray) -> list:
+    """datetime64[us] -> строки в формате DateTime SQLAlchemy для SQLite."""
+    return [value.replace("T", " ") for value in np.datetime_as_string(values, unit="us")]
+
+
+def seed_users(conn, users: int) -> dict:
+    """Пользователи по ROLE_SHARES (без паролей: вход в бенчмарках запросов не нужен)."""
+    first_id = (conn.exec_driver_sql("SELECT max(id) FROM users").scalar() or 0) + 1
+    by_role, rows = {}, []
+    for role, share in ROLE_SHARES:
+        count = max(1, round(users * share))
+        ids = list(range(first_id + len(rows), first_id + len(rows) + count))
+        by_role[role] = ids
+        rows += [(user_id, f"{role}_{user_id}", None, role, True) for user_id in ids]
+    conn.exec_driver_sql("INSERT INTO users (id, username, hashed_password, role, is_active) VALUES (?, ?, ?, ?, ?)",
+                         rows)
+    return by_role
+
+
+def seed_patients(conn, patients: int) -> None:
+    last_names, first_names = make_names(random.Random(0), patients)
+    for first in range(0, patients, CHUNK):
+        conn.exec_driver_sql(
+            "INSERT INTO patients (id, medical_record_number, last_name, first_name, date_of_birth, history_version) "
+            "VALUES (?, ?, ?, ?, ?, 0)",
+            [(i + 1, f"MRN-{i + 1:07d}", last_names[i], first_names[i], f"{1930 + i % 90}-{1 + i % 12:02d}-{1 + i % 28:02d}")
+             for i in range(first, min(first + CHUNK, patients))]
+        )
+
+
+def seed_analyses(conn, analyses: int, patients: int, diagnosticians: list, seed: int = 0) -> None:
+    """
+    Анализы и результаты порциями по CHUNK. id растут вместе с датой (как при
+    реальных вставках); плотность по времени растет линейно.
+    """
+    rng = np.random.default_rng(seed)
+    diagnosticians = np.array(diagnosticians)
+    end = np.datetime64(datetime.datetime.utcnow().replace(microsecond=0), "us")
+    span_us = HISTORY_YEARS * 365 * 24 * 3600 * 10 ** 6
+    start = end - np.timedelta64(span_us, "us")
+    recent = end - np.timedelta64(14, "D")
+    diagnoses = np.array([name for name, _ in DIAGNOSES])
+    diagnosis_p = np.array([share for _, share in DIAGNOSES])
+    version_starts = np.array([share for _, share in MODEL_VERSIONS])
+    versions = np.array([name for name, _ in MODEL_VERSIONS])
+    patient_ids_of = SkewedIds(rng, patients, PATIENT_SKEW_OFFSET)
+    authors_of = SkewedIds(rng, len(diagnosticians), DIAGNOSTICIAN_SKEW_OFFSET)
+
+    for first in range(0, analyses, CHUNK):
+        size = min(CHUNK, analyses - first)
+        ids = np.arange(first + 1, first + size + 1)
+        position = np.sqrt((ids - 0.5) / analyses)  # Доля пройденной истории: плотность растет линейно
+        dates = start + (position * span_us).astype("timedelta64[us]")
+        patient_ids = patient_ids_of.sample(size)
+        authors = diagnosticians[authors_of.sample(size) - 1]
+
+        status = np.where(rng.random(size) < FAILED_SHARE, sql_models.ANALYSIS_STATUS_FAILED,
+                          sql_models.ANALYSIS_STATUS_DONE).astype(object)
+        status[ids > analyses - QUEUED_TAIL] = sql_models.ANALYSIS_STATUS_QUEUED
+        timestamps = _timestamps(dates)
+        conn.exec_driver_sql(
+            "INSERT INTO analyses (id, patient_id, diagnostician_id, date_of_analysis, image_path, status, "
+            "error_message) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(int(i), int(p), int(a), t, f"data/uploads/synthetic/{i}.png", s,
+              "Синтетическая ошибка CV" if s == sql_models.ANALYSIS_STATUS_FAILED else None)
+             for i, p, a, t, s in zip(ids, patient_ids, authors, timestamps, status)]
+        )
+
+        # Результаты — только у обработанных анализов
+        done = status == sql_models.ANALYSIS_STATUS_DONE
+        diagnosis = diagnoses[rng.choice(len(diagnoses), size=size, p=diagnosis_p)]
+        version = versions[np.searchsorted(version_starts, position, side="right") - 1]
+        confirmed = rng.random(size) < np.where(dates < recent, CONFIRMED_SHARE, CONFIRMED_SHARE / 3)
+        feedback = np.where(confirmed, (rng.random(size) < CORRECT_SHARE).astype(int), -1)
+        conn.exec_driver_sql(
+            "INSERT INTO results (id, analysis_id, system_diagnosis, model_version, diagnostician_conclusion, "
+            "is_confirmed, feedback_correct) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(int(i), int(i), d, v, (d if f == 1 else "Заключение врача расходится с системой") if c else None,
+              bool(c), int(f))
+             for i, d, v, c, f in zip(ids[done], diagnosis[done], version[done], confirmed[done], feedback[done])]
+        )
+
+
+def generate(url: str, users: int, patients: int, analyses: int, verbose: bool = True) -> dict:
+    """
+    Создает схему (все миграции) и заполняет пустую БД. Возвращает id
+    пользователей по ролям.
+    """
+    engine = make_engine(url)
+    migrations.upgrade(engine)
+
+    def step(name, fn):
+        started = time.perf_counter()
+        value = fn()
+        if verbose:
+            print(f"{name}: {time.perf_counter() - started:.0f} с")
+        return value
+
+    with engine.begin() as conn:
+        # Данные одноразовые: без синхронизации с диском на время заполнения
+        conn.exec_driver_sql("PRAGMA synchronous = OFF")
+        by_role = step("пользователи", lambda: seed_users(conn, users))
+        step("пациенты", lambda: seed_patients(conn, patients))
+        step("анализы и результаты",
+             lambda: seed_analyses(conn, analyses, patients, by_role["diagnostician"]))
+    with Session(engine) as db:
+        step("агрегаты метрик", lambda: metrics_crud.rebuild_feedback_stats(db))
+        db.commit()
+    engine.dispose()
+    return by_role
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Синтетические данные в объемах рабочей системы")
+    parser.add_argument("--db", required=True, help="Файл SQLite (не должен существовать)")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--patients", type=int, default=1000000)
+    parser.add_argument("--analyses", type=int, default=10000000)
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        raise SystemExit(f"{args.db} уже существует")
+    os.makedirs(os.path.dirname(os.path.abspath(args.db)), exist_ok=True)
+    started = time.perf_counter()
+    generate(f"sqlite:///{args.db}", args.users, args.patients, args.analyses)
+    print(f"Готово за {time.perf_counter() - started:.0f} с, БД {os.path.getsize(args.db) / 1024 ** 3:.2f} ГБ")
+
+
+if __name__ == "__main__":
+    main()
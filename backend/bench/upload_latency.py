@@ -0,0 +1,138 @@
+# Файл: bench/upload_latency.py
+#
+# Бенчмарк: задержка /v1/auth/me во время параллельных больших загрузок.
+# Запускает uvicorn во временном каталоге (отдельная БД и data/), измеряет
+# задержку /me в простое и пока идут N загрузок по SIZE МБ.
+#
+# Запуск (из каталога backend):
+#     python -m bench.upload_latency --uploads 10 --size-mb 200
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BLOCK = 1024 * 1024
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/docs")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("Сервер не запустился")
+
+
+async def get_token(client: httpx.AsyncClient) -> str:
+    await client.post("/v1/auth/register", json={"username": "bench", "password": "bench", "role": "diagnostician"})
+    r = await client.post("/v1/auth/token", data={"username": "bench", "password": "bench"})
+    r.raise_for_status()
+    return r.json()["access_token"]
+
+
+async def probe(client: httpx.AsyncClient, headers: dict, stop: asyncio.Event, interval: float = 0.02) -> list:
+    """Периодически запрашивает /v1/auth/me и возвращает задержки (мс)."""
+    latencies = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        r = await client.get("/v1/auth/me", headers=headers)
+        r.raise_for_status()
+        latencies.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def upload(client: httpx.AsyncClient, headers: dict, index: int, size_mb: int):
+    """Потоковая multipart-загрузка size_mb мегабайт (без буферизации в памяти клиента)."""
+    boundary = f"bench-boundary-{index}"
+    block = np.random.default_rng(index).integers(0, 256, BLOCK, dtype=np.uint8).tobytes()
+
+    async def body():
+        yield (
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"patient_mrn\"\r\n\r\nBENCH-{index}\r\n"
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"study_{index}.bin\"\r\n"
+            f"Content-Type: application/octet-stream\r\n\r\n"
+        ).encode()
+        for i in range(size_mb):
+            yield i.to_bytes(8, "little") + block[8:]
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+    r = await client.post(
+        "/v1/analyses/upload_analysis",
+        content=body(),
+        headers={**headers, "Content-Type": f"multipart/form-data; boundary={boundary}"}
+    )
+    r.raise_for_status()
+
+
+def summary(name: str, latencies: list) -> str:
+    lat = np.array(latencies)
+    return (f"{name:<16} n={lat.size:<5} p50={np.percentile(lat, 50):8.2f} ms "
+            f"p95={np.percentile(lat, 95):8.2f} ms p99={np.percentile(lat, 99):8.2f} ms max={lat.max():8.2f} ms")
+
+
+async def run(args):
+    port = free_port()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.makedirs(os.path.join(workdir, "data"))
+        env = {**os.environ, "PYTHONPATH": BACKEND_DIR}
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=workdir, env=env
+        )
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=None) as client:
+                await wait_ready(client)
+                headers = {"Authorization": f"Bearer {await get_token(client)}"}
+
+                stop = asyncio.Event()
+                idle_task = asyncio.create_task(probe(client, headers, stop))
+                await asyncio.sleep(args.idle_seconds)
+                stop.set()
+                idle = await idle_task
+
+                stop = asyncio.Event()
+                busy_task = asyncio.create_task(probe(client, headers, stop))
+                started = time.perf_counter()
+                await asyncio.gather(*(upload(client, headers, i, args.size_mb) for i in range(args.uploads)))
+                elapsed = time.perf_counter() - started
+                stop.set()
+                busy = await busy_task
+        finally:
+            server.terminate()
+            server.wait()
+
+    total_mb = args.uploads * args.size_mb
+    print(f"Загрузки: {args.uploads} x {args.size_mb} МБ за {elapsed:.1f} с ({total_mb / elapsed:.1f} МБ/с)")
+    print(summary("/me в простое", idle))
+    print(summary("/me под загрузкой", busy))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Задержка API во время больших загрузок")
+    parser.add_argument("--uploads", type=int, default=10)
+    parser.add_argument("--size-mb", type=int, default=200)
+    parser.add_argument("--idle-seconds", type=float, default=3.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,143 @@
 # Файл: core/cv_stub.py
 
+import base64
 import os
-from typing import Dict, Any
+import time
+from typing import Dict, Any, List, Optional
 
+import numpy as np
 
-def run_cv_analysis(image_path: str) -> Dict[str, Any]:
+from core.inference import CVModel, get_engine
+from core import result_cache, rle
+
+# --- Синтетическая задержка заглушки ---
+# Имитирует стоимость настоящей модели (нагрузочные тесты, bench/load.py):
+# время одного прохода батча и добавка на каждое изображение батча, мс
+CV_STUB_LATENCY_MS = float(os.environ.get("CV_STUB_LATENCY_MS", "0"))
+CV_STUB_LATENCY_PER_IMAGE_MS = float(os.environ.get("CV_STUB_LATENCY_PER_IMAGE_MS", "0"))
+
+
+class StubCVModel(CVModel):
     """
-    ЗАГЛУШКА: Имитация запуска модели компьютерного зрения (CV).
+    ЗАГЛУШКА: Имитация модели компьютерного зрения (CV).
 
     В реальном проекте здесь будет код, который:
     1. Загружает изображение (image_path).
     2. Выполняет инференс модели (сегментация/классификация).
-    3. Сохраняет результат сегментации (маску) в файл.
-    4. Возвращает вероятный диагноз и путь к маске.
+    3. Строит маску сегментации.
+    4. Возвращает вероятный диагноз и маску.
+
+    Заглушка превращает байты файла в "изображение" 64x64 и прогоняет его
+    через небольшую полносвязную сеть со случайными (фиксированными) весами,
+    чтобы нагрузка на CPU была похожа на настоящий векторизованный инференс.
+    Время прохода настоящей модели задается синтетической задержкой
+    (CV_STUB_LATENCY_MS, CV_STUB_LATENCY_PER_IMAGE_MS).
     """
 
-    # 1. Генерация пути к заглушечной маске
-    # В реальной жизни маска будет создана моделью.
-    # Мы просто используем имя оригинального файла для заглушки.
-    filename_without_ext = os.path.splitext(os.path.basename(image_path))[0]
-    segmentation_mask_path = f"data/segmentations/{filename_without_ext}_mask.png"
+    name = "cv-stub"
+    version = "stub-2"
+
+    INPUT_SIZE = 64
+    HIDDEN_SIZE = 256
+    MASK_THRESHOLD = 0.75
+    DIAGNOSES = [
+        "Вероятная пневмония (Заглушка CV)",
+        "Без патологий (Заглушка CV)",
+        "Подозрение на новообразование (Заглушка CV)",
+    ]
+
+    def __init__(self, latency_ms: float = CV_STUB_LATENCY_MS,
+                 latency_per_image_ms: float = CV_STUB_LATENCY_PER_IMAGE_MS):
+        self.latency_ms = latency_ms
+        self.latency_per_image_ms = latency_per_image_ms
+        rng = np.random.default_rng(42)
+        n_inputs = self.INPUT_SIZE * self.INPUT_SIZE
+        self.w1 = rng.standard_normal((n_inputs, self.HIDDEN_SIZE), dtype=np.float32) / np.sqrt(n_inputs)
+        self.w2 = rng.standard_normal((self.HIDDEN_SIZE, len(self.DIAGNOSES)), dtype=np.float32)
+
+    @property
+    def preprocess_config(self) -> Dict[str, Any]:
+        return {"input_size": self.INPUT_SIZE, "sampling": "linspace-bytes"}
 
-    # Имитируем, что заглушечная маска создана (можно создать пустой файл)
-    os.makedirs(os.path.dirname(segmentation_mask_path), exist_ok=True)
-    # open(segmentation_mask_path, 'w').close() # Раскомментировать, если нужно создать пустой файл
+    def preprocess(self, image_path: str) -> np.ndarray:
+        # Отображаем "изображение" в память как массив байт и равномерно сэмплируем его
+        # до 64x64: с диска читаются только нужные страницы, а не весь (возможно, огромный) файл
+        n_pixels = self.INPUT_SIZE * self.INPUT_SIZE
+        if os.path.getsize(image_path) == 0:
+            return np.zeros((self.INPUT_SIZE, self.INPUT_SIZE), dtype=np.float32)
+        raw = np.memmap(image_path, dtype=np.uint8, mode="r")
+        idx = np.linspace(0, raw.size - 1, n_pixels).astype(np.int64)
+        return (raw[idx].astype(np.float32) / 255.0).reshape(self.INPUT_SIZE, self.INPUT_SIZE)
+
+    def predict_batch(self, batch: np.ndarray, image_paths: List[str]) -> List[Dict[str, Any]]:
+        # Один проход для всего батча: (N, 4096) -> (N, 256) -> (N, C)
+        x = batch.reshape(batch.shape[0], -1)
+        hidden = np.maximum(x @ self.w1, 0.0)
+        logits = hidden @ self.w2
+        delay_ms = self.latency_ms + self.latency_per_image_ms * batch.shape[0]
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000)  # Как и настоящий инференс, не держит GIL
+        logits -= logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=1, keepdims=True)
+
+        labels = probs.argmax(axis=1)
+        results = []
+        for image, label, row in zip(batch, labels, probs):
+            results.append({
+                "system_diagnosis": self.DIAGNOSES[label],
+                "confidence_score": round(float(row[label]), 4),
+                # В реальной жизни маска будет создана моделью; заглушка берет яркие области входа
+                "segmentation_mask": image > self.MASK_THRESHOLD,
+            })
+        return results
+
+
+def _encode_mask(cv_result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Заменяет плотную маску на RLE (base64), чтобы результат можно было
+    хранить в кэше (JSON) и в БД (см. core/rle.py).
+    """
+    cv_result = dict(cv_result)
+    mask = cv_result.pop("segmentation_mask", None)
+    if mask is not None:
+        cv_result["segmentation_rle"] = base64.b64encode(rle.encode(mask)).decode("ascii")
+    return cv_result
+
+
+def get_model_version() -> str:
+    """Версия модели, которой выполняется инференс (сохраняется в Result)."""
+    return get_engine().model.version
+
+
+def _cache_key(image_digest: str) -> str:
+    model = get_engine().model
+    return result_cache.make_key(image_digest, model.name, model.version, model.preprocess_config)
+
+
+def get_cached_cv_result(image_digest: str) -> Optional[Dict[str, Any]]:
+    """
+    Возвращает результат из кэша для изображения с данным SHA-256 (без запуска модели).
+    Промах не учитывается: при нем анализ уйдет в очередь и кэш проверит воркер.
+    """
+    return result_cache.get_cache().get(_cache_key(image_digest), count_miss=False)
+
+
+def run_cv_analysis(image_path: str, image_digest: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Запускает CV анализ одного изображения через общий движок микро-батчинга.
+    Конкурентные вызовы из разных потоков объединяются в один батч.
+    Если передан SHA-256 изображения, результат берется из кэша / сохраняется в кэш.
+    """
+    if image_digest is None:
+        return _encode_mask(get_engine().infer(image_path))
 
-    # 2. Фиксированный результат CV
-    result = {
-        "system_diagnosis": "Вероятная пневмония (Заглушка CV)",
-        "confidence_score": 0.85,  # Дополнительное поле
-        "segmentation_mask_path": segmentation_mask_path,
-    }
+    key = _cache_key(image_digest)
+    cache = result_cache.get_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
 
-    return result
\ No newline at end of file
+    result = _encode_mask(get_engine().infer(image_path))
+    cache.put(key, result)
+    return result
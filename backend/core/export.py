@@ -0,0 +1,99 @@
+# Файл: core/export.py
+#
+# Форматы выгрузки подтвержденных результатов (crud/export_crud.py):
+# NDJSON и CSV кодируются порциями в bytes и отдаются потоком, Parquet
+# пишется группами строк в файл (нужен пакет pyarrow, необязательная зависимость).
+
+import csv
+import datetime
+import io
+import json
+import os
+from typing import Iterable, Optional, Sequence
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet недоступен, NDJSON и CSV работают
+    pyarrow = None
+
+# --- Конфигурация выгрузки ---
+# Строк в одной порции курсора (и в одной группе строк Parquet)
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "1000"))
+
+FORMATS = ("ndjson", "csv", "parquet")
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+class ExportFormatUnavailable(RuntimeError):
+    """Формат выгрузки требует пакет, который не установлен."""
+
+
+def ensure_format(fmt: str) -> None:
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат выгрузки: {fmt}. Доступные: {', '.join(FORMATS)}")
+    if fmt == "parquet" and pyarrow is None:
+        raise ExportFormatUnavailable("Выгрузка в Parquet требует пакет pyarrow (pip install pyarrow).")
+
+
+def filename(fmt: str, now: Optional[datetime.datetime] = None) -> str:
+    now = now or datetime.datetime.utcnow()
+    return f"confirmed_results_{now:%Y%m%d_%H%M%S}.{fmt}"
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в JSON")
+
+
+def ndjson_chunk(fields: Sequence[str], rows: Iterable[Sequence]) -> bytes:
+    """Одна строка JSON на запись."""
+    return b"".join(
+        json.dumps(dict(zip(fields, row)), ensure_ascii=False, default=_json_default).encode() + b"\n"
+        for row in rows
+    )
+
+
+def csv_chunk(rows: Iterable[Sequence]) -> bytes:
+    """Строки CSV (None — пустое поле, дата — ISO 8601). Заголовок — csv_chunk([fields])."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for row in rows:
+        writer.writerow([value.isoformat() if isinstance(value, datetime.datetime) else value for value in row])
+    return buffer.getvalue().encode()
+
+
+class ParquetWriter:
+    """
+    Пишет порции строк в файл Parquet, каждую — отдельной группой строк.
+    types — типы Python колонок (int, str, datetime.datetime, ...) в порядке fields.
+    """
+
+    def __init__(self, path, fields: Sequence[str], types: Sequence[type]):
+        ensure_format("parquet")
+        arrow_types = {
+            int: pyarrow.int64(),
+            float: pyarrow.float64(),
+            bool: pyarrow.bool_(),
+            str: pyarrow.string(),
+            datetime.datetime: pyarrow.timestamp("us"),
+        }
+        self.schema = pyarrow.schema([(name, arrow_types[t]) for name, t in zip(fields, types)])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write(self, rows: Sequence[Sequence]) -> None:
+        if not rows:
+            return
+        columns = zip(*rows)
+        self._writer.write_table(pyarrow.Table.from_arrays(
+            [pyarrow.array(values, type=field.type) for values, field in zip(columns, self.schema)],
+            schema=self.schema
+        ))
+
+    def close(self) -> None:
+        self._writer.close()
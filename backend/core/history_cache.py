@@ -0,0 +1,113 @@
+# Файл: core/history_cache.py
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+
+# --- Конфигурация кэша истории пациентов ---
+# Суммарный размер сериализованных ответов в памяти процесса
+HISTORY_CACHE_MAX_BYTES = int(os.environ.get("HISTORY_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+Key = Tuple[str, int, str]  # (MRN, версия истории, хеш параметров страницы)
+
+
+def make_key(mrn: str, version: int, page: Dict[str, Any]) -> Key:
+    """Ключ ответа: пациент, версия его истории и параметры страницы/фильтров."""
+    page_json = json.dumps(page, sort_keys=True, default=str)
+    return mrn, version, hashlib.sha256(page_json.encode()).hexdigest()[:16]
+
+
+def make_etag(key: Key) -> str:
+    """
+    ETag учитывает MRN: версия истории — счетчик каждого пациента, и у разных
+    пациентов одна и та же страница той же версии дала бы одинаковый ETag.
+    MRN входит в хеш, а не в заголовок открытым текстом.
+    """
+    mrn, version, page_hash = key
+    tag = hashlib.sha256(f"{mrn}\n{page_hash}".encode()).hexdigest()[:16]
+    return f'"h{version}-{tag}"'
+
+
+class HistoryCache:
+    """
+    LRU сериализованных ответов GET /v1/patients/{mrn}/history (JSON, bytes).
+    Версия истории растет при каждом изменении (crud/analysis_crud.bump_history_version),
+    поэтому устаревшая запись просто перестает запрашиваться; при сохранении
+    новой версии записи прежних версий того же пациента удаляются сразу.
+    """
+
+    def __init__(self, max_bytes: int = HISTORY_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[Key, bytes]" = OrderedDict()
+        self._by_mrn: Dict[str, Tuple[int, Set[Key]]] = {}  # MRN -> (версия, ее ключи в кэше)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Key) -> Optional[bytes]:
+        with self._lock:
+            body = self._items.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key: Key, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+        mrn, version, _ = key
+        with self._lock:
+            cached_version, keys = self._by_mrn.get(mrn, (version, set()))
+            if version < cached_version:
+                return  # Ответ прочитан до изменения, которое уже видели другие запросы
+            if version > cached_version:
+                for stale in keys:
+                    self._bytes -= len(self._items.pop(stale))
+                keys = set()
+            self._by_mrn[mrn] = (version, keys)
+
+            previous = self._items.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._items[key] = body
+            keys.add(key)
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                evicted_key, evicted = self._items.popitem(last=False)
+                self._bytes -= len(evicted)
+                evicted_keys = self._by_mrn[evicted_key[0]][1]
+                evicted_keys.discard(evicted_key)
+                if not evicted_keys:
+                    del self._by_mrn[evicted_key[0]]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "items": len(self._items),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# --- Общий кэш процесса ---
+_cache: Optional[HistoryCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> HistoryCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = HistoryCache()
+    return _cache
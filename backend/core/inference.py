@@ -0,0 +1,225 @@
+# Файл: core/inference.py
+
+import importlib
+import os
+import queue
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, InvalidStateError
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+from core import metrics
+
+# --- Конфигурация движка инференса ---
+# Модель задается в виде "модуль:Класс" и должна наследовать CVModel
+CV_MODEL = os.environ.get("CV_MODEL", "core.cv_stub:StubCVModel")
+# Максимальный размер батча для одного прохода модели
+CV_MAX_BATCH_SIZE = int(os.environ.get("CV_MAX_BATCH_SIZE", "16"))
+# Сколько миллисекунд ждать дополнительные запросы для заполнения батча
+CV_MAX_WAIT_MS = float(os.environ.get("CV_MAX_WAIT_MS", "5"))
+# Пробный инференс при запуске процесса (API в режиме inprocess, воркер)
+CV_WARMUP = os.environ.get("CV_WARMUP", "1") == "1"
+
+
+# --- Интерфейс модели ---
+class CVModel(ABC):
+    """
+    Базовый класс модели компьютерного зрения.
+
+    preprocess() вызывается для каждого изображения отдельно (в потоке вызывающего),
+    predict_batch() получает уже собранный батч и выполняет один векторизованный проход.
+    """
+
+    name: str = "cv-model"
+    version: str = "0"
+
+    @property
+    def preprocess_config(self) -> Dict[str, Any]:
+        """Параметры предобработки, влияющие на результат (входят в ключ кэша)."""
+        return {}
+
+    @abstractmethod
+    def preprocess(self, image_path: str) -> np.ndarray:
+        """Загружает изображение и приводит его к входному тензору модели."""
+
+    @abstractmethod
+    def predict_batch(self, batch: np.ndarray, image_paths: List[str]) -> List[Dict[str, Any]]:
+        """
+        Выполняет инференс для батча формы (N, ...).
+        Возвращает по одному словарю результата на каждое изображение
+        (ключи: system_diagnosis, confidence_score и, если есть,
+        segmentation_mask — двумерная бинарная маска).
+        """
+
+
+# --- Движок микро-батчинга ---
+class BatchingEngine:
+    """
+    Собирает конкурентные запросы в батчи (до max_batch_size штук или
+    до истечения max_wait_ms) и выполняет по одному проходу модели на батч.
+    """
+
+    def __init__(self, model: CVModel, max_batch_size: int = CV_MAX_BATCH_SIZE, max_wait_ms: float = CV_MAX_WAIT_MS):
+        self.model = model
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stopped = False
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._stopped = False
+                self._thread = threading.Thread(target=self._loop, name="cv-batcher", daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._stopped = True
+        if thread is not None:
+            self._queue.put(None)  # Сигнал остановки
+            thread.join()
+
+    def submit(self, image_path: str) -> Future:
+        """Ставит изображение в очередь батчинга и возвращает Future с результатом."""
+        if self._stopped:
+            raise RuntimeError("Движок инференса остановлен.")
+        self.start()
+
+        future: Future = Future()
+        # Предобработка выполняется в потоке вызывающего, чтобы не тормозить батчинг
+        try:
+            tensor = self.model.preprocess(image_path)
+        except Exception as e:
+            future.set_exception(e)
+            return future
+
+        self._queue.put((tensor, image_path, future, time.perf_counter()))
+        return future
+
+    def infer(self, image_path: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Синхронный инференс одного изображения (блокирует до получения результата)."""
+        return self.submit(image_path).result(timeout=timeout)
+
+    def _collect_batch(self, first) -> list:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Возвращаем сигнал остановки в очередь: текущий батч будет обработан
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run_batch(self, batch: list) -> None:
+        tensors, paths, futures, enqueued = zip(*batch)
+
+        started = time.perf_counter()
+        for enqueued_at in enqueued:
+            metrics.INFERENCE_QUEUE_WAIT.observe(started - enqueued_at)
+        metrics.INFERENCE_BATCH_SIZE.observe(len(batch))
+        try:
+            results = list(self.model.predict_batch(np.stack(tensors), list(paths)))
+        finally:
+            metrics.INFERENCE_MODEL_SECONDS.observe(time.perf_counter() - started)
+
+        if len(results) != len(futures):
+            raise RuntimeError(f"Модель вернула {len(results)} результатов для батча из {len(futures)} изображений.")
+        for future, result in zip(futures, results):
+            _resolve(future, result=result)
+
+    def _loop(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+
+            batch = self._collect_batch(first)
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                # Ни один вызывающий не должен ждать вечно: ошибка батча — всем незавершенным
+                for _, _, future, _ in batch:
+                    _resolve(future, error=e)
+
+
+def _resolve(future: Future, result: Any = None, error: Optional[BaseException] = None) -> None:
+    """Завершает future, если он еще не завершен (вызывающий мог его отменить)."""
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+# --- Глобальный движок (создается лениво) ---
+_engine: Optional[BatchingEngine] = None
+_engine_lock = threading.Lock()
+
+
+def _queue_depth() -> int:
+    engine = _engine
+    return engine._queue.qsize() if engine is not None else 0
+
+
+metrics.GaugeFunction("inference_queue_depth", "Изображений в очереди батчинга (ждут прохода модели).",
+                      _queue_depth)
+
+
+def load_model(spec: str = CV_MODEL) -> CVModel:
+    """Загружает модель по строке вида 'package.module:ClassName'."""
+    module_name, _, class_name = spec.partition(":")
+    model_cls = getattr(importlib.import_module(module_name), class_name)
+    return model_cls()
+
+
+def get_engine() -> BatchingEngine:
+    """Возвращает (и при необходимости создает) общий движок инференса."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = BatchingEngine(load_model())
+    return _engine
+
+
+def warmup() -> None:
+    """
+    Пробный инференс на сером изображении: первый запрос не платит за
+    запуск потока батчинга и ленивую инициализацию модели.
+    """
+    engine = get_engine()
+    fd, path = tempfile.mkstemp(suffix=".png", prefix="warmup-")
+    os.close(fd)
+    try:
+        Image.new("L", (256, 256), 128).save(path)
+        engine.infer(path)
+    except Exception as e:
+        print(f"Прогрев модели не удался: {e}")
+    finally:
+        os.remove(path)
+
+
+def shutdown() -> None:
+    """Останавливает общий движок инференса."""
+    global _engine
+    with _engine_lock:
+        engine, _engine = _engine, None
+    if engine is not None:
+        engine.stop()
@@ -0,0 +1,353 @@
+# Файл: core/metrics.py
+#
+# Метрики в текстовом формате Prometheus (0.0.4) без внешних зависимостей.
+# Запись в метрику не берет блокировок: у каждого потока свой шард значений
+# (threading.local), при сборе (GET /metrics) шарды суммируются. Блокировка
+# нужна только при первом обращении нового потока к метрике.
+# Значения от потоков, которые уже завершились, сохраняются — счетчики не убывают.
+
+import bisect
+import contextvars
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# --- Конфигурация ---
+# 0 — метрики не собираются (запись — пустая функция), /metrics отвечает 404
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Границы корзин гистограмм
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+BYTES_BUCKETS = tuple(float(1024 * 4 ** i) for i in range(11))  # 1 КБ .. 1 ГБ
+THROUGHPUT_BUCKETS = tuple(float(1024 * 1024 * 2 ** i) for i in range(11))  # 1 МБ/с .. 1 ГБ/с
+
+Labels = Tuple[str, ...]
+
+_registry: list = []
+_registry_lock = threading.Lock()
+
+
+def _noop(*args, **kwargs) -> None:
+    pass
+
+
+# --- Типы метрик ---
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: list = []
+        with _registry_lock:
+            _registry.append(self)
+        if not METRICS_ENABLED:
+            self.inc = self.dec = self.observe = _noop
+
+    def _shard(self) -> dict:
+        """Значения текущего потока: {метки: значение}."""
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with _registry_lock:
+                self._shards.append(values)
+            return values
+
+    def _snapshot(self) -> list:
+        with _registry_lock:
+            shards = list(self._shards)
+        return [list(shard.items()) for shard in shards]
+
+    def _label_text(self, labels: Labels, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labels)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> list:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines += [f"{name}{labels} {_format(value)}" for name, labels, value in self.samples()]
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик."""
+    type = "counter"
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def samples(self) -> list:
+        totals: Dict[Labels, float] = {}
+        for items in self._snapshot():
+            for labels, value in items:
+                totals[labels] = totals.get(labels, 0) + value
+        return [(self.name, self._label_text(labels), value) for labels, value in sorted(totals.items())]
+
+
+class Gauge(Counter):
+    """Значение, которое растет и убывает (inc/dec могут вызываться из разных потоков)."""
+    type = "gauge"
+
+    def dec(self, labels: Labels = (), amount: float = 1) -> None:
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) - amount
+
+
+class GaugeFunction(_Metric):
+    """
+    Значение вычисляется при сборе: fn() возвращает число или
+    {метки: число}. Ошибка fn() — метрика пропускается в этом сборе.
+    """
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, fn: Callable, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.fn = fn
+
+    def samples(self) -> list:
+        try:
+            value = self.fn()
+        except Exception as e:
+            print(f"Метрика {self.name} не собрана: {e}")
+            return []
+        values = value if isinstance(value, dict) else {(): value}
+        return [(self.name, self._label_text(labels), v) for labels, v in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    """
+    Гистограмма с фиксированными корзинами. Шард хранит число наблюдений в
+    каждой корзине (не нарастающим итогом) и сумму: observe — один bisect и
+    два сложения.
+    """
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        shard = self._shard()
+        state = shard.get(labels)
+        if state is None:
+            state = shard[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def samples(self) -> list:
+        totals: Dict[Labels, list] = {}
+        for items in self._snapshot():
+            for labels, (counts, total) in items:
+                merged = totals.setdefault(labels, [[0] * len(counts), 0.0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+
+        samples = []
+        for labels, (counts, total) in sorted(totals.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                le = 'le="' + _format(bound) + '"'
+                samples.append((self.name + "_bucket", self._label_text(labels, le), cumulative))
+            samples.append((self.name + "_sum", self._label_text(labels), total))
+            samples.append((self.name + "_count", self._label_text(labels), cumulative))
+        return samples
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def render() -> str:
+    """Все зарегистрированные метрики в текстовом формате Prometheus."""
+    with _registry_lock:
+        metrics = list(_registry)
+    return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+# --- 1. HTTP: задержка, количество и запросы в обработке по маршрутам ---
+HTTP_REQUESTS = Counter("http_requests_total", "Запросы по маршруту и коду ответа.",
+                        ("method", "route", "status"))
+HTTP_DURATION = Histogram("http_request_duration_seconds", "Время обработки запроса.", ("method", "route"))
+HTTP_IN_PROGRESS = Gauge("http_requests_in_progress", "Запросы в обработке.", ("method", "route"))
+HTTP_DB_QUERIES = Histogram("http_request_db_queries", "Запросов к БД на один HTTP-запрос.", ("route",),
+                            buckets=COUNT_BUCKETS)
+HTTP_DB_SECONDS = Histogram("http_request_db_seconds", "Суммарное время запросов к БД на один HTTP-запрос.",
+                            ("route",), buckets=DB_LATENCY_BUCKETS)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: метки — шаблон маршрута ("/v1/patients/{patient_id}/history"),
+    а не путь запроса, чтобы число рядов метрик не росло с числом id.
+    """
+
+    def __init__(self, app, router):
+        self.app = app
+        self.router = router
+        self._table: list = []
+        self._table_routes = -1
+
+    def _route_table(self) -> list:
+        """
+        (постоянная часть пути, regex, методы, шаблон) для маршрутов в порядке
+        проверки. route.matches() по всем маршрутам стоил бы ~80 мкс на запрос:
+        regex проверяется только у маршрутов с подходящим началом пути.
+        """
+        routes = self.router.routes
+        if len(routes) != self._table_routes:
+            self._table = [(route.path.split("{", 1)[0], route.path_regex, getattr(route, "methods", None),
+                            route.path) for route in routes if hasattr(route, "path_regex")]
+            self._table_routes = len(routes)
+        return self._table
+
+    def _route(self, scope) -> str:
+        path, method = scope["path"], scope["method"]
+        partial = UNMATCHED_ROUTE  # Путь совпал, метод — нет (ответ 405)
+        for prefix, regex, methods, template in self._route_table():
+            if path.startswith(prefix) and regex.match(path):
+                if not methods or method in methods:
+                    return template
+                if partial is UNMATCHED_ROUTE:
+                    partial = template
+        return partial
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        labels = (scope["method"], self._route(scope))
+        status = 500  # Если ответ не начат из-за исключения
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        db_stats = [0, 0.0]
+        token = _request_db_stats.set(db_stats)
+        HTTP_IN_PROGRESS.inc(labels)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_PROGRESS.dec(labels)
+            _request_db_stats.reset(token)
+            HTTP_REQUESTS.inc((*labels, str(status)))
+            HTTP_DURATION.observe(elapsed, labels)
+            HTTP_DB_QUERIES.observe(db_stats[0], labels[1:])
+            HTTP_DB_SECONDS.observe(db_stats[1], labels[1:])
+
+
+# --- 2. БД: время запросов по типу и счет на HTTP-запрос ---
+DB_QUERY_DURATION = Histogram("db_query_duration_seconds", "Время выполнения SQL-запроса.", ("operation",),
+                              buckets=DB_LATENCY_BUCKETS)
+
+_OPERATIONS = {operation: (operation,) for operation in ("SELECT", "INSERT", "UPDATE", "DELETE")}
+_OTHER_OPERATION = ("OTHER",)  # PRAGMA, BEGIN, SAVEPOINT, DDL
+# [число запросов, секунды] текущего HTTP-запроса. Список общий для всех копий
+# контекста: потоки run_in_threadpool и гринлеты AsyncSession.run_sync
+# пишут в тот же объект
+_request_db_stats: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("request_db_stats",
+                                                                                  default=None)
+_db_instrumented = False
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Время — в контексте выполнения: conn.info заметно дороже на каждый запрос
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    DB_QUERY_DURATION.observe(elapsed, _OPERATIONS.get(statement[:6].upper(), _OTHER_OPERATION))
+    stats = _request_db_stats.get()
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += elapsed
+
+
+def instrument_db() -> None:
+    """Подписывается на выполнение запросов всеми движками SQLAlchemy (синхронными и async)."""
+    global _db_instrumented
+    with _registry_lock:
+        if _db_instrumented or not METRICS_ENABLED:
+            return
+        _db_instrumented = True
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# --- 3. Загрузки (core/storage.py) ---
+UPLOAD_BYTES = Counter("upload_bytes_total", "Принято байт загружаемых файлов.", ("kind",))
+UPLOAD_FILES = Counter("upload_files_total", "Сохранено файлов в хранилище.", ("kind",))
+UPLOAD_SIZE = Histogram("upload_size_bytes", "Размер сохраненного файла.", ("kind",), buckets=BYTES_BUCKETS)
+UPLOAD_THROUGHPUT = Histogram("upload_throughput_bytes_per_second",
+                              "Скорость приема файла (от первого до последнего байта).", ("kind",),
+                              buckets=THROUGHPUT_BUCKETS)
+
+# --- 4. Инференс (core/inference.py) ---
+INFERENCE_BATCH_SIZE = Histogram("inference_batch_size", "Изображений в батче модели.", buckets=SIZE_BUCKETS)
+INFERENCE_MODEL_SECONDS = Histogram("inference_model_seconds", "Время одного прохода модели (predict_batch).")
+INFERENCE_QUEUE_WAIT = Histogram("inference_queue_wait_seconds",
+                                 "Ожидание изображения в очереди батчинга до прохода модели.")
+
+
+# --- Отдельный HTTP-сервер метрик (для процессов без API, см. worker.py) ---
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Без строки в журнале на каждый сбор
+
+
+def serve(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Отдает GET /metrics на отдельном порту в фоновом потоке."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
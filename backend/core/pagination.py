@@ -0,0 +1,60 @@
+# Файл: core/pagination.py
+
+import base64
+import datetime
+import os
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Query, status
+
+# --- Курсорная (keyset) пагинация ---
+# Списки анализов сортируются по (date_of_analysis DESC, id DESC). Курсор —
+# ключ последней строки страницы; следующая страница начинается строго после
+# него, поэтому стоимость запроса не зависит от глубины (в отличие от OFFSET).
+PAGE_SIZE_DEFAULT = int(os.environ.get("PAGE_SIZE_DEFAULT", "50"))
+PAGE_SIZE_MAX = int(os.environ.get("PAGE_SIZE_MAX", "200"))
+
+
+def encode_cursor(date_of_analysis: datetime.datetime, analysis_id: int) -> str:
+    raw = f"{date_of_analysis.isoformat()}|{analysis_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime.datetime, int]]:
+    """Разбирает курсор; ValueError, если он поврежден."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        date_part, id_part = raw.split("|")
+        return datetime.datetime.fromisoformat(date_part), int(id_part)
+    except Exception:
+        raise ValueError("Некорректный курсор пагинации.")
+
+
+def _to_naive_utc(value: Optional[datetime.datetime]) -> Optional[datetime.datetime]:
+    # Даты в БД хранятся в UTC без часового пояса
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def page_params(
+        limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX, description="Размер страницы"),
+        cursor: Optional[str] = Query(None, description="next_cursor предыдущей страницы"),
+        confirmed: Optional[bool] = Query(None, description="Только подтвержденные (true) / неподтвержденные (false)"),
+        date_from: Optional[datetime.datetime] = Query(None, description="Дата анализа не раньше (включительно)"),
+        date_to: Optional[datetime.datetime] = Query(None, description="Дата анализа раньше (не включительно)"),
+) -> dict:
+    """Зависимость FastAPI: параметры страницы и фильтров для списков анализов."""
+    try:
+        decoded = decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {
+        "limit": limit,
+        "cursor": decoded,
+        "confirmed": confirmed,
+        "date_from": _to_naive_utc(date_from),
+        "date_to": _to_naive_utc(date_to),
+    }
@@ -0,0 +1,78 @@
+# Файл: core/passwords.py
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+# --- Конфигурация хеширования паролей ---
+# Стоимость bcrypt (2^rounds итераций). Хеши с другой стоимостью считаются
+# устаревшими и пересчитываются при следующем входе пользователя
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+# bcrypt отпускает GIL, поэтому хватает пула потоков; размер пула — сколько
+# ядер одновременно могут занимать входы и регистрации
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Сколько операций может ждать в очереди пула; сверх этого — 503
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", "256"))
+
+# Контекст для хеширования паролей
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS, bcrypt__min_rounds=BCRYPT_ROUNDS, bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+
+class PasswordHashBusyError(RuntimeError):
+    """Очередь хеширования паролей переполнена."""
+
+
+# --- Пул потоков для bcrypt (вне event loop) ---
+_hash_pool: Optional[ThreadPoolExecutor] = None
+_hash_pool_lock = threading.Lock()
+_hash_pending = 0  # Операций в пуле (выполняются и ждут)
+
+
+def get_hash_pool() -> ThreadPoolExecutor:
+    global _hash_pool
+    if _hash_pool is None:
+        with _hash_pool_lock:
+            if _hash_pool is None:
+                _hash_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+    return _hash_pool
+
+
+def shutdown() -> None:
+    global _hash_pool
+    with _hash_pool_lock:
+        pool, _hash_pool = _hash_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+
+async def _run_in_hash_pool(fn, *args):
+    global _hash_pending
+    with _hash_pool_lock:
+        if _hash_pending >= PASSWORD_HASH_MAX_PENDING:
+            raise PasswordHashBusyError("Слишком много одновременных входов, повторите попытку позже.")
+        _hash_pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(get_hash_pool(), fn, *args)
+    finally:
+        with _hash_pool_lock:
+            _hash_pending -= 1
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Проверяет пароль в пуле потоков. Возвращает (совпал ли, новый хеш);
+    новый хеш не None, если сохраненный создан с другой стоимостью bcrypt.
+    """
+    return await _run_in_hash_pool(pwd_context.verify_and_update, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """Хеширует пароль в пуле потоков."""
+    return await _run_in_hash_pool(pwd_context.hash, password)
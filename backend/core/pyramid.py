@@ -0,0 +1,332 @@
+# Файл: core/pyramid.py
+
+import io
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+# --- Конфигурация пирамиды изображений ---
+# Пирамида строится один раз на уникальное содержимое: data/pyramids/<sha256>/
+PYRAMID_FOLDER = "data/pyramids"
+PYRAMID_VERSION = 2  # Меняется при изменении формата (входит в ETag; старые пирамиды перестраиваются)
+TILE_SIZE = 256
+THUMBNAIL_SIZE = 256
+# Сколько строк уровня обрабатывается за раз (ограничивает потребление памяти)
+STRIP_ROWS = 512
+# Сжатые форматы (PNG, JPEG, TIFF со сжатием) Pillow декодирует только целиком:
+# снимки больше этого числа пикселей отклоняются (8192x8192 RGB — 192 МБ).
+# Несжатые растры (.npy, TIFF без сжатия, BMP, PPM) читаются полосами без ограничения
+PYRAMID_MAX_DECODE_PIXELS = int(os.environ.get("PYRAMID_MAX_DECODE_PIXELS", str(8192 * 8192)))
+# Число блокировок сборки: пирамиды одного содержимого строятся по очереди
+BUILD_LOCK_STRIPES = 64
+# 16-битные и вещественные снимки переводятся в 8 бит окном по перцентилям
+# яркости, посчитанным по равномерной выборке пикселей (не больше WINDOW_SAMPLE_PIXELS)
+WINDOW_PERCENTILES = (0.5, 99.5)
+WINDOW_SAMPLE_PIXELS = 1_000_000
+
+# Сигнатура формата .npy
+_NPY_MAGIC = b"\x93NUMPY"
+
+# Несжатые данные кодека "raw": режим Pillow -> (режим изображения, порядок каналов)
+_RAW_MODES = {"L": ("L", None), "RGB": ("RGB", None), "BGR": ("RGB", slice(None, None, -1))}
+
+
+class PyramidError(ValueError):
+    """Пирамида не может быть построена (например, файл не является изображением)."""
+
+
+class TileNotFoundError(LookupError):
+    """Запрошен несуществующий уровень или тайл."""
+
+
+_build_locks = [threading.Lock() for _ in range(BUILD_LOCK_STRIPES)]
+
+
+def pyramid_dir(digest: str) -> str:
+    return os.path.join(PYRAMID_FOLDER, digest)
+
+
+def _level_path(directory: str, level: int) -> str:
+    return os.path.join(directory, f"level_{level}.npy")
+
+
+def load_meta(digest: str) -> Optional[Dict[str, Any]]:
+    """Метаданные пирамиды или None, если она еще не построена (или построена старой версией)."""
+    meta_path = os.path.join(pyramid_dir(digest), "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    return meta if meta.get("version") == PYRAMID_VERSION else None
+
+
+# --- Построение ---
+def _raw_strips(img: Image.Image, image_path: str):
+    """
+    Для несжатого растра (все тайлы декодера Pillow — "raw" в режиме L/RGB/BGR)
+    возвращает [(extents, memmap тайла H x W [x C])] — данные читаются из файла
+    напрямую, без декодирования. None, если формат так прочитать нельзя.
+    """
+    if img.mode not in ("L", "RGB") or not img.tile:
+        return None
+    strips = []
+    for tile in img.tile:
+        codec, extents, offset, args = tile[:4]
+        args = (args,) if isinstance(args, str) else tuple(args)
+        rawmode = args[0] if args else img.mode
+        stride = args[1] if len(args) > 1 else 0
+        orientation = args[2] if len(args) > 2 else 1
+        if codec != "raw" or _RAW_MODES.get(rawmode, (None,))[0] != img.mode or orientation not in (1, -1):
+            return None
+        x0, y0, x1, y1 = extents
+        channels = 1 if img.mode == "L" else 3
+        row_bytes = (x1 - x0) * channels
+        stride = stride or row_bytes
+        try:
+            data = np.memmap(image_path, dtype=np.uint8, mode="r", offset=offset, shape=(y1 - y0, stride))
+        except ValueError as e:  # Файл короче, чем заявлено в заголовке
+            raise PyramidError(f"Изображение повреждено: {e}")
+        data = data[:, :row_bytes]
+        if channels == 3:
+            data = data.reshape(y1 - y0, x1 - x0, 3)
+            order = _RAW_MODES[rawmode][1]
+            if order is not None:
+                data = data[..., order]
+        if orientation == -1:  # Строки снизу вверх (BMP)
+            data = data[::-1]
+        strips.append((extents, data))
+    return strips
+
+
+def _is_npy(image_path: str) -> bool:
+    """Файл .npy определяется по сигнатуре: в хранилище файлы лежат без расширения."""
+    with open(image_path, "rb") as f:
+        return f.read(len(_NPY_MAGIC)) == _NPY_MAGIC
+
+
+def _window(read_strip: Callable[[int, int], np.ndarray], height: int, width: int) -> Tuple[float, float]:
+    """
+    Окно яркости (нижний и верхний перцентили WINDOW_PERCENTILES) по равномерной
+    выборке пикселей: каждый step-й пиксель по обеим осям, полосами.
+    """
+    step = max(1, math.ceil(math.sqrt(height * width / WINDOW_SAMPLE_PIXELS)))
+    samples = []
+    for y in range(0, height, STRIP_ROWS):
+        strip = read_strip(y, min(y + STRIP_ROWS, height))
+        sample = np.asarray(strip[(-y) % step::step, ::step], dtype=np.float64).ravel()
+        samples.append(sample[np.isfinite(sample)])
+    values = np.concatenate(samples) if samples else np.empty(0)
+    if values.size == 0:
+        return 0.0, 1.0
+    low, high = np.percentile(values, WINDOW_PERCENTILES)
+    return float(low), float(high) if high > low else float(low) + 1.0
+
+
+def _to_uint8(strip: np.ndarray, window: Tuple[float, float]) -> np.ndarray:
+    low, high = window
+    scaled = (np.nan_to_num(np.asarray(strip, dtype=np.float32)) - low) * (255.0 / (high - low))
+    return np.round(np.clip(scaled, 0, 255)).astype(np.uint8)
+
+
+def _copy_strips(read_strip: Callable[[int, int], np.ndarray], shape: tuple, out_path: str,
+                 window: Optional[Tuple[float, float]] = None) -> np.memmap:
+    """Копирует уровень 0 полосами по STRIP_ROWS строк (с переводом в 8 бит по окну, если оно задано)."""
+    dst = np.lib.format.open_memmap(out_path, mode="w+", dtype=np.uint8, shape=shape)
+    for y in range(0, shape[0], STRIP_ROWS):
+        strip = read_strip(y, min(y + STRIP_ROWS, shape[0]))
+        dst[y:y + STRIP_ROWS] = strip if window is None else _to_uint8(strip, window)
+    dst.flush()
+    return dst
+
+
+def _write_level0(image_path: str, out_path: str) -> np.memmap:
+    """
+    Записывает уровень 0 (полное разрешение) в memmap-файл .npy.
+    Файлы .npy и несжатые растры отображаются в память напрямую и копируются
+    полосами; сжатые форматы Pillow декодирует целиком (до PYRAMID_MAX_DECODE_PIXELS).
+    16-битные и вещественные данные переводятся в 8 бит окном по перцентилям.
+    """
+    if _is_npy(image_path):
+        src = np.load(image_path, mmap_mode="r")
+        if src.ndim not in (2, 3) or not (np.issubdtype(src.dtype, np.number) or src.dtype == np.bool_) \
+                or np.issubdtype(src.dtype, np.complexfloating):
+            raise PyramidError("Ожидается числовой массив формы (H, W) или (H, W, C).")
+        read_strip = lambda y0, y1: src[y0:y1]  # noqa: E731
+        window = None if src.dtype == np.uint8 else _window(read_strip, *src.shape[:2])
+        return _copy_strips(read_strip, src.shape, out_path, window)
+
+    try:
+        img = Image.open(image_path)
+    except Image.DecompressionBombError as e:
+        raise PyramidError(f"Снимок слишком большой для Pillow ({e}). Загрузите его как .npy.")
+    except Exception as e:
+        raise PyramidError(f"Не удалось открыть изображение: {e}")
+
+    with img:
+        width, height = img.size
+        strips = _raw_strips(img, image_path)
+        if strips is not None:
+            shape = (height, width) if img.mode == "L" else (height, width, 3)
+            dst = np.lib.format.open_memmap(out_path, mode="w+", dtype=np.uint8, shape=shape)
+            for (x0, y0, x1, y1), data in strips:
+                for y in range(0, y1 - y0, STRIP_ROWS):
+                    dst[y0 + y:y0 + y + STRIP_ROWS, x0:x1] = data[y:y + STRIP_ROWS]
+            dst.flush()
+            return dst
+
+        if width * height > PYRAMID_MAX_DECODE_PIXELS:
+            raise PyramidError(
+                f"Снимок {width}x{height} в формате {img.format} декодируется только целиком и больше "
+                f"{PYRAMID_MAX_DECODE_PIXELS} пикселей. Загрузите его без сжатия (TIFF) или как .npy."
+            )
+        window = None
+        if img.mode in ("I", "F") or img.mode.startswith("I;16"):
+            window = _window(lambda y0, y1: np.asarray(img.crop((0, y0, width, y1))), height, width)
+        elif img.mode not in ("L", "RGB"):
+            img = img.convert("L" if img.mode == "1" else "RGB")
+        shape = (height, width, 3) if img.mode == "RGB" else (height, width)
+        return _copy_strips(lambda y0, y1: np.asarray(img.crop((0, y0, width, y1))), shape, out_path, window)
+
+
+def _downsample(src: np.ndarray, out_path: str) -> np.memmap:
+    """Строит следующий уровень (2x меньше) усреднением блоков 2x2, полосами."""
+    height, width = src.shape[:2]
+    out_h, out_w = (height + 1) // 2, (width + 1) // 2
+    dst = np.lib.format.open_memmap(out_path, mode="w+", dtype=np.uint8, shape=(out_h, out_w) + src.shape[2:])
+
+    for y in range(0, out_h, STRIP_ROWS // 2):
+        rows = min(STRIP_ROWS // 2, out_h - y)
+        block = np.asarray(src[2 * y:2 * (y + rows)], dtype=np.float32)
+        # Дополняем нечетные края повтором последней строки/столбца
+        pad = [(0, 2 * rows - block.shape[0]), (0, 2 * out_w - block.shape[1])] + [(0, 0)] * (block.ndim - 2)
+        block = np.pad(block, pad, mode="edge")
+        block = block.reshape((rows, 2, out_w, 2) + block.shape[2:]).mean(axis=(1, 3))
+        dst[y:y + rows] = np.round(block).astype(np.uint8)
+    dst.flush()
+    return dst
+
+
+def _build(image_path: str, directory: str) -> Dict[str, Any]:
+    levels = []
+    current = _write_level0(image_path, _level_path(directory, 0))
+    while True:
+        height, width = current.shape[:2]
+        levels.append({
+            "level": len(levels),
+            "width": width,
+            "height": height,
+            "cols": -(-width // TILE_SIZE),
+            "rows": -(-height // TILE_SIZE),
+        })
+        if max(width, height) <= TILE_SIZE:
+            break
+        current = _downsample(current, _level_path(directory, len(levels)))
+
+    thumbnail = Image.fromarray(np.asarray(current))
+    thumbnail.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+    thumbnail.save(os.path.join(directory, "thumbnail.png"))
+
+    meta = {
+        "version": PYRAMID_VERSION,
+        "width": levels[0]["width"],
+        "height": levels[0]["height"],
+        "channels": 1 if current.ndim == 2 else current.shape[2],
+        "tile_size": TILE_SIZE,
+        "levels": levels,
+    }
+    with open(os.path.join(directory, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    return meta
+
+
+def _discard_stale(digest: str) -> None:
+    """Убирает пирамиду старой версии (переименованием, чтобы не мешать читающим тайлы)."""
+    directory = pyramid_dir(digest)
+    if not os.path.isdir(directory):
+        return
+    stale = tempfile.mkdtemp(dir=PYRAMID_FOLDER, prefix=".stale-")
+    try:
+        os.replace(directory, os.path.join(stale, "old"))
+    except OSError:
+        pass  # Ее уже убрал другой процесс
+    shutil.rmtree(stale, ignore_errors=True)
+
+
+def ensure_pyramid(image_path: str, digest: str) -> Dict[str, Any]:
+    """
+    Строит пирамиду для изображения (если ее еще нет) и возвращает метаданные.
+    Сборка идет во временном каталоге, который затем атомарно переименовывается.
+    """
+    meta = load_meta(digest)
+    if meta is not None:
+        return meta
+
+    with _build_locks[int(digest[:8], 16) % BUILD_LOCK_STRIPES]:
+        meta = load_meta(digest)
+        if meta is not None:
+            return meta
+
+        os.makedirs(PYRAMID_FOLDER, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=PYRAMID_FOLDER, prefix=".build-")
+        try:
+            meta = _build(image_path, tmp_dir)
+            _discard_stale(digest)
+            os.replace(tmp_dir, pyramid_dir(digest))
+        except OSError:
+            # Другой процесс успел построить пирамиду
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            meta = load_meta(digest)
+            if meta is None:
+                raise
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+    return meta
+
+
+# --- Чтение ---
+def thumbnail_path(digest: str) -> str:
+    return os.path.join(pyramid_dir(digest), "thumbnail.png")
+
+
+def tile_etag(digest: str, level: int, x: int, y: int) -> str:
+    """Сильный ETag: содержимое тайла однозначно определяется SHA-256 исходника."""
+    return f'"{digest}-v{PYRAMID_VERSION}-{level}-{x}-{y}"'
+
+
+def read_tile(digest: str, meta: Dict[str, Any], level: int, x: int, y: int) -> bytes:
+    """
+    Возвращает PNG тайла. Из memmap уровня читается только окно тайла;
+    закодированный тайл кэшируется на диске рядом с пирамидой.
+    """
+    if level < 0 or level >= len(meta["levels"]):
+        raise TileNotFoundError("Уровень не существует.")
+    info = meta["levels"][level]
+    if x < 0 or y < 0 or x >= info["cols"] or y >= info["rows"]:
+        raise TileNotFoundError("Тайл не существует.")
+
+    directory = pyramid_dir(digest)
+    cached_path = os.path.join(directory, "tiles", str(level), f"{x}_{y}.png")
+    if os.path.exists(cached_path):
+        with open(cached_path, "rb") as f:
+            return f.read()
+
+    data = np.load(_level_path(directory, level), mmap_mode="r")
+    tile = np.ascontiguousarray(data[y * TILE_SIZE:(y + 1) * TILE_SIZE, x * TILE_SIZE:(x + 1) * TILE_SIZE])
+    buffer = io.BytesIO()
+    Image.fromarray(tile).save(buffer, format="PNG")
+    png = buffer.getvalue()
+
+    os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cached_path), prefix=".tile-")
+    with os.fdopen(fd, "wb") as f:
+        f.write(png)
+    os.replace(tmp_path, cached_path)
+    return png
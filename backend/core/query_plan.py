@@ -0,0 +1,45 @@
+# Файл: core/query_plan.py
+
+from contextlib import contextmanager
+from typing import List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# --- Проверка планов запросов SQLite (EXPLAIN QUERY PLAN) ---
+# Запрос считается проблемным, если читает таблицу целиком (SCAN без индекса)
+# или сортирует во временном B-дереве (ORDER BY не покрыт индексом).
+
+
+@contextmanager
+def capture_statements(engine: Engine):
+    """Собирает все SQL-запросы (текст и параметры), выполненные через engine."""
+    statements: List[Tuple[str, object]] = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def explain(engine: Engine, statement: str, parameters) -> List[str]:
+    """План запроса SQLite: строки вида 'SEARCH analyses USING INDEX ...'."""
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+    return [row[-1] for row in rows]
+
+
+def plan_problems(plan: List[str]) -> List[str]:
+    problems = []
+    for line in plan:
+        detail = line.strip()
+        if detail.startswith("SCAN ") and " USING " not in detail and "CONSTANT ROW" not in detail:
+            problems.append(f"полное чтение таблицы: {detail}")
+        elif detail.startswith("USE TEMP B-TREE"):
+            problems.append(f"сортировка без индекса: {detail}")
+    return problems
@@ -0,0 +1,187 @@
+# Файл: core/result_cache.py
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# --- Конфигурация кэша результатов CV ---
+# Количество результатов в памяти процесса (LRU)
+CV_CACHE_MEMORY_ITEMS = int(os.environ.get("CV_CACHE_MEMORY_ITEMS", "1024"))
+# Персистентный уровень: отдельный файл SQLite, общий для API и воркеров
+CV_CACHE_DB_PATH = os.environ.get("CV_CACHE_DB_PATH", "data/cache/cv_results.db")
+# Максимальный размер персистентного уровня (байты значений)
+CV_CACHE_MAX_BYTES = int(os.environ.get("CV_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+def make_key(image_digest: str, model_name: str, model_version: str, preprocess_config: Dict[str, Any]) -> str:
+    """Ключ кэша: (SHA-256 изображения, модель и ее версия, конфигурация предобработки)."""
+    config_json = json.dumps(preprocess_config, sort_keys=True)
+    config_hash = hashlib.sha256(config_json.encode()).hexdigest()[:16]
+    return f"{image_digest}:{model_name}:{model_version}:{config_hash}"
+
+
+class ResultCache:
+    """
+    Двухуровневый кэш результатов инференса:
+    LRU в памяти + SQLite на диске с вытеснением по суммарному размеру.
+    """
+
+    def __init__(self, db_path: str = CV_CACHE_DB_PATH, memory_items: int = CV_CACHE_MEMORY_ITEMS,
+                 max_bytes: int = CV_CACHE_MAX_BYTES):
+        self.db_path = db_path
+        self.memory_items = memory_items
+        self.max_bytes = max_bytes
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    # --- SQLite уровень ---
+    def _conn(self) -> sqlite3.Connection:
+        # Отдельное соединение на поток: sqlite3 не разрешает делить его между потоками
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cv_cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cv_cache_last_access ON cv_cache (last_access)")
+            # Суммарный размер значений ведется здесь, а не считается SUM(size) на каждую запись
+            conn.execute("CREATE TABLE IF NOT EXISTS cv_cache_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            if conn.execute("SELECT 1 FROM cv_cache_meta WHERE name = 'total_bytes'").fetchone() is None:
+                # Файл кэша прежней версии: один раз считаем размер по записям
+                conn.execute(
+                    "INSERT OR IGNORE INTO cv_cache_meta (name, value) "
+                    "SELECT 'total_bytes', COALESCE(SUM(size), 0) FROM cv_cache"
+                )
+            self._local.conn = conn
+        return conn
+
+    def _disk_get(self, key: str) -> Optional[Dict[str, Any]]:
+        conn = self._conn()
+        row = conn.execute("SELECT value FROM cv_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE cv_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def _disk_put(self, key: str, value: Dict[str, Any]) -> None:
+        conn = self._conn()
+        payload = json.dumps(value, ensure_ascii=False)
+        # Запись, изменение суммарного размера и вытеснение — одна транзакция
+        # (BEGIN IMMEDIATE: кэш пишут несколько процессов)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT size FROM cv_cache WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO cv_cache (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, payload, len(payload), time.time())
+            )
+            total = self._add_total(conn, len(payload) - (row[0] if row else 0))
+            if total > self.max_bytes:
+                self._evict(conn, total)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _add_total(self, conn: sqlite3.Connection, delta: int) -> int:
+        conn.execute("UPDATE cv_cache_meta SET value = value + ? WHERE name = 'total_bytes'", (delta,))
+        return conn.execute("SELECT value FROM cv_cache_meta WHERE name = 'total_bytes'").fetchone()[0]
+
+    def _evict(self, conn: sqlite3.Connection, total: int) -> None:
+        # Удаляем давно не использованные записи, пока не освободим 10% запаса
+        target = int(self.max_bytes * 0.9)
+        evicted = []
+        freed = 0
+        for key, size in conn.execute("SELECT key, size FROM cv_cache ORDER BY last_access"):
+            if total - freed <= target:
+                break
+            evicted.append((key,))
+            freed += size
+        conn.executemany("DELETE FROM cv_cache WHERE key = ?", evicted)
+        self._add_total(conn, -freed)
+
+    # --- Публичный интерфейс ---
+    def get(self, key: str, count_miss: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Ищет результат сначала в памяти, затем на диске.
+        count_miss=False — для предварительной проверки, после которой
+        последует еще один (учитываемый) поиск.
+        """
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return dict(value)
+
+        value = self._disk_get(key)
+        with self._lock:
+            if value is None:
+                if count_miss:
+                    self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._memory_put(key, value)
+        return dict(value)
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._memory_put(key, value)
+        self._disk_put(key, value)
+
+    def _memory_put(self, key: str, value: Dict[str, Any]) -> None:
+        self._memory[key] = dict(value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Счетчики попаданий и промахов — в памяти процесса (на запись в общий
+        файл на каждый поиск они не стоят), поэтому ответ помечен scope и pid;
+        размер дискового уровня — общий для всех процессов.
+        """
+        conn = self._conn()
+        disk_items = conn.execute("SELECT COUNT(*) FROM cv_cache").fetchone()[0]
+        disk_bytes = conn.execute("SELECT value FROM cv_cache_meta WHERE name = 'total_bytes'").fetchone()[0]
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "counters_scope": "process",
+                "process_id": os.getpid(),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "disk_items": disk_items,
+                "disk_bytes": disk_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# --- Общий кэш процесса ---
+_cache: Optional[ResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> ResultCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache()
+    return _cache
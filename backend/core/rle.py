@@ -0,0 +1,171 @@
+# Файл: core/rle.py
+
+import struct
+import zlib
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+import numpy as np
+
+# --- Компактное хранение масок сегментации (RLE) ---
+# Маска хранится как список горизонтальных отрезков (строка, начало, длина),
+# сжатый zlib. Отрезки не переходят через границу строки, поэтому площадь,
+# рамки и связные области считаются прямо по отрезкам, без плотного массива.
+_MAGIC = b"RLE1"
+_HEADER = struct.Struct("<4sIII")  # magic, height, width, количество отрезков
+
+
+class RunLengthMask(NamedTuple):
+    height: int
+    width: int
+    rows: np.ndarray  # Номер строки отрезка (uint32), по возрастанию
+    starts: np.ndarray  # Первый столбец отрезка
+    lengths: np.ndarray  # Длина отрезка (> 0)
+
+    @property
+    def area(self) -> int:
+        return int(self.lengths.sum())
+
+
+def encode(mask: np.ndarray) -> bytes:
+    """Кодирует двумерную бинарную маску в RLE."""
+    mask = np.asarray(mask, dtype=bool)
+    if mask.ndim != 2:
+        raise ValueError("Маска должна быть двумерной.")
+    height, width = mask.shape
+
+    # Переходы 0->1 и 1->0 в каждой строке (строки дополнены нулями по краям)
+    padded = np.zeros((height, width + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    rows, cols = np.nonzero(np.diff(padded, axis=1))
+    # Переходы в строке чередуются: начало, конец, начало, конец...
+    starts, ends = cols[0::2], cols[1::2]
+
+    header = _HEADER.pack(_MAGIC, height, width, starts.size)
+    body = np.concatenate([rows[0::2], starts, ends - starts]).astype("<u4").tobytes()
+    return zlib.compress(header + body)
+
+
+def decode(data: bytes) -> RunLengthMask:
+    """Разбирает RLE в массивы отрезков (без восстановления плотной маски)."""
+    raw = zlib.decompress(data)
+    magic, height, width, count = _HEADER.unpack_from(raw)
+    if magic != _MAGIC:
+        raise ValueError("Неизвестный формат маски.")
+    runs = np.frombuffer(raw, dtype="<u4", offset=_HEADER.size, count=3 * count).reshape(3, count)
+    return RunLengthMask(height, width, runs[0], runs[1], runs[2])
+
+
+def to_dense(rle: RunLengthMask) -> np.ndarray:
+    """Плотная маска (только для отладки и проверок)."""
+    mask = np.zeros((rle.height, rle.width), dtype=bool)
+    for row, start, length in zip(rle.rows, rle.starts, rle.lengths):
+        mask[row, start:start + length] = True
+    return mask
+
+
+# --- Связные области ---
+def _label_runs(rle: RunLengthMask) -> np.ndarray:
+    """
+    Номер связной области (4-связность) для каждого отрезка: отрезки соседних
+    строк, пересекающиеся по столбцам, объединяются (union-find).
+    """
+    count = rle.rows.size
+    parent = list(range(count))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    starts = rle.starts.tolist()
+    ends = (rle.starts + rle.lengths).tolist()
+    row_ptr = np.searchsorted(rle.rows, np.arange(rle.height + 1)).tolist()
+
+    for row in range(rle.height - 1):
+        i, i_end = row_ptr[row], row_ptr[row + 1]
+        j, j_end = row_ptr[row + 1], row_ptr[row + 2]
+        while i < i_end and j < j_end:
+            if starts[i] < ends[j] and starts[j] < ends[i]:
+                a, b = find(i), find(j)
+                if a != b:
+                    parent[max(a, b)] = min(a, b)
+            if ends[i] < ends[j]:
+                i += 1
+            else:
+                j += 1
+
+    return np.array([find(i) for i in range(count)], dtype=np.int64)
+
+
+def regions(rle: RunLengthMask) -> List[Dict[str, Any]]:
+    """
+    Статистика связных областей: площадь, рамка [x0, y0, x1, y1) и центр масс.
+    Отсортировано по убыванию площади.
+    """
+    if rle.rows.size == 0:
+        return []
+
+    _, labels = np.unique(_label_runs(rle), return_inverse=True)
+    n = int(labels.max()) + 1
+    rows = rle.rows.astype(np.int64)
+    starts = rle.starts.astype(np.int64)
+    lengths = rle.lengths.astype(np.int64)
+    ends = starts + lengths
+
+    area = np.bincount(labels, weights=lengths, minlength=n)
+    sum_x = np.bincount(labels, weights=lengths * starts + lengths * (lengths - 1) / 2, minlength=n)
+    sum_y = np.bincount(labels, weights=lengths * rows, minlength=n)
+
+    x0 = np.full(n, rle.width, dtype=np.int64)
+    y0 = np.full(n, rle.height, dtype=np.int64)
+    x1 = np.zeros(n, dtype=np.int64)
+    y1 = np.zeros(n, dtype=np.int64)
+    np.minimum.at(x0, labels, starts)
+    np.minimum.at(y0, labels, rows)
+    np.maximum.at(x1, labels, ends)
+    np.maximum.at(y1, labels, rows + 1)
+
+    result = [
+        {
+            "area": int(area[k]),
+            "bbox": [int(x0[k]), int(y0[k]), int(x1[k]), int(y1[k])],
+            "centroid": [round(float(sum_x[k] / area[k]), 2), round(float(sum_y[k] / area[k]), 2)],
+        }
+        for k in range(n)
+    ]
+    result.sort(key=lambda region: region["area"], reverse=True)
+    return result
+
+
+# --- Наложение маски ---
+def render_overlay(rle: RunLengthMask, width: int, height: int,
+                   color: Tuple[int, int, int, int] = (255, 0, 0, 110)) -> np.ndarray:
+    """
+    Рисует маску в разрешении width x height (RGBA, ближайший сосед).
+    Каждый отрезок переносится в выходные координаты как прямоугольник,
+    который закрашивается через двумерный массив разностей — память
+    расходуется только на выходное изображение.
+    """
+    rows = rle.rows.astype(np.int64)
+    starts = rle.starts.astype(np.int64)
+    ends = starts + rle.lengths.astype(np.int64)
+
+    # Выходной пиксель t берет исходный floor(t * src / dst); диапазон t для [a, b) — [ceil(a*dst/src), ceil(b*dst/src))
+    tx0 = -(-starts * width // rle.width)
+    tx1 = -(-ends * width // rle.width)
+    ty0 = -(-rows * height // rle.height)
+    ty1 = -(-(rows + 1) * height // rle.height)
+    keep = (tx0 < tx1) & (ty0 < ty1)
+    tx0, tx1, ty0, ty1 = tx0[keep], tx1[keep], ty0[keep], ty1[keep]
+
+    diff = np.zeros((height + 1, width + 1), dtype=np.int32)
+    np.add.at(diff, (ty0, tx0), 1)
+    np.add.at(diff, (ty0, tx1), -1)
+    np.add.at(diff, (ty1, tx0), -1)
+    np.add.at(diff, (ty1, tx1), 1)
+    covered = diff.cumsum(axis=0).cumsum(axis=1)[:height, :width] > 0
+
+    overlay = np.zeros((height, width, 4), dtype=np.uint8)
+    overlay[covered] = color
+    return overlay
@@ -4,15 +4,15 @@ import os
 from datetime import datetime, timedelta
 from typing import Optional
 
-from passlib.context import CryptContext
 from jose import jwt, JWTError
 
 # --- НОВЫЕ ИМПОРТЫ для get_current_user ---
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
 from crud import user_crud
+from core import passwords, user_cache
 from models import pydantic_models
 
 
@@ -24,8 +24,8 @@ SECRET_KEY = os.environ.get("SECRET_KEY", "very_secret_key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # Токен истекает через 24 часа
 
-# Контекст для хеширования паролей
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Контекст для хеширования паролей (стоимость bcrypt и пул — в core/passwords.py)
+pwd_context = passwords.pwd_context
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="v1/auth/token")
 
 
@@ -73,7 +73,7 @@ def decode_access_token(token: str):
 # Файл: core/security.py (ИСПРАВЛЕНИЕ ТИПА В get_current_user)
 
 async def get_current_user(
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         token: str = Depends(oauth2_scheme)
 ) -> pydantic_models.User:
     """
@@ -100,10 +100,19 @@ async def get_current_user(
         # Если 'sub' не является числом, это ошибка токена
         raise credentials_exception
 
-    # 2. Получение пользователя из БД (теперь user_id - это int)
-    user = user_crud.get_user_by_id(db, user_id=user_id)
+    # 2. Пользователь из кэша процесса; при промахе — из БД
+    cache = user_cache.get_cache()
+    await cache.sync(db)  # Сбросы из других процессов (не чаще раза в секунду)
+    user = cache.get(user_id)
     if user is None:
-        raise credentials_exception
-
-    # Преобразование в Pydantic модель для возврата
-    return pydantic_models.User.model_validate(user)
\ No newline at end of file
+        generation = cache.generation()
+        db_user = await user_crud.get_user_by_id_async(db, user_id=user_id)
+        if db_user is None:
+            raise credentials_exception
+        # Преобразование в Pydantic модель для возврата
+        user = pydantic_models.User.model_validate(db_user)
+        cache.put(user, generation)
+
+    if not user.is_active:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Учетная запись отключена.")
+    return user
@@ -0,0 +1,211 @@
+# Файл: core/sql_profiler.py
+#
+# Профилировщик SQL по HTTP-запросам (включается явно, SQL_PROFILER):
+# все запросы к БД, выполненные во время HTTP-запроса, с временем каждого.
+# Запросы одной формы (тот же SQL с точностью до параметров и длины списка
+# IN), повторенные SQL_PROFILER_NPLUS1 раз и больше, отмечаются как N+1 —
+# обычно это ленивая загрузка связи (Analysis.diagnostician, Analysis.patient)
+# в цикле или при сериализации ответа без joinedload.
+# Параметры запросов не записываются: в них данные пациентов.
+#
+# Режимы:
+#     off    — выключен (по умолчанию), событий SQLAlchemy нет
+#     log    — заголовки X-SQL-Queries / X-SQL-Time-Ms в ответе и отчет
+#              в журнал по запросам с N+1 или сверх бюджета
+#     strict — как log, но превышение бюджета запросов или N+1 завершается
+#              исключением QueryBudgetExceeded (для тестов и manage check-queries)
+
+import collections
+import contextvars
+import os
+import re
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# --- Конфигурация ---
+SQL_PROFILER = os.environ.get("SQL_PROFILER", "off")
+# С какого числа повторов одной формы запроса за HTTP-запрос это N+1
+SQL_PROFILER_NPLUS1 = int(os.environ.get("SQL_PROFILER_NPLUS1", "3"))
+# Бюджет запросов к БД для маршрутов без своего бюджета в QUERY_BUDGETS
+SQL_PROFILER_DEFAULT_BUDGET = int(os.environ.get("SQL_PROFILER_DEFAULT_BUDGET", "10"))
+# Сколько последних профилей хранить для отчетов (bench/load.py --sql-profile)
+SQL_PROFILER_KEEP = int(os.environ.get("SQL_PROFILER_KEEP", "10000"))
+
+MODES = ("off", "log", "strict")
+
+# Бюджеты запросов к БД по маршрутам ("МЕТОД шаблон"): запросы обработчика
+# плюс два запроса проверки токена (при промахе кэша пользователей, см.
+# core/user_cache.py). Рост — повод найти лишний запрос или N+1
+QUERY_BUDGETS: Dict[str, int] = {
+    "POST /v1/auth/token": 2,
+    "GET /v1/analyses/my_history": 3,
+    "GET /v1/analyses/{analysis_id}": 3,
+    "POST /v1/analyses/upload_analysis": 9,
+    "POST /v1/analyses/{analysis_id}/confirm": 7,
+    "POST /v1/patients/analyses/{analysis_id}/prescribe": 6,
+    "GET /v1/patients/{medical_record_number}/history": 5,
+    "GET /v1/admin/model/feedback_metrics": 3,
+}
+
+_IN_LIST = re.compile(r"\?(?:, \?)+")
+_VALUES_ROWS = re.compile(r"(\([^()]*\))(?:, \1)+")
+_NUMBER = re.compile(r"\b\d+\b")
+_SPACES = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(AssertionError):
+    """HTTP-запрос выполнил больше запросов к БД, чем разрешено, или N+1 (режим strict)."""
+
+
+def statement_shape(statement: str) -> str:
+    """Форма запроса: без лишних пробелов, числа и списки параметров свернуты."""
+    shape = _SPACES.sub(" ", statement).strip()
+    shape = _IN_LIST.sub("?…", shape)
+    shape = _VALUES_ROWS.sub(r"\1, …", shape)
+    return _NUMBER.sub("N", shape)
+
+
+class RequestProfile:
+    """Запросы к БД одного HTTP-запроса: (форма, секунды) в порядке выполнения."""
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.route: Optional[str] = None  # Шаблон маршрута (известен после обработки)
+        self.status = 0
+        self.statements: list = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def key(self) -> str:
+        return f"{self.method} {self.route or self.path}"
+
+    @property
+    def db_seconds(self) -> float:
+        return sum(seconds for _, seconds in self.statements)
+
+    @property
+    def budget(self) -> int:
+        return QUERY_BUDGETS.get(self.key, SQL_PROFILER_DEFAULT_BUDGET)
+
+    def repeated(self) -> Dict[str, int]:
+        """Формы запросов, повторенные SQL_PROFILER_NPLUS1 раз и больше (N+1)."""
+        counts = collections.Counter(shape for shape, _ in self.statements)
+        return {shape: count for shape, count in counts.items() if count >= SQL_PROFILER_NPLUS1}
+
+    def problems(self) -> List[str]:
+        problems = [f"N+1: {count} x {shape[:200]}" for shape, count in self.repeated().items()]
+        if len(self.statements) > self.budget:
+            problems.append(f"запросов к БД {len(self.statements)} при бюджете {self.budget}")
+        return problems
+
+    def report(self) -> str:
+        lines = [f"SQL {self.key} -> {self.status}: {len(self.statements)} запросов, "
+                 f"{self.db_seconds * 1000:.1f} мс в БД из {self.elapsed * 1000:.1f} мс"]
+        lines += [f"    ! {problem}" for problem in self.problems()]
+        lines += [f"    {seconds * 1000:7.2f} мс  {shape[:200]}" for shape, seconds in self.statements]
+        return "\n".join(lines)
+
+
+# Профиль текущего HTTP-запроса. Объект общий для всех копий контекста:
+# потоки run_in_threadpool и гринлеты AsyncSession.run_sync пишут в него же
+_current: contextvars.ContextVar[Optional[RequestProfile]] = contextvars.ContextVar("sql_profile", default=None)
+# Последние профили (для отчетов по прогону)
+profiles: collections.deque = collections.deque(maxlen=SQL_PROFILER_KEEP)
+_instrumented = False
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _current.get() is not None:
+        context._profiler_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    started = getattr(context, "_profiler_started", None)
+    if profile is not None and started is not None:
+        profile.statements.append((statement_shape(statement), time.perf_counter() - started))
+
+
+def instrument_db() -> None:
+    """Подписывается на выполнение запросов всеми движками SQLAlchemy (один раз на процесс)."""
+    global _instrumented
+    if _instrumented:
+        return
+    _instrumented = True
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class SQLProfilerMiddleware:
+    """ASGI middleware: профиль запросов к БД на каждый HTTP-запрос (см. режимы выше)."""
+
+    def __init__(self, app, mode: str = SQL_PROFILER):
+        if mode not in MODES:
+            raise ValueError(f"SQL_PROFILER: ожидается одно из {MODES}, получено {mode!r}")
+        self.app = app
+        self.mode = mode
+        self._reported: set = set()  # Маршруты, о которых уже есть отчет в журнале (режим log)
+        instrument_db()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        profile = RequestProfile(scope["method"], scope["path"])
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                # Запросы до начала ответа (у потоковых ответов — без выгрузки тела)
+                profile.status = message["status"]
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"x-sql-queries", str(len(profile.statements)).encode()),
+                    (b"x-sql-time-ms", f"{profile.db_seconds * 1000:.2f}".encode()),
+                ]
+            await send(message)
+
+        token = _current.set(profile)
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            _current.reset(token)
+            profile.elapsed = time.perf_counter() - profile.started
+            route = scope.get("route")  # Выставляет маршрутизатор FastAPI
+            profile.route = getattr(route, "path", None)
+            profiles.append(profile)
+
+        problems = profile.problems()
+        if not problems:
+            return
+        if self.mode == "strict":
+            print(profile.report())
+            raise QueryBudgetExceeded(f"{profile.key}: {'; '.join(problems)}")
+        if profile.key not in self._reported:  # Под нагрузкой — один отчет на маршрут
+            self._reported.add(profile.key)
+            print(profile.report())
+
+
+def summary(request_profiles=None) -> Dict[str, dict]:
+    """Сводка по маршрутам: число запросов к БД (медиана и максимум), время в БД, N+1 и бюджет."""
+    by_key: Dict[str, list] = collections.defaultdict(list)
+    for profile in list(profiles if request_profiles is None else request_profiles):
+        by_key[profile.key].append(profile)
+    rows = {}
+    for key, items in sorted(by_key.items()):
+        counts = sorted(len(p.statements) for p in items)
+        db_ms = sorted(p.db_seconds * 1000 for p in items)
+        rows[key] = {
+            "requests": len(items),
+            "queries_p50": counts[len(counts) // 2],
+            "queries_max": counts[-1],
+            "db_ms_p50": round(db_ms[len(db_ms) // 2], 2),
+            "nplus1": sum(1 for p in items if p.repeated()),
+            "over_budget": sum(1 for p in items if len(p.statements) > p.budget),
+            "budget": items[0].budget,
+        }
+    return rows
@@ -0,0 +1,489 @@
+# Файл: core/storage.py
+
+import asyncio
+import contextlib
+import fcntl
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+from fastapi import UploadFile
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from sqlalchemy.orm import Session
+
+from core import metrics, pyramid
+from crud import blob_crud
+
+# --- Конфигурация хранилища ---
+# Файлы хранятся по SHA-256 содержимого: data/uploads/ab/cd/<digest>
+# (без расширения: одно содержимое — один файл, как бы его ни назвали при загрузке)
+# В реальной жизни лучше использовать S3 или сетевое хранилище.
+UPLOAD_FOLDER = "data/uploads"
+CHUNK_SIZE = 1024 * 1024  # Чтение по 1MB
+# Максимальный размер загружаемого файла (байты)
+MAX_UPLOAD_SIZE = int(os.environ.get("MAX_UPLOAD_SIZE", str(1024 * 1024 * 1024)))
+# Потоки для файловых операций (запись на диск не выполняется в event loop)
+UPLOAD_IO_THREADS = int(os.environ.get("UPLOAD_IO_THREADS", "4"))
+# Максимальное количество файлов в одной пакетной загрузке (включая содержимое ZIP)
+BULK_MAX_FILES = int(os.environ.get("BULK_MAX_FILES", "500"))
+# Суммарный размер распакованного содержимого ZIP-архива (байты)
+BULK_MAX_TOTAL_SIZE = int(os.environ.get("BULK_MAX_TOTAL_SIZE", str(4 * 1024 * 1024 * 1024)))
+# Максимальная степень сжатия файла архива (защита от zip-бомб);
+# файлы меньше CHUNK_SIZE не проверяются: маленькие файлы могут сжиматься сильнее
+BULK_MAX_COMPRESSION_RATIO = int(os.environ.get("BULK_MAX_COMPRESSION_RATIO", "200"))
+# Частично загруженные файлы возобновляемых сессий (см. api/v1/uploads.py)
+SESSION_FOLDER = "data/upload_sessions"
+
+
+class StoredUpload(NamedTuple):
+    path: str  # Путь к blob на диске
+    digest: str  # SHA-256 (hex)
+    size: int  # Размер в байтах
+    created: bool  # False, если такой файл уже был в хранилище
+
+
+class UploadTooLargeError(ValueError):
+    """Файл превышает MAX_UPLOAD_SIZE (распакованный архив — BULK_MAX_TOTAL_SIZE)."""
+
+
+class SessionFileLockError(RuntimeError):
+    """Файл сессии загрузки занят (пишется блок или идет завершение) или уже перенесен в хранилище."""
+
+
+class InvalidArchiveError(ValueError):
+    """Архив поврежден, содержит слишком много файлов или подозрительно сильно сжат."""
+
+
+_io_pool: Optional[ThreadPoolExecutor] = None
+_io_pool_lock = threading.Lock()
+
+
+def get_io_pool() -> ThreadPoolExecutor:
+    """Лениво создает пул потоков для файлового ввода-вывода."""
+    global _io_pool
+    if _io_pool is None:
+        with _io_pool_lock:
+            if _io_pool is None:
+                _io_pool = ThreadPoolExecutor(max_workers=UPLOAD_IO_THREADS, thread_name_prefix="upload-io")
+    return _io_pool
+
+
+def ensure_dirs() -> None:
+    """Создает каталоги хранилища (при запуске приложения)."""
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    os.makedirs(SESSION_FOLDER, exist_ok=True)
+
+
+def shutdown() -> None:
+    global _io_pool
+    with _io_pool_lock:
+        pool, _io_pool = _io_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+
+def blob_path(digest: str) -> str:
+    """Путь к файлу в хранилище по его SHA-256."""
+    return os.path.join(UPLOAD_FOLDER, digest[:2], digest[2:4], digest)
+
+
+def _start_grace(path: Optional[str]) -> None:
+    """
+    Обновляет mtime файла, у которого удалена запись blob: сборщик удалит его
+    не раньше чем через min_age (до тех пор загрузка того же содержимого
+    может вернуть ему запись).
+    """
+    if path and os.path.exists(path):
+        os.utime(path)
+
+
+def _move_into_store(src_path: str, digest: str, size: int, existing_path: Optional[str]) -> StoredUpload:
+    """
+    Переносит готовый файл в хранилище (атомарный rename) либо удаляет его,
+    если такое содержимое уже есть. Если запись blob есть, а файл утерян,
+    он восстанавливается по тому же пути.
+    """
+    if existing_path is not None and os.path.exists(existing_path):
+        os.remove(src_path)
+        return StoredUpload(existing_path, digest, size, created=False)
+
+    path = existing_path or blob_path(digest)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(src_path, path)
+    return StoredUpload(path, digest, size, created=True)
+
+
+class BlobWriter:
+    """
+    Однопроходная запись файла в хранилище: каждый блок одновременно
+    хешируется, учитывается в лимите размера и пишется во временный файл.
+    После завершения временный файл атомарно переименовывается в blob
+    (или удаляется, если такое содержимое уже есть в хранилище).
+    Все методы блокирующие — вызываются в потоке ввода-вывода.
+    kind — метка метрик загрузок: "file" (тело запроса) или "archive" (файл из ZIP).
+    """
+
+    def __init__(self, max_size: int = MAX_UPLOAD_SIZE, kind: str = "file"):
+        self.max_size = max_size
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.labels = (kind,)
+        self.started = self.last_write = time.perf_counter()
+        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=UPLOAD_FOLDER, prefix=".upload-")
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self.size > self.max_size:
+            raise UploadTooLargeError(f"Файл превышает максимальный размер {self.max_size} байт.")
+        self.sha256.update(chunk)
+        self._file.write(chunk)
+        self.last_write = time.perf_counter()
+        metrics.UPLOAD_BYTES.inc(self.labels, len(chunk))
+
+    def finish(self) -> None:
+        """
+        Закрывает временный файл, когда запись завершена: до commit остается
+        только путь, и пакетная загрузка не держит открытым дескриптор на файл.
+        """
+        self._file.close()
+
+    def commit(self, existing_path: Optional[str]) -> StoredUpload:
+        """Закрывает временный файл и переносит его в хранилище."""
+        self.finish()
+        metrics.UPLOAD_FILES.inc(self.labels)
+        metrics.UPLOAD_SIZE.observe(self.size, self.labels)
+        if self.last_write > self.started:
+            metrics.UPLOAD_THROUGHPUT.observe(self.size / (self.last_write - self.started), self.labels)
+        return _move_into_store(self.tmp_path, self.sha256.hexdigest(), self.size, existing_path)
+
+    def abort(self) -> None:
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+async def _write_upload(file: UploadFile) -> BlobWriter:
+    """Пишет загруженный файл во временный файл хранилища (SHA-256 + лимит размера)."""
+    loop = asyncio.get_running_loop()
+    pool = get_io_pool()
+    writer = await loop.run_in_executor(pool, BlobWriter)
+    try:
+        while chunk := await file.read(CHUNK_SIZE):
+            await loop.run_in_executor(pool, writer.write, chunk)
+        await loop.run_in_executor(pool, writer.finish)
+    except BaseException:
+        await loop.run_in_executor(pool, writer.abort)
+        raise
+    return writer
+
+
+async def save_upload(db: AsyncSession, file: UploadFile) -> StoredUpload:
+    """
+    Сохраняет загруженный файл в контентно-адресуемое хранилище за один проход
+    (SHA-256 + лимит размера + запись во временный файл) без блокировки event loop.
+    Если файл с таким содержимым уже есть, временный файл удаляется.
+    Счетчик ссылок увеличивается при создании анализа (см. analysis_crud.create_analysis).
+    """
+    writer = await _write_upload(file)
+    db_blob = await db.run_sync(blob_crud.get_blob, writer.sha256.hexdigest())
+    return await asyncio.get_running_loop().run_in_executor(
+        get_io_pool(), writer.commit, db_blob.path if db_blob else None
+    )
+
+
+# --- Пакетная загрузка: несколько файлов или ZIP-архив ---
+def _check_compression(info: zipfile.ZipInfo, size: int) -> None:
+    """Степень сжатия файла архива: по заголовку до распаковки и по фактически прочитанным байтам."""
+    if size > CHUNK_SIZE and size > max(info.compress_size, 1) * BULK_MAX_COMPRESSION_RATIO:
+        raise InvalidArchiveError(
+            f"Файл {info.filename} сжат сильнее чем в {BULK_MAX_COMPRESSION_RATIO} раз: архив отклонен."
+        )
+
+
+def _unpack_archive(src) -> list:
+    """
+    Потоково распаковывает ZIP: каждый файл архива блоками пишется в свой
+    BlobWriter (с хешированием и лимитом размера), без распаковки в память.
+    Кроме лимита на файл проверяются суммарный распакованный размер
+    (BULK_MAX_TOTAL_SIZE) и степень сжатия каждого файла — до распаковки по
+    заголовку и во время нее по прочитанным байтам (заголовку нельзя доверять).
+    Временный файл закрывается сразу после записи. Возвращает список
+    (BlobWriter, имя файла).
+    """
+    writers = []
+    total_size = 0
+    try:
+        with zipfile.ZipFile(src) as archive:
+            for info in archive.infolist():
+                name = os.path.basename(info.filename)
+                if info.is_dir() or not name or name.startswith(".") or "__MACOSX" in info.filename:
+                    continue
+                if len(writers) >= BULK_MAX_FILES:
+                    raise InvalidArchiveError(f"В архиве больше {BULK_MAX_FILES} файлов.")
+                if total_size + info.file_size > BULK_MAX_TOTAL_SIZE:
+                    raise UploadTooLargeError(
+                        f"Распакованный архив превышает максимальный размер {BULK_MAX_TOTAL_SIZE} байт."
+                    )
+                _check_compression(info, info.file_size)
+
+                writer = BlobWriter(kind="archive")
+                writers.append((writer, name))
+                with archive.open(info) as member:
+                    while chunk := member.read(CHUNK_SIZE):
+                        total_size += len(chunk)
+                        if total_size > BULK_MAX_TOTAL_SIZE:
+                            raise UploadTooLargeError(
+                                f"Распакованный архив превышает максимальный размер {BULK_MAX_TOTAL_SIZE} байт."
+                            )
+                        writer.write(chunk)
+                        _check_compression(info, writer.size)
+                writer.finish()
+    except zipfile.BadZipFile as e:
+        for writer, _ in writers:
+            writer.abort()
+        raise InvalidArchiveError(f"Некорректный ZIP-архив: {e}")
+    except BaseException:
+        for writer, _ in writers:
+            writer.abort()
+        raise
+    return writers
+
+
+async def _commit_writers(db: AsyncSession, writers: list) -> list[tuple[StoredUpload, str]]:
+    """Переносит записанные файлы в хранилище (одним запросом проверяя существующие blob)."""
+    loop = asyncio.get_running_loop()
+    pool = get_io_pool()
+    existing = await db.run_sync(blob_crud.get_blob_paths, [writer.sha256.hexdigest() for writer, _ in writers])
+
+    stored = []
+    for writer, filename in writers:
+        result = await loop.run_in_executor(pool, writer.commit, existing.get(writer.sha256.hexdigest()))
+        stored.append((result, filename))
+    return stored
+
+
+async def save_archive(db: AsyncSession, file: UploadFile) -> list[tuple[StoredUpload, str]]:
+    """Сохраняет все файлы ZIP-архива в хранилище. Возвращает [(StoredUpload, имя файла)]."""
+    loop = asyncio.get_running_loop()
+    writers = await loop.run_in_executor(get_io_pool(), _unpack_archive, file.file)
+    return await _commit_writers(db, writers)
+
+
+async def save_uploads(db: AsyncSession, files: list[UploadFile]) -> list[tuple[StoredUpload, str]]:
+    """
+    Сохраняет несколько загруженных файлов: запись — параллельно (в пуле
+    ввода-вывода), проверка существующих blob — одним запросом к БД
+    (AsyncSession не допускает параллельных запросов).
+    """
+    if len(files) > BULK_MAX_FILES:
+        raise InvalidArchiveError(f"Больше {BULK_MAX_FILES} файлов в одном запросе.")
+    results = await asyncio.gather(*(_write_upload(file) for file in files), return_exceptions=True)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        loop = asyncio.get_running_loop()
+        for result in results:
+            if isinstance(result, BlobWriter):
+                await loop.run_in_executor(get_io_pool(), result.abort)
+        raise errors[0]
+    return await _commit_writers(db, [(writer, file.filename) for writer, file in zip(results, files)])
+
+
+# --- Возобновляемые загрузки: сборка файла из блоков ---
+_SESSION_LABELS = ("session",)  # Метка метрик: скорость — по отдельным блокам (PUT)
+
+
+def session_file_path(session_id: str) -> str:
+    return os.path.join(SESSION_FOLDER, f"{session_id}.part")
+
+
+def _create_session_file(path: str, total_size: int) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.truncate(total_size)  # Разреженный файл нужного размера
+
+
+def _lock_session_file(path: str, exclusive: bool) -> int:
+    """
+    Открывает файл сессии и берет на него flock без ожидания: разделяемый —
+    на запись блока, исключительный — на завершение. Возвращает дескриптор.
+    """
+    try:
+        fd = os.open(path, os.O_RDWR)
+    except FileNotFoundError:
+        raise SessionFileLockError("Сессия загрузки уже завершена.")
+    try:
+        fcntl.flock(fd, (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | fcntl.LOCK_NB)
+        # Пока файл открывался, завершение могло перенести его в хранилище
+        if os.fstat(fd).st_ino != os.stat(path).st_ino:
+            raise FileNotFoundError(path)
+    except BlockingIOError:
+        os.close(fd)
+        raise SessionFileLockError(
+            "Сессия загрузки завершается." if not exclusive else "Идет загрузка блока, повторите завершение позже."
+        )
+    except FileNotFoundError:
+        os.close(fd)
+        raise SessionFileLockError("Сессия загрузки уже завершена.")
+    return fd
+
+
+def _hash_file(path: str) -> tuple[str, int]:
+    sha256 = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            sha256.update(chunk)
+            size += len(chunk)
+    return sha256.hexdigest(), size
+
+
+async def create_session_file(session_id: str, total_size: int) -> str:
+    path = session_file_path(session_id)
+    await asyncio.get_running_loop().run_in_executor(get_io_pool(), _create_session_file, path, total_size)
+    return path
+
+
+@contextlib.asynccontextmanager
+async def lock_session_file(session_id: str, exclusive: bool = False):
+    """
+    Блокировка файла сессии (flock, действует и между процессами): запись
+    блока держит разделяемую, завершение — исключительную, поэтому байты
+    блока не попадут в файл, который уже хешируется или перенесен в
+    хранилище. Если файл занят или его уже нет — SessionFileLockError.
+    Возвращает дескриптор файла для write_session_chunk.
+    """
+    loop = asyncio.get_running_loop()
+    fd = await loop.run_in_executor(get_io_pool(), _lock_session_file, session_file_path(session_id), exclusive)
+    try:
+        yield fd
+    finally:
+        os.close(fd)  # Снимает блокировку
+
+
+async def write_session_chunk(fd: int, offset: int, stream, expected_size: int) -> int:
+    """
+    Пишет блок из асинхронного потока (тело запроса) в файл сессии
+    (дескриптор из lock_session_file) по смещению, не буферизуя блок
+    целиком. Возвращает число записанных байт.
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_io_pool()
+    written = 0
+    started = time.perf_counter()
+    async for data in stream:
+        if not data:
+            continue
+        if written + len(data) > expected_size:
+            raise UploadTooLargeError(f"Блок больше ожидаемого размера {expected_size} байт.")
+        await loop.run_in_executor(pool, os.pwrite, fd, data, offset + written)
+        written += len(data)
+    metrics.UPLOAD_BYTES.inc(_SESSION_LABELS, written)
+    if written:
+        metrics.UPLOAD_THROUGHPUT.observe(written / (time.perf_counter() - started), _SESSION_LABELS)
+    return written
+
+
+async def finalize_session_file(db: AsyncSession, session_id: str) -> StoredUpload:
+    """
+    Хеширует собранный файл сессии и переносит его в контентно-адресуемое
+    хранилище. Вызывается под исключительной блокировкой (lock_session_file).
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_io_pool()
+    path = session_file_path(session_id)
+    digest, size = await loop.run_in_executor(pool, _hash_file, path)
+    metrics.UPLOAD_FILES.inc(_SESSION_LABELS)
+    metrics.UPLOAD_SIZE.observe(size, _SESSION_LABELS)
+
+    db_blob = await db.run_sync(blob_crud.get_blob, digest)
+    return await loop.run_in_executor(pool, _move_into_store, path, digest, size,
+                                      db_blob.path if db_blob else None)
+
+
+async def delete_session_file(session_id: str) -> None:
+    path = session_file_path(session_id)
+    if os.path.exists(path):
+        await asyncio.get_running_loop().run_in_executor(get_io_pool(), os.remove, path)
+
+
+# --- Сборка мусора хранилища (python -m manage sweep-blobs) ---
+def _orphan_files(db: Session, directory: str, names: list[str], cutoff: float) -> list[str]:
+    """Файлы каталога хранилища старше cutoff, для которых нет записи blob с тем же путем."""
+    candidates = {}
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                # Имя файла — SHA-256 (у файлов старых версий — с расширением), у временных — ".upload-*"
+                candidates[path] = name.split(".", 1)[0]
+        except FileNotFoundError:
+            continue
+    known = blob_crud.get_blob_paths(db, list(set(candidates.values())))
+    return [
+        path for path, digest in candidates.items()
+        if digest not in known or os.path.normpath(known[digest]) != os.path.normpath(path)
+    ]
+
+
+def sweep_orphans(db: Session, min_age_seconds: float, dry_run: bool = False) -> dict:
+    """
+    Удаляет записи blob, на которые не ссылается ни один анализ, а также файлы
+    хранилища и пирамиды тайлов без записи blob (файл перенесен в хранилище,
+    но анализ не создан: ошибка или прерванная загрузка).
+
+    Файлы удаляются только спустя min_age_seconds без записи: файл, чья запись
+    удалена в этом проходе, получает свежий mtime и удаляется следующими
+    проходами. Пока файл на диске, загрузка того же содержимого может найти
+    blob, удалить свой временный файл и снова записать ссылку — при удалении
+    файла сразу вместе с записью анализ остался бы без снимка. Возвращает
+    количество удаленного.
+    """
+    removed = {"blobs": 0, "files": 0, "pyramids": 0}
+
+    unreferenced = blob_crud.delete_unreferenced_blobs(db)
+    if dry_run:
+        db.rollback()
+    else:
+        db.commit()
+        for _, path in unreferenced:
+            _start_grace(path)
+    removed["blobs"] = len(unreferenced)
+
+    cutoff = time.time() - min_age_seconds
+    for directory, _, names in os.walk(UPLOAD_FOLDER):
+        for path in _orphan_files(db, directory, names, cutoff):
+            if not dry_run:
+                try:
+                    # Загрузка могла только что записать файл заново (os.replace)
+                    if os.path.getmtime(path) >= cutoff:
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+            removed["files"] += 1
+
+    if os.path.isdir(pyramid.PYRAMID_FOLDER):
+        # Пирамида удаляется вместе с исходным файлом, а не раньше него
+        digests = [
+            name for name in os.listdir(pyramid.PYRAMID_FOLDER)
+            if os.path.getmtime(pyramid.pyramid_dir(name)) < cutoff
+            and not os.path.exists(blob_path(name))
+        ]
+        for chunk_start in range(0, len(digests), 500):
+            chunk = digests[chunk_start:chunk_start + 500]
+            known = blob_crud.get_blob_paths(db, chunk)
+            for digest in chunk:
+                if digest not in known:
+                    if not dry_run:
+                        shutil.rmtree(pyramid.pyramid_dir(digest), ignore_errors=True)
+                    removed["pyramids"] += 1
+    return removed
@@ -0,0 +1,198 @@
+# Файл: core/tasks.py
+
+import os
+import socket
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from database import SessionLocal
+from crud import analysis_crud, job_crud
+from core import metrics, pyramid
+
+# --- Конфигурация выполнения CV ---
+# inprocess: API-процесс сам выполняет задачи из очереди во встроенном воркере
+# queue: API только ставит задачи в очередь, их выполняют процессы `python -m worker`
+INFERENCE_MODE = os.environ.get("INFERENCE_MODE", "inprocess")
+# Количество потоков, одновременно ожидающих инференс. Должно быть не меньше
+# CV_MAX_BATCH_SIZE, иначе движок микро-батчинга не сможет собрать полный батч.
+CV_MAX_WORKERS = int(os.environ.get("CV_MAX_WORKERS", "16"))
+# Срок аренды задачи: после него задачу может забрать другой воркер
+CV_JOB_LEASE_SECONDS = int(os.environ.get("CV_JOB_LEASE_SECONDS", "300"))
+# Интервал опроса очереди, когда задач нет
+CV_POLL_INTERVAL = float(os.environ.get("CV_POLL_INTERVAL", "1.0"))
+
+
+def make_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class Worker:
+    """
+    Воркер очереди инференса: захватывает задачи из таблицы inference_jobs,
+    выполняет CV в ограниченном пуле потоков (чтобы движок батчинга собирал
+    батчи) и записывает результаты. Процессов-воркеров может быть сколько угодно.
+    """
+
+    def __init__(self, worker_id: Optional[str] = None, concurrency: int = CV_MAX_WORKERS,
+                 lease_seconds: int = CV_JOB_LEASE_SECONDS, poll_interval: float = CV_POLL_INTERVAL):
+        self.worker_id = worker_id or make_worker_id()
+        self.concurrency = max(1, concurrency)
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="cv-worker")
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        # Задачи, захваченные и еще выполняемые в пуле (занятые слоты)
+        self._in_flight = 0
+        self._slots_lock = threading.Lock()
+
+    def process_job(self, job_id: int, analysis_id: int) -> bool:
+        """
+        Выполняет одну задачу в собственной сессии БД. Результат CV и завершение
+        задачи записываются одной транзакцией; если аренду за это время забрал
+        другой воркер, ничего не записывается и пирамида не строится.
+        """
+        db = SessionLocal()
+        try:
+            analysis_crud.run_cv_for_analysis(db, analysis_id, job_id, self.worker_id)
+        except job_crud.LeaseLostError as e:
+            print(f"Результат анализа {analysis_id} отброшен: {e}")
+            return False
+        except Exception as e:
+            db.rollback()
+            print(f"Ошибка CV анализа {analysis_id} (задача {job_id}): {e}")
+            job_crud.fail_job(db, job_id, self.worker_id, str(e))
+            return False
+        else:
+            self.build_pyramid(db, analysis_id)
+            return True
+        finally:
+            db.close()
+
+    def build_pyramid(self, db, analysis_id: int) -> None:
+        """
+        Строит пирамиду тайлов для просмотрщика (один раз на содержимое файла).
+        Ошибка не влияет на анализ: тайлы будут построены по первому запросу.
+        """
+        analysis = analysis_crud.get_analysis_by_id(db, analysis_id)
+        if analysis is None or not analysis.image_digest:
+            return
+        try:
+            pyramid.ensure_pyramid(analysis.image_path, analysis.image_digest)
+        except Exception as e:
+            print(f"Пирамида для анализа {analysis_id} не построена: {e}")
+
+    def claim(self) -> list:
+        """
+        Захватывает задачи на свободные слоты пула и отдает их в пул, не дожидаясь
+        выполнения. Возвращает futures захваченных задач.
+        """
+        with self._slots_lock:
+            free = self.concurrency - self._in_flight
+        if free <= 0:
+            return []
+
+        db = SessionLocal()
+        try:
+            job_crud.reap_expired_jobs(db)
+            jobs = job_crud.claim_jobs(db, self.worker_id, limit=free, lease_seconds=self.lease_seconds)
+        finally:
+            db.close()
+
+        futures = []
+        for job in jobs:
+            with self._slots_lock:
+                self._in_flight += 1
+            future = self._pool.submit(self.process_job, job.id, job.analysis_id)
+            future.add_done_callback(self._release_slot)
+            futures.append(future)
+        return futures
+
+    def _release_slot(self, _future) -> None:
+        with self._slots_lock:
+            self._in_flight -= 1
+        self._wakeup.set()  # Слот освободился: run() сразу захватит следующую задачу
+
+    def run_once(self) -> int:
+        """Захватывает задачи на свободные слоты и дожидается их выполнения. Возвращает их количество."""
+        futures = self.claim()
+        for future in futures:
+            future.result()
+        return len(futures)
+
+    def run(self) -> None:
+        """
+        Основной цикл: работает до вызова stop(). Новая задача захватывается,
+        как только освобождается слот, а не после завершения всей порции.
+        """
+        try:
+            while not self._stop.is_set():
+                try:
+                    claimed = len(self.claim())
+                except Exception as e:
+                    print(f"Ошибка воркера {self.worker_id}: {e}")
+                    claimed = 0
+                if claimed == 0:
+                    self._wakeup.wait(self.poll_interval)
+                    self._wakeup.clear()
+        finally:
+            self._pool.shutdown(wait=True)
+
+    def wake(self) -> None:
+        """Будит воркер, не дожидаясь очередного опроса."""
+        self._wakeup.set()
+
+    def stop(self) -> None:
+        """Просит цикл run() завершиться; уже захваченные задачи будут выполнены."""
+        self._stop.set()
+        self._wakeup.set()
+
+
+def _active_jobs() -> dict:
+    db = SessionLocal()
+    try:
+        return {(job_status,): count for job_status, count in job_crud.count_active_jobs(db).items()}
+    finally:
+        db.close()
+
+
+# Общая очередь в БД: одинаковое значение в API и во всех воркерах
+metrics.GaugeFunction("inference_jobs", "Задачи очереди инференса в БД по статусам.", _active_jobs, ("status",))
+
+
+# --- Встроенный воркер API-процесса (режим inprocess) ---
+_worker: Optional[Worker] = None
+_worker_thread: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+
+
+def start() -> None:
+    """Запускает встроенный воркер (если INFERENCE_MODE == 'inprocess')."""
+    global _worker, _worker_thread
+    if INFERENCE_MODE != "inprocess":
+        return
+    with _worker_lock:
+        if _worker is None:
+            _worker = Worker()
+            _worker_thread = threading.Thread(target=_worker.run, name="cv-embedded-worker", daemon=True)
+            _worker_thread.start()
+
+
+def notify_new_jobs() -> None:
+    """Сообщает встроенному воркеру о новых задачах в очереди."""
+    start()
+    if _worker is not None:
+        _worker.wake()
+
+
+def shutdown() -> None:
+    """Останавливает встроенный воркер (при завершении приложения)."""
+    global _worker, _worker_thread
+    with _worker_lock:
+        worker, thread = _worker, _worker_thread
+        _worker, _worker_thread = None, None
+    if worker is not None:
+        worker.stop()
+        thread.join()
@@ -0,0 +1,154 @@
+# Файл: core/user_cache.py
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import pydantic_models, sql_models
+
+# --- Конфигурация кэша авторизованных пользователей ---
+# Сколько секунд пользователь из кэша считается актуальным (верхняя граница
+# устаревания, даже если сброс из другого процесса не дошел)
+USER_CACHE_TTL_SECONDS = float(os.environ.get("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAX_ITEMS = int(os.environ.get("USER_CACHE_MAX_ITEMS", "10000"))
+# Как часто процесс читает журнал user_invalidations (сбросы из других процессов)
+USER_CACHE_POLL_SECONDS = float(os.environ.get("USER_CACHE_POLL_SECONDS", "1"))
+# Сколько последних ID журнала перечитывается при каждом опросе: транзакции
+# фиксируются не в порядке ID, и запись с меньшим ID может стать видна позже
+USER_CACHE_SYNC_WINDOW = int(os.environ.get("USER_CACHE_SYNC_WINDOW", "100"))
+
+
+class UserCache:
+    """
+    LRU-кэш проверенных пользователей (pydantic User) по ID с TTL.
+
+    Изменение роли или блокировка пользователя записывается в таблицу
+    user_invalidations в той же транзакции (crud/user_crud.py) и сразу
+    сбрасывает запись в кэше своего процесса. Остальные процессы читают
+    журнал не чаще раза в USER_CACHE_POLL_SECONDS — в обычном случае
+    проверка пользователя сводится к поиску в словаре.
+    """
+
+    def __init__(self, ttl: float = USER_CACHE_TTL_SECONDS, max_items: int = USER_CACHE_MAX_ITEMS,
+                 poll_interval: float = USER_CACHE_POLL_SECONDS, sync_window: int = USER_CACHE_SYNC_WINDOW):
+        self.ttl = ttl
+        self.max_items = max_items
+        self.poll_interval = poll_interval
+        self.sync_window = sync_window
+        self._items: "OrderedDict[int, Tuple[float, pydantic_models.User]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Растет при каждом сбросе: запись, прочитанная из БД до сброса, не попадет в кэш
+        self._generation = 0
+        self._last_event_id: Optional[int] = None  # None — журнал еще не читался
+        self._seen_event_ids: set = set()  # Уже примененные записи в окне sync_window
+        self._last_poll = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    # --- Чтение и запись ---
+    def get(self, user_id: int) -> Optional[pydantic_models.User]:
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(user_id)
+            if item is None or item[0] <= now:
+                self.misses += 1
+                return None
+            self._items.move_to_end(user_id)
+            self.hits += 1
+            return item[1]
+
+    def generation(self) -> int:
+        return self._generation
+
+    def put(self, user: pydantic_models.User, generation: int) -> None:
+        """Кэширует пользователя, если с момента generation() не было сбросов."""
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._items[user.id] = (time.monotonic() + self.ttl, user)
+            self._items.move_to_end(user.id)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            self._items.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._items.clear()
+
+    # --- Сбросы из других процессов ---
+    async def sync(self, db: AsyncSession) -> None:
+        """
+        Применяет новые записи журнала user_invalidations. Запрос к БД —
+        не чаще раза в poll_interval; в остальных вызовах сразу возвращает.
+        Читаются записи начиная с (последний ID − sync_window): запись,
+        зафиксированная позже записи с большим ID, не пропускается, а уже
+        примененные отбрасываются по ID.
+        """
+        now = time.monotonic()
+        if now - self._last_poll < self.poll_interval:
+            return
+        stale = now - self._last_poll >= self.ttl
+        self._last_poll = now  # До await: параллельные запросы не опрашивают журнал повторно
+
+        UserInvalidation = sql_models.UserInvalidation
+        if self._last_event_id is None or stale:
+            # Первый опрос или долгий перерыв: все записи кэша и так истекли
+            last_id = await db.scalar(select(func.max(UserInvalidation.id))) or 0
+            self.clear()
+            self._last_event_id = last_id
+            self._seen_event_ids = set(await db.scalars(
+                select(UserInvalidation.id).filter(UserInvalidation.id > last_id - self.sync_window)
+            ))
+            return
+
+        rows = (await db.execute(
+            select(UserInvalidation.id, UserInvalidation.user_id)
+            .filter(UserInvalidation.id > self._last_event_id - self.sync_window)
+            .order_by(UserInvalidation.id)
+        )).all()
+        for event_id, user_id in rows:
+            if event_id in self._seen_event_ids:
+                continue
+            self._seen_event_ids.add(event_id)
+            self.invalidate(user_id)
+            self._last_event_id = max(self._last_event_id, event_id)
+        low = self._last_event_id - self.sync_window
+        self._seen_event_ids = {event_id for event_id in self._seen_event_ids if event_id > low}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "items": len(self._items),
+                "max_items": self.max_items,
+            }
+
+
+# --- Общий кэш процесса ---
+_cache: Optional[UserCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> UserCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = UserCache()
+    return _cache
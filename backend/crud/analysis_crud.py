@@ -1,9 +1,17 @@
 # Файл: crud/analysis_crud.py
 
+import asyncio
+import base64
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, joinedload
 from models import sql_models, pydantic_models
-from core import cv_stub
-from sqlalchemy import func  # Импорт функции для агрегации
+from core import cv_stub, storage
+from core.pagination import PAGE_SIZE_DEFAULT, encode_cursor
+from crud import job_crud, blob_crud, metrics_crud
+from database import run_write
+from sqlalchemy import func, or_, select, tuple_  # Импорт функции для агрегации
 
 
 # Получение пациента по MRN
@@ -11,6 +19,17 @@ def get_patient_by_mrn(db: Session, mrn: str):
     return db.query(sql_models.Patient).filter(sql_models.Patient.medical_record_number == mrn).first()
 
 
+def bump_history_version(db: Session, patient_id: int):
+    """
+    Отмечает изменение истории анализов пациента (в текущей транзакции):
+    закэшированные ответы GET /v1/patients/{mrn}/history и их ETag устаревают.
+    """
+    db.query(sql_models.Patient).filter(sql_models.Patient.id == patient_id).update(
+        {sql_models.Patient.history_version: sql_models.Patient.history_version + 1},
+        synchronize_session=False
+    )
+
+
 # --- НОВАЯ ФУНКЦИЯ: Создание пациента (для использования ниже) ---
 def create_patient(db: Session, mrn: str):
     """Создает новую запись пациента только с MRN."""
@@ -21,12 +40,23 @@ def create_patient(db: Session, mrn: str):
     return db_patient
 
 
-def create_analysis_and_run_cv(
+def create_analysis(
         db: Session,
         patient_mrn: str,
         diagnostician_id: int,
-        image_path: str
+        image_path: str,
+        enqueue: bool = True,
+        image_digest: str = None,
+        image_size: int = None,
+        cached_result: Optional[dict] = None
 ):
+    """
+    Создает запись об анализе в статусе 'queued' и задачу в очереди инференса
+    (в одной транзакции). Сам анализ CV выполняет воркер через run_cv_for_analysis.
+    Если передан image_digest, увеличивает счетчик ссылок на blob хранилища.
+    cached_result — результат из кэша CV (ищется до транзакции, см. create_analysis_async):
+    он сохраняется сразу, без задачи в очереди.
+    """
     # 1. Найти или создать пациента
     patient = get_patient_by_mrn(db, patient_mrn)
 
@@ -36,48 +66,251 @@ def create_analysis_and_run_cv(
         patient = create_patient(db, patient_mrn)
         # --------------------------------------------------------
 
-    # 2. Создать запись об анализе
+    # 2. Учесть ссылку на файл в хранилище
+    if image_digest is not None:
+        blob_crud.add_blob_reference(db, image_digest, image_path, image_size)
+
+    # 3. Создать запись об анализе
     db_analysis = sql_models.Analysis(
         patient_id=patient.id,
         diagnostician_id=diagnostician_id,
-        image_path=image_path
+        image_path=image_path,
+        image_digest=image_digest,
+        status=sql_models.ANALYSIS_STATUS_QUEUED
     )
     db.add(db_analysis)
+    db.flush()  # Получаем ID анализа для задачи
+
+    # 4. То же изображение уже анализировалось этой моделью: берем результат из кэша
+    if cached_result is not None:
+        db.add(_build_result(db_analysis.id, cached_result))
+        db_analysis.status = sql_models.ANALYSIS_STATUS_DONE
+    # 5. Иначе ставим задачу в персистентную очередь
+    elif enqueue:
+        job_crud.enqueue_job(db, db_analysis.id)
+    bump_history_version(db, patient.id)
     db.commit()
     db.refresh(db_analysis)
 
-    # 3. Запустить заглушку CV (остальное без изменений)
-    cv_result = cv_stub.run_cv_analysis(image_path)
+    return db_analysis
+
 
-    # 4. Сохранить результаты CV
-    db_result = sql_models.Result(
-        analysis_id=db_analysis.id,
+def create_analyses_bulk(
+        db: Session,
+        patient_mrn: str,
+        diagnostician_id: int,
+        images: list,
+        cached_results: Optional[dict] = None
+):
+    """
+    Пакетный вариант create_analysis для одного исследования:
+    пациент находится/создается один раз, все Analysis/Result/задачи очереди
+    вставляются пакетно в одной транзакции.
+    images — список (image_path, image_digest, image_size),
+    cached_results — {image_digest: результат из кэша CV}.
+    """
+    # 1. Найти или создать пациента (без отдельного commit)
+    patient = get_patient_by_mrn(db, patient_mrn)
+    if not patient:
+        print(f"Пациент с MRN {patient_mrn} не найден. Создаю нового пациента.")
+        patient = sql_models.Patient(medical_record_number=patient_mrn)
+        db.add(patient)
+        db.flush()
+
+    # 2. Ссылки на blob: по одному обновлению на уникальный файл
+    references = {}
+    for image_path, image_digest, image_size in images:
+        path, size, count = references.get(image_digest, (image_path, image_size, 0))
+        references[image_digest] = (path, size, count + 1)
+    for image_digest, (path, size, count) in references.items():
+        blob_crud.add_blob_reference(db, image_digest, path, size, count=count)
+
+    # 3. Все анализы одной пакетной вставкой
+    db_analyses = [
+        sql_models.Analysis(
+            patient_id=patient.id,
+            diagnostician_id=diagnostician_id,
+            image_path=image_path,
+            image_digest=image_digest,
+            status=sql_models.ANALYSIS_STATUS_QUEUED
+        )
+        for image_path, image_digest, _ in images
+    ]
+    db.add_all(db_analyses)
+    db.flush()
+    analysis_ids = [db_analysis.id for db_analysis in db_analyses]
+
+    # 4. Результаты из кэша CV сразу, остальное — задачами в очередь
+    db_results = []
+    for db_analysis in db_analyses:
+        cached_result = (cached_results or {}).get(db_analysis.image_digest)
+        if cached_result is not None:
+            db_results.append(_build_result(db_analysis.id, cached_result))
+            db_analysis.status = sql_models.ANALYSIS_STATUS_DONE
+        else:
+            job_crud.enqueue_job(db, db_analysis.id)
+    db.add_all(db_results)
+    bump_history_version(db, patient.id)
+    db.commit()
+
+    # Одним запросом обновляем объекты после commit (вместо refresh для каждого)
+    return (
+        db.query(sql_models.Analysis)
+        .filter(sql_models.Analysis.id.in_(analysis_ids))
+        .order_by(sql_models.Analysis.id)
+        .all()
+    )
+
+
+def _build_result(analysis_id: int, cv_result: dict):
+    """Создает запись Result из словаря результата CV."""
+    return sql_models.Result(
+        analysis_id=analysis_id,
         system_diagnosis=cv_result['system_diagnosis'],
-        system_segmentation_path=cv_result['segmentation_mask_path'],
+        segmentation_rle=base64.b64decode(cv_result['segmentation_rle']) if cv_result.get('segmentation_rle') else None,
+        model_version=cv_stub.get_model_version(),
         # is_confirmed и feedback_correct остаются по умолчанию
     )
-    db.add(db_result)
+
+
+def _complete_job(db: Session, job_id: Optional[int], worker_id: Optional[str]) -> None:
+    """
+    Помечает задачу очереди выполненной в текущей транзакции. Если аренду
+    уже забрал другой воркер — откат и LeaseLostError.
+    """
+    if job_id is not None and not job_crud.complete_job(db, job_id, worker_id):
+        db.rollback()
+        raise job_crud.LeaseLostError(f"Задача {job_id} больше не принадлежит воркеру {worker_id}.")
+
+
+def run_cv_for_analysis(db: Session, analysis_id: int, job_id: Optional[int] = None,
+                        worker_id: Optional[str] = None):
+    """
+    Запускает CV для уже созданного анализа и сохраняет результаты.
+    Обновляет статус: queued -> running -> done/failed.
+    Для задачи очереди (job_id, worker_id) результат записывается в одной
+    транзакции с завершением задачи и только пока аренда у этого воркера.
+    """
+    db_analysis = db.query(sql_models.Analysis).filter(sql_models.Analysis.id == analysis_id).first()
+    if not db_analysis:
+        _complete_job(db, job_id, worker_id)
+        db.commit()
+        return None
+
+    # Повторный запуск (например, после падения воркера до завершения задачи)
+    if db_analysis.results is not None:
+        db_analysis.status = sql_models.ANALYSIS_STATUS_DONE
+        _complete_job(db, job_id, worker_id)
+        db.commit()
+        return db_analysis
+
+    db_analysis.status = sql_models.ANALYSIS_STATUS_RUNNING
+    db.commit()
+
+    # 1. Запустить заглушку CV (или взять результат из кэша по SHA-256 изображения)
+    try:
+        cv_result = cv_stub.run_cv_analysis(db_analysis.image_path, db_analysis.image_digest)
+    except Exception as e:
+        # Статус задачи очереди (повтор или failed) выставит job_crud.fail_job
+        if job_id is None:
+            db_analysis.status = sql_models.ANALYSIS_STATUS_FAILED
+            db_analysis.error_message = str(e)
+            db.commit()
+        raise
+
+    # 2. Сохранить результаты CV (задача завершается первой: при потерянной
+    # аренде результат не вставляется вовсе)
+    _complete_job(db, job_id, worker_id)
+    db.add(_build_result(db_analysis.id, cv_result))
+    db_analysis.status = sql_models.ANALYSIS_STATUS_DONE
+    bump_history_version(db, db_analysis.patient_id)
     db.commit()
-    db.refresh(db_result)
+    db.refresh(db_analysis)
 
     return db_analysis
 
 
+def create_analysis_and_run_cv(
+        db: Session,
+        patient_mrn: str,
+        diagnostician_id: int,
+        image_path: str
+):
+    """
+    Синхронный вариант: создает анализ и сразу запускает CV в текущем потоке
+    (без постановки задачи в очередь).
+    """
+    db_analysis = create_analysis(db, patient_mrn, diagnostician_id, image_path, enqueue=False)
+    return run_cv_for_analysis(db, db_analysis.id)
+
+
 # --- НОВАЯ ФУНКЦИЯ: Получение анализов для конкретного диагноста ---
-def get_analyses_for_diagnostician(db: Session, user_id: int):
+def _page_query(query, limit: int = PAGE_SIZE_DEFAULT, cursor=None, confirmed=None,
+                date_from=None, date_to=None):
     """
-    Получает все анализы, проведенные данным диагностом,
-    с предзагрузкой данных пациента и результатов.
+    Фильтры, сортировка и лимит страницы. Работает и с Query (синхронная сессия),
+    и с select() (AsyncSession): у обоих одинаковые filter/outerjoin/order_by/limit.
     """
+    Analysis = sql_models.Analysis
+
+    if confirmed is not None:
+        # Явный JOIN по results.analysis_id (индекс), а не коррелированный EXISTS
+        Result = sql_models.Result
+        query = query.outerjoin(Result, Result.analysis_id == Analysis.id)
+        if confirmed:
+            # IS, а не "=": по "=" SQLite берет частичный индекс подтвержденных и
+            # сортирует их все (секунды на миллионах строк); с IS список идет по
+            # индексу даты, а результат ищется по analysis_id
+            query = query.filter(Result.is_confirmed.is_(True))
+        else:
+            query = query.filter(or_(Result.id.is_(None), Result.is_confirmed == False))  # noqa: E712
+    if date_from is not None:
+        query = query.filter(Analysis.date_of_analysis >= date_from)
+    if date_to is not None:
+        query = query.filter(Analysis.date_of_analysis < date_to)
+    if cursor is not None:
+        # Строго после последней строки: стоимость не зависит от глубины страницы
+        query = query.filter(tuple_(Analysis.date_of_analysis, Analysis.id) < tuple_(*cursor))
+
+    # Берем на одну строку больше, чтобы узнать, есть ли следующая страница
     return (
+        query
+        .order_by(Analysis.date_of_analysis.desc(), Analysis.id.desc())
+        .limit(limit + 1)
+    )
+
+
+def _split_page(rows, limit: int):
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].date_of_analysis, rows[-1].id)
+
+
+def paginate_analyses(query, limit: int = PAGE_SIZE_DEFAULT, **filters):
+    """
+    Курсорная пагинация и фильтры для списков анализов.
+    Сортировка по (date_of_analysis, id) по убыванию; cursor — ключ последней
+    строки предыдущей страницы (см. core/pagination.py). Возвращает
+    (анализы страницы, курсор следующей страницы или None).
+    """
+    return _split_page(_page_query(query, limit, **filters).all(), limit)
+
+
+def get_analyses_for_diagnostician(db: Session, user_id: int, **page):
+    """
+    Получает страницу анализов, проведенных данным диагностом,
+    с предзагрузкой данных пациента и результатов.
+    Параметры страницы и фильтров — см. paginate_analyses.
+    """
+    query = (
         db.query(sql_models.Analysis)
         .filter(sql_models.Analysis.diagnostician_id == user_id)
         # Оптимизация: загружаем связанные данные пациента и результатов
         .options(joinedload(sql_models.Analysis.patient),
                  joinedload(sql_models.Analysis.results))
-        .order_by(sql_models.Analysis.date_of_analysis.desc())
-        .all()
     )
+    return paginate_analyses(query, **page)
 
 
 # --- НОВАЯ ФУНКЦИЯ: Получение одного анализа по ID ---
@@ -110,27 +343,58 @@ def update_analysis_conclusion(
 
     db_result = db_analysis.results
 
+    # Агрегаты метрик обновляются в той же транзакции (с учетом повторной корректировки)
+    metrics_crud.apply_feedback(db, db_analysis, was_confirmed=bool(db_result.is_confirmed),
+                                old_feedback=db_result.feedback_correct, new_feedback=feedback)
+
     db_result.diagnostician_conclusion = conclusion
     db_result.is_confirmed = True
     db_result.feedback_correct = feedback  # Записываем обратную связь
+    bump_history_version(db, db_analysis.patient_id)
+
+    db.commit()
+    return db_analysis
+
+
+def delete_analysis(db: Session, analysis_id: int):
+    """
+    Удаляет анализ вместе с результатом и задачами очереди и освобождает
+    ссылку на файл хранилища. Файл без ссылок остается на диске: его удалит
+    сборщик мусора по истечении отсрочки (python -m manage sweep-blobs).
+    """
+    db_analysis = get_analysis_by_id(db, analysis_id)
+    if not db_analysis:
+        return None
 
+    metrics_crud.retract_feedback(db, db_analysis)
+    if db_analysis.results is not None:
+        db.delete(db_analysis.results)
+    db.query(sql_models.InferenceJob).filter(sql_models.InferenceJob.analysis_id == analysis_id).delete(
+        synchronize_session=False)
+    db.query(sql_models.UploadSession).filter(sql_models.UploadSession.analysis_id == analysis_id).update(
+        {"analysis_id": None}, synchronize_session=False)
+    digest = db_analysis.image_digest
+    if digest:
+        blob_crud.release_blob_reference(db, digest)
+    bump_history_version(db, db_analysis.patient_id)
+    db.delete(db_analysis)
     db.commit()
-    db.refresh(db_result)
     return db_analysis
 
 
 # --- НОВАЯ ФУНКЦИЯ: Получение полной истории пациента по MRN ---
-def get_patient_history_by_mrn(db: Session, mrn: str):
+def get_patient_history_by_mrn(db: Session, mrn: str, **page):
     """
-    Получает объект пациента и все связанные с ним анализы.
+    Получает объект пациента и страницу связанных с ним анализов.
+    Параметры страницы и фильтров — см. paginate_analyses.
     """
     # 1. Находим пациента
     patient = db.query(sql_models.Patient).filter(sql_models.Patient.medical_record_number == mrn).first()
     if not patient:
         return None
 
-    # 2. Получаем все анализы этого пациента
-    analyses = (
+    # 2. Получаем страницу анализов этого пациента
+    query = (
         db.query(sql_models.Analysis)
         .filter(sql_models.Analysis.patient_id == patient.id)
         .options(
@@ -138,11 +402,10 @@ def get_patient_history_by_mrn(db: Session, mrn: str):
             joinedload(sql_models.Analysis.results),
             joinedload(sql_models.Analysis.diagnostician)
         )
-        .order_by(sql_models.Analysis.date_of_analysis.desc())
-        .all()
     )
+    analyses, next_cursor = paginate_analyses(query, **page)
 
-    return {"patient": patient, "analyses": analyses}
+    return {"patient": patient, "analyses": analyses, "next_cursor": next_cursor}
 
 
 # --- НОВАЯ ФУНКЦИЯ: Обновление плана лечения ---
@@ -154,42 +417,42 @@ def update_analysis_treatment_plan(
 ):
     """
     Обновляет план лечения в результате анализа и записывает ID клинициста.
+    Результат и диагност загружаются тем же запросом: их сериализует ответ
+    (ClinicianAnalysis), и ленивая загрузка после commit не нужна.
     """
-    db_analysis = db.query(sql_models.Analysis).filter(sql_models.Analysis.id == analysis_id).first()
-
-    if not db_analysis:
-        return None
-
-    # Получаем или создаем результат
-    db_result = db.query(sql_models.Result).filter(sql_models.Result.analysis_id == analysis_id).first()
-    if not db_result:
-        # В рабочем процессе это не должно происходить, так как анализ уже был запущен.
+    db_analysis = (
+        db.query(sql_models.Analysis)
+        .filter(sql_models.Analysis.id == analysis_id)
+        .options(joinedload(sql_models.Analysis.results),
+                 joinedload(sql_models.Analysis.diagnostician))
+        .first()
+    )
+    if not db_analysis or not db_analysis.results:
+        # Результата нет, пока CV не выполнен: назначать лечение не по чему
         return None
 
-    db_result.treatment_plan = treatment_plan
+    db_analysis.results.treatment_plan = treatment_plan
     db_analysis.clinician_id = clinician_id  # Привязываем клинициста к анализу
+    bump_history_version(db, db_analysis.patient_id)
 
     db.commit()
-    db.refresh(db_result)
-    db.refresh(db_analysis)
     return db_analysis
 
 
-def get_all_analyses(db: Session, skip: int = 0, limit: int = 100):
+def get_all_analyses(db: Session, **page):
     """
-    Получает все анализы, проведенные в системе, для Администратора.
+    Получает страницу всех анализов, проведенных в системе, для Администратора.
+    Параметры страницы и фильтров — см. paginate_analyses.
     """
-    return (
+    query = (
         db.query(sql_models.Analysis)
         .options(
             joinedload(sql_models.Analysis.patient),
             joinedload(sql_models.Analysis.results),
             joinedload(sql_models.Analysis.diagnostician) # Добавим имя диагноста
         )
-        .order_by(sql_models.Analysis.date_of_analysis.desc())
-        .offset(skip).limit(limit)
-        .all()
     )
+    return paginate_analyses(query, **page)
 
 
 # Файл: crud/analysis_crud.py (Дополнение)
@@ -197,33 +460,138 @@ def get_all_analyses(db: Session, skip: int = 0, limit: int = 100):
 # --- НОВАЯ ФУНКЦИЯ: Получение метрик обратной связи ---
 def get_feedback_metrics(db: Session):
     """
-    Рассчитывает процент корректных диагнозов системы на основе
-    подтверждений врачей-диагностов.
+    Процент корректных диагнозов системы на основе подтверждений
+    врачей-диагностов. Читается из агрегатов (crud/metrics_crud.py),
+    а не подсчетом по таблице results.
+    """
+    return metrics_crud.get_totals(db)
+
+
+# --- Асинхронные версии для обработчиков API (AsyncSession) ---
+# Чтения — запросы select() через асинхронный драйвер: пока БД выполняет
+# запрос, event loop обслуживает другие запросы. Многошаговые записи
+# (пациент, blob, очередь, метрики в одной транзакции) переиспользуют
+# синхронную логику через AsyncSession.run_sync — обращения к БД внутри
+# нее тоже идут через асинхронный драйвер.
+# Сессия создается с expire_on_commit=False, поэтому все, что нужно для
+# ответа, загружается явно (joinedload / undefer): ленивая загрузка в
+# AsyncSession недоступна.
+
+async def get_patient_by_mrn_async(db: AsyncSession, mrn: str):
+    stmt = select(sql_models.Patient).filter(sql_models.Patient.medical_record_number == mrn)
+    return (await db.scalars(stmt)).first()
+
+
+async def get_analysis_by_id_async(db: AsyncSession, analysis_id: int, with_segmentation: bool = False):
+    """
+    См. get_analysis_by_id. with_segmentation=True дополнительно загружает
+    маску сегментации (отложенная колонка results.segmentation_rle).
     """
+    results = joinedload(sql_models.Analysis.results)
+    if with_segmentation:
+        results = results.undefer(sql_models.Result.segmentation_rle)
+    stmt = (
+        select(sql_models.Analysis)
+        .filter(sql_models.Analysis.id == analysis_id)
+        .options(joinedload(sql_models.Analysis.patient), results)
+    )
+    return (await db.scalars(stmt)).first()
+
+
+async def paginate_analyses_async(db: AsyncSession, stmt, limit: int = PAGE_SIZE_DEFAULT, **filters):
+    """См. paginate_analyses; stmt — select() по Analysis."""
+    rows = (await db.scalars(_page_query(stmt, limit, **filters))).all()
+    return _split_page(rows, limit)
+
+
+async def get_analyses_for_diagnostician_async(db: AsyncSession, user_id: int, **page):
+    stmt = (
+        select(sql_models.Analysis)
+        .filter(sql_models.Analysis.diagnostician_id == user_id)
+        .options(joinedload(sql_models.Analysis.patient),
+                 joinedload(sql_models.Analysis.results))
+    )
+    return await paginate_analyses_async(db, stmt, **page)
+
+
+async def get_all_analyses_async(db: AsyncSession, **page):
+    stmt = (
+        select(sql_models.Analysis)
+        .options(
+            joinedload(sql_models.Analysis.patient),
+            joinedload(sql_models.Analysis.results),
+            joinedload(sql_models.Analysis.diagnostician)
+        )
+    )
+    return await paginate_analyses_async(db, stmt, **page)
+
+
+async def get_patient_history_version_async(db: AsyncSession, mrn: str):
+    """Версия истории пациента (без загрузки анализов); None — пациента нет."""
+    stmt = select(sql_models.Patient.history_version).filter(sql_models.Patient.medical_record_number == mrn)
+    return (await db.execute(stmt)).scalar_one_or_none()
+
+
+async def get_patient_history_by_mrn_async(db: AsyncSession, mrn: str, **page):
+    patient = await get_patient_by_mrn_async(db, mrn)
+    if not patient:
+        return None
+
+    stmt = (
+        select(sql_models.Analysis)
+        .filter(sql_models.Analysis.patient_id == patient.id)
+        .options(
+            joinedload(sql_models.Analysis.results),
+            joinedload(sql_models.Analysis.diagnostician)
+        )
+    )
+    analyses, next_cursor = await paginate_analyses_async(db, stmt, **page)
+    return {"patient": patient, "analyses": analyses, "next_cursor": next_cursor}
+
+
+async def _get_cached_cv_results(digests) -> dict:
+    """
+    Результаты из кэша CV по SHA-256 изображений. Кэш — отдельная БД SQLite:
+    поиск идет в пуле ввода-вывода, до транзакции записи и вне event loop.
+    """
+    def lookup():
+        found = {}
+        for digest in set(digests):
+            cached_result = cv_stub.get_cached_cv_result(digest)
+            if cached_result is not None:
+                found[digest] = cached_result
+        return found
+
+    return await asyncio.get_running_loop().run_in_executor(storage.get_io_pool(), lookup)
+
+
+async def create_analysis_async(db: AsyncSession, *args, image_digest: str = None, **kwargs):
+    """См. create_analysis."""
+    if image_digest is not None:
+        kwargs["cached_result"] = (await _get_cached_cv_results([image_digest])).get(image_digest)
+    return await run_write(db, create_analysis, *args, image_digest=image_digest, **kwargs)
+
+
+async def create_analyses_bulk_async(db: AsyncSession, patient_mrn: str, diagnostician_id: int, images: list):
+    """См. create_analyses_bulk."""
+    cached_results = await _get_cached_cv_results([image_digest for _, image_digest, _ in images])
+    return await run_write(db, create_analyses_bulk, patient_mrn, diagnostician_id, images, cached_results)
+
+
+async def delete_analysis_async(db: AsyncSession, analysis_id: int):
+    """См. delete_analysis."""
+    return await run_write(db, delete_analysis, analysis_id)
+
 
-    # Считаем общее количество подтвержденных анализов (где is_confirmed = True)
-    total_confirmed = db.query(sql_models.Result).filter(
-        sql_models.Result.is_confirmed == True
-    ).count()
+async def update_analysis_conclusion_async(db: AsyncSession, *args, **kwargs):
+    """См. update_analysis_conclusion."""
+    return await run_write(db, update_analysis_conclusion, *args, **kwargs)
 
-    if total_confirmed == 0:
-        return {
-            "total_confirmed": 0,
-            "correct_predictions": 0,
-            "accuracy_percentage": 0.0
-        }
 
-    # Считаем количество корректных прогнозов (feedback_correct = 1)
-    correct_predictions = db.query(sql_models.Result).filter(
-        sql_models.Result.is_confirmed == True,
-        sql_models.Result.feedback_correct == 1
-    ).count()
+async def update_analysis_treatment_plan_async(db: AsyncSession, *args, **kwargs):
+    """См. update_analysis_treatment_plan."""
+    return await run_write(db, update_analysis_treatment_plan, *args, **kwargs)
 
-    # Рассчитываем процент
-    accuracy_percentage = (correct_predictions / total_confirmed) * 100
 
-    return {
-        "total_confirmed": total_confirmed,
-        "correct_predictions": correct_predictions,
-        "accuracy_percentage": round(accuracy_percentage, 2)
-    }
\ No newline at end of file
+async def get_feedback_metrics_async(db: AsyncSession):
+    return await db.run_sync(get_feedback_metrics)
@@ -0,0 +1,69 @@
+# Файл: crud/blob_crud.py
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import sql_models
+
+
+def get_blob(db: Session, digest: str):
+    return db.query(sql_models.Blob).filter(sql_models.Blob.digest == digest).first()
+
+
+def get_blob_paths(db: Session, digests: list[str]) -> dict[str, str]:
+    """Пути существующих blob для набора SHA-256 (одним запросом)."""
+    if not digests:
+        return {}
+    rows = (
+        db.query(sql_models.Blob.digest, sql_models.Blob.path)
+        .filter(sql_models.Blob.digest.in_(set(digests)))
+        .all()
+    )
+    return {row.digest: row.path for row in rows}
+
+
+def add_blob_reference(db: Session, digest: str, path: str, size: int, count: int = 1):
+    """
+    Увеличивает счетчик ссылок на blob на count (создает запись, если ее нет).
+    Не делает commit: вызывается в транзакции создания анализа.
+    """
+    # Один запрос INSERT ... ON CONFLICT DO UPDATE: увеличение атомарно на стороне
+    # БД, а запись могла уже создать параллельная загрузка того же файла
+    insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    stmt = insert(sql_models.Blob).values(digest=digest, path=path, size=size, ref_count=count)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["digest"],
+        set_={"ref_count": sql_models.Blob.ref_count + stmt.excluded.ref_count}
+    ))
+
+
+def release_blob_reference(db: Session, digest: str, count: int = 1) -> None:
+    """
+    Уменьшает счетчик ссылок на count. Не делает commit: вызывается в транзакции
+    удаления анализа. Запись с нулем ссылок и ее файл не удаляются сразу:
+    параллельная загрузка того же содержимого могла уже найти этот blob и
+    удалить свой временный файл. Их убирает сборщик мусора (sweep-blobs).
+    """
+    Blob = sql_models.Blob
+    db.query(Blob).filter(Blob.digest == digest).update(
+        {"ref_count": Blob.ref_count - count},
+        synchronize_session=False
+    )
+
+
+# --- Сборка мусора хранилища (python -m manage sweep-blobs) ---
+def delete_unreferenced_blobs(db: Session) -> list[tuple[str, str]]:
+    """
+    Удаляет записи blob, на которые не ссылается ни один анализ (без commit).
+    Возвращает [(digest, path)] — для их файлов после commit начинается
+    отсрочка удаления (storage.sweep_orphans).
+    """
+    Blob = sql_models.Blob
+    referenced = select(sql_models.Analysis.id).where(sql_models.Analysis.image_digest == Blob.digest)
+    rows = db.query(Blob.digest, Blob.path).filter(~referenced.exists()).all()
+    for chunk_start in range(0, len(rows), 500):
+        digests = [row.digest for row in rows[chunk_start:chunk_start + 500]]
+        db.query(Blob).filter(Blob.digest.in_(digests), ~referenced.exists()).delete(synchronize_session=False)
+    return [(row.digest, row.path) for row in rows]
+
@@ -0,0 +1,77 @@
+# Файл: crud/export_crud.py
+#
+# Выгрузка подтвержденных результатов для переобучения модели CV.
+# Строки читаются курсором на стороне сервера порциями (yield_per), поэтому
+# память процесса не зависит от числа выгружаемых строк.
+
+import datetime
+from typing import AsyncIterator, Iterator, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from core.export import EXPORT_BATCH_SIZE
+from models import sql_models
+
+Analysis = sql_models.Analysis
+Result = sql_models.Result
+
+# Колонки выгрузки (порядок совпадает с заголовком CSV и схемой Parquet)
+EXPORT_COLUMNS = (
+    Result.id.label("result_id"),
+    Analysis.id.label("analysis_id"),
+    Analysis.date_of_analysis,
+    Analysis.image_digest,
+    Analysis.diagnostician_id,
+    Result.model_version,
+    Result.system_diagnosis,
+    Result.diagnostician_conclusion,
+    Result.feedback_correct,
+)
+EXPORT_FIELDS = tuple(column.key for column in EXPORT_COLUMNS)
+EXPORT_TYPES = tuple(column.type.python_type for column in EXPORT_COLUMNS)
+
+
+def _as_datetime(value):
+    if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+        return datetime.datetime.combine(value, datetime.time.min)
+    return value
+
+
+def confirmed_results_query(date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None,
+                            model_version: Optional[str] = None):
+    """
+    Подтвержденные врачом результаты (только колонки, без объектов ORM) по
+    возрастанию даты анализа. date_from включительно, date_to — нет.
+    """
+    stmt = (
+        select(*EXPORT_COLUMNS)
+        .join(Analysis, Result.analysis_id == Analysis.id)
+        .filter(Result.is_confirmed.is_(True))
+        .order_by(Analysis.date_of_analysis, Analysis.id)
+    )
+    if date_from is not None:
+        stmt = stmt.filter(Analysis.date_of_analysis >= _as_datetime(date_from))
+    if date_to is not None:
+        stmt = stmt.filter(Analysis.date_of_analysis < _as_datetime(date_to))
+    if model_version is not None:
+        stmt = stmt.filter(Result.model_version == model_version)
+    return stmt
+
+
+def iter_confirmed_results(db: Session, batch_size: int = EXPORT_BATCH_SIZE,
+                           **filters) -> Iterator[list]:
+    """Порции строк (кортежи в порядке EXPORT_FIELDS); фильтры — см. confirmed_results_query."""
+    stmt = confirmed_results_query(**filters).execution_options(yield_per=batch_size)
+    for partition in db.execute(stmt).partitions():
+        yield partition
+
+
+async def iter_confirmed_results_async(db: AsyncSession, batch_size: int = EXPORT_BATCH_SIZE,
+                                       **filters) -> AsyncIterator[list]:
+    """См. iter_confirmed_results; курсор открывается через AsyncSession.stream."""
+    stmt = confirmed_results_query(**filters).execution_options(yield_per=batch_size)
+    result = await db.stream(stmt)
+    async for partition in result.partitions():
+        yield partition
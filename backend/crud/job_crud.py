@@ -0,0 +1,193 @@
+# Файл: crud/job_crud.py
+
+import datetime
+
+from sqlalchemy import and_, or_, select, update, func
+from sqlalchemy.orm import Session
+
+from models import sql_models
+
+Job = sql_models.InferenceJob
+
+
+class LeaseLostError(Exception):
+    """Аренда задачи истекла, и ее захватил другой воркер: результат этого воркера не записывается."""
+
+
+# --- Постановка задачи в очередь ---
+def enqueue_job(db: Session, analysis_id: int, max_attempts: int = 3):
+    """
+    Добавляет задачу инференса в сессию (без commit),
+    чтобы она сохранилась в одной транзакции с анализом.
+    """
+    db_job = Job(
+        analysis_id=analysis_id,
+        status=sql_models.JOB_STATUS_PENDING,
+        max_attempts=max_attempts,
+        available_at=datetime.datetime.utcnow()
+    )
+    db.add(db_job)
+    return db_job
+
+
+def _claimable(now: datetime.datetime):
+    # Ожидающие задачи, у которых прошел backoff, либо задачи с истекшей арендой
+    return or_(
+        and_(Job.status == sql_models.JOB_STATUS_PENDING, Job.available_at <= now),
+        and_(Job.status == sql_models.JOB_STATUS_LEASED, Job.lease_expires_at < now,
+             Job.attempts < Job.max_attempts),
+    )
+
+
+# --- Захват задач воркером ---
+def claim_jobs(db: Session, worker_id: str, limit: int = 1, lease_seconds: int = 300):
+    """
+    Атомарно захватывает до `limit` задач для воркера `worker_id`.
+    Возвращает список строк (id, analysis_id, attempts).
+
+    В SQLite запись сериализуется, в PostgreSQL подзапрос берет строки
+    через FOR UPDATE SKIP LOCKED, поэтому одну задачу не получат два воркера.
+    """
+    now = datetime.datetime.utcnow()
+    candidates = (
+        select(Job.id)
+        .where(_claimable(now))
+        .order_by(Job.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    stmt = (
+        update(Job)
+        .where(Job.id.in_(candidates), _claimable(now))
+        .values(
+            status=sql_models.JOB_STATUS_LEASED,
+            lease_owner=worker_id,
+            lease_expires_at=now + datetime.timedelta(seconds=lease_seconds),
+            attempts=Job.attempts + 1,
+            updated_at=now
+        )
+        .returning(Job.id, Job.analysis_id, Job.attempts)
+        .execution_options(synchronize_session=False)
+    )
+    rows = db.execute(stmt).all()
+    db.commit()
+    return rows
+
+
+# --- Завершение задачи ---
+def complete_job(db: Session, job_id: int, worker_id: str) -> bool:
+    """
+    Помечает задачу выполненной, только если аренда все еще у этого воркера.
+    Без commit: вызывается в одной транзакции с записью результата CV.
+    """
+    result = db.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.lease_owner == worker_id, Job.status == sql_models.JOB_STATUS_LEASED)
+        .values(status=sql_models.JOB_STATUS_DONE, lease_expires_at=None, updated_at=datetime.datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def fail_job(db: Session, job_id: int, worker_id: str, error: str):
+    """
+    Обрабатывает ошибку задачи: возвращает ее в очередь с экспоненциальной
+    задержкой либо, если попытки исчерпаны, переводит в dead-letter
+    и помечает анализ как 'failed'.
+    """
+    db_job = db.query(Job).filter(Job.id == job_id, Job.lease_owner == worker_id).first()
+    if not db_job:
+        return None
+
+    now = datetime.datetime.utcnow()
+    db_job.last_error = error
+    db_job.lease_expires_at = None
+
+    if db_job.attempts >= db_job.max_attempts:
+        db_job.status = sql_models.JOB_STATUS_DEAD
+        _set_analysis_status(db, db_job.analysis_id, sql_models.ANALYSIS_STATUS_FAILED, error)
+    else:
+        db_job.status = sql_models.JOB_STATUS_PENDING
+        db_job.available_at = now + datetime.timedelta(seconds=min(2 ** db_job.attempts, 60))
+        _set_analysis_status(db, db_job.analysis_id, sql_models.ANALYSIS_STATUS_QUEUED, None)
+
+    db.commit()
+    return db_job
+
+
+def reap_expired_jobs(db: Session) -> int:
+    """
+    Переводит в dead-letter задачи, аренда которых истекла после последней попытки
+    (воркер упал, а повторять уже нельзя).
+    """
+    now = datetime.datetime.utcnow()
+    expired = (
+        db.query(Job)
+        .filter(Job.status == sql_models.JOB_STATUS_LEASED,
+                Job.lease_expires_at < now,
+                Job.attempts >= Job.max_attempts)
+        .all()
+    )
+    for db_job in expired:
+        db_job.status = sql_models.JOB_STATUS_DEAD
+        db_job.last_error = db_job.last_error or "Истек срок аренды задачи."
+        _set_analysis_status(db, db_job.analysis_id, sql_models.ANALYSIS_STATUS_FAILED, db_job.last_error)
+    if expired:
+        db.commit()
+    return len(expired)
+
+
+def _set_analysis_status(db: Session, analysis_id: int, new_status: str, error_message):
+    db.query(sql_models.Analysis).filter(sql_models.Analysis.id == analysis_id).update(
+        {"status": new_status, "error_message": error_message},
+        synchronize_session=False
+    )
+
+
+# --- Администрирование очереди ---
+def get_queue_stats(db: Session) -> dict:
+    """Количество задач по статусам."""
+    counts = dict(db.query(Job.status, func.count(Job.id)).group_by(Job.status).all())
+    return {
+        job_status: counts.get(job_status, 0)
+        for job_status in (sql_models.JOB_STATUS_PENDING, sql_models.JOB_STATUS_LEASED,
+                           sql_models.JOB_STATUS_DONE, sql_models.JOB_STATUS_DEAD)
+    }
+
+
+def count_active_jobs(db: Session) -> dict:
+    """
+    Ожидающие и захваченные задачи (для метрик). Быстрее get_queue_stats:
+    выполненные задачи, которых большинство, не считаются.
+    """
+    active = (sql_models.JOB_STATUS_PENDING, sql_models.JOB_STATUS_LEASED)
+    counts = dict(
+        db.query(Job.status, func.count(Job.id)).filter(Job.status.in_(active)).group_by(Job.status).all()
+    )
+    return {job_status: counts.get(job_status, 0) for job_status in active}
+
+
+def get_dead_jobs(db: Session, skip: int = 0, limit: int = 100):
+    return (
+        db.query(Job)
+        .filter(Job.status == sql_models.JOB_STATUS_DEAD)
+        .order_by(Job.id.desc())
+        .offset(skip).limit(limit)
+        .all()
+    )
+
+
+def retry_dead_job(db: Session, job_id: int):
+    """Возвращает задачу из dead-letter в очередь с обнуленным счетчиком попыток."""
+    db_job = db.query(Job).filter(Job.id == job_id, Job.status == sql_models.JOB_STATUS_DEAD).first()
+    if not db_job:
+        return None
+
+    db_job.status = sql_models.JOB_STATUS_PENDING
+    db_job.attempts = 0
+    db_job.lease_owner = None
+    db_job.available_at = datetime.datetime.utcnow()
+    _set_analysis_status(db, db_job.analysis_id, sql_models.ANALYSIS_STATUS_QUEUED, None)
+    db.commit()
+    db.refresh(db_job)
+    return db_job
@@ -0,0 +1,191 @@
+# Файл: crud/metrics_crud.py
+
+import datetime
+from typing import Optional
+
+from sqlalchemy import case, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import sql_models
+
+Stat = sql_models.FeedbackStat
+
+
+def _period_keys(date_of_analysis: Optional[datetime.date]) -> list[tuple[str, str]]:
+    """Ключи (period, period_start), в которые попадает анализ (без даты — только итог)."""
+    keys = [(sql_models.FEEDBACK_PERIOD_TOTAL, "")]
+    if date_of_analysis is not None:
+        day = date_of_analysis.date() if isinstance(date_of_analysis, datetime.datetime) else date_of_analysis
+        week = day - datetime.timedelta(days=day.weekday())
+        keys += [
+            (sql_models.FEEDBACK_PERIOD_DAY, day.isoformat()),
+            (sql_models.FEEDBACK_PERIOD_WEEK, week.isoformat()),
+        ]
+    return keys
+
+
+def _increment(db: Session, keys: list[tuple[str, str]], model_version: str, system_diagnosis: str,
+               confirmed: int, correct: int) -> None:
+    """
+    Атомарно прибавляет значения к агрегатам всех периодов keys (создает строки
+    при первом обращении) — одним запросом INSERT на несколько строк.
+    """
+    insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    stmt = insert(Stat).values([
+        {"period": period, "period_start": period_start, "model_version": model_version,
+         "system_diagnosis": system_diagnosis, "confirmed": confirmed, "correct": correct}
+        for period, period_start in keys
+    ])
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["period", "period_start", "model_version", "system_diagnosis"],
+        set_={"confirmed": Stat.confirmed + stmt.excluded.confirmed,
+              "correct": Stat.correct + stmt.excluded.correct}
+    ))
+
+
+def apply_feedback(db: Session, db_analysis: sql_models.Analysis, was_confirmed: bool,
+                   old_feedback: int, new_feedback: int) -> None:
+    """
+    Учитывает подтверждение (или его повторную корректировку) в агрегатах.
+    Не делает commit: вызывается в транзакции update_analysis_conclusion.
+    """
+    confirmed_delta = 0 if was_confirmed else 1
+    correct_delta = int(new_feedback == 1) - int(was_confirmed and old_feedback == 1)
+    if confirmed_delta == 0 and correct_delta == 0:
+        return
+
+    db_result = db_analysis.results
+    _increment(db, _period_keys(db_analysis.date_of_analysis), db_result.model_version or "",
+               db_result.system_diagnosis or "", confirmed_delta, correct_delta)
+
+
+def retract_feedback(db: Session, db_analysis: sql_models.Analysis) -> None:
+    """
+    Убирает подтвержденный результат из агрегатов (при удалении анализа).
+    Не делает commit.
+    """
+    db_result = db_analysis.results
+    if db_result is None or not db_result.is_confirmed:
+        return
+    _increment(db, _period_keys(db_analysis.date_of_analysis), db_result.model_version or "",
+               db_result.system_diagnosis or "", -1, -int(db_result.feedback_correct == 1))
+
+
+def _accuracy(confirmed: int, correct: int) -> float:
+    return round(correct / confirmed * 100, 2) if confirmed else 0.0
+
+
+def get_totals(db: Session) -> dict:
+    """Итоговые метрики: сумма по строкам 'total' (их число = версии x диагнозы)."""
+    confirmed, correct = (
+        db.query(func.coalesce(func.sum(Stat.confirmed), 0), func.coalesce(func.sum(Stat.correct), 0))
+        .filter(Stat.period == sql_models.FEEDBACK_PERIOD_TOTAL)
+        .one()
+    )
+    return {
+        "total_confirmed": confirmed,
+        "correct_predictions": correct,
+        "accuracy_percentage": _accuracy(confirmed, correct),
+    }
+
+
+def get_timeseries(db: Session, period: str, date_from: Optional[datetime.date] = None,
+                   date_to: Optional[datetime.date] = None, model_version: Optional[str] = None) -> list[dict]:
+    """Точность по дням или неделям (по дате анализа), по возрастанию даты."""
+    query = (
+        db.query(Stat.period_start, func.sum(Stat.confirmed), func.sum(Stat.correct))
+        .filter(Stat.period == period)
+    )
+    if date_from is not None:
+        query = query.filter(Stat.period_start >= date_from.isoformat())
+    if date_to is not None:
+        query = query.filter(Stat.period_start < date_to.isoformat())
+    if model_version is not None:
+        query = query.filter(Stat.model_version == model_version)
+
+    rows = query.group_by(Stat.period_start).order_by(Stat.period_start).all()
+    return [
+        {
+            "period_start": period_start,
+            "total_confirmed": confirmed,
+            "correct_predictions": correct,
+            "accuracy_percentage": _accuracy(confirmed, correct),
+        }
+        for period_start, confirmed, correct in rows
+    ]
+
+
+def _breakdown(db: Session, column) -> list[tuple]:
+    return (
+        db.query(column, func.sum(Stat.confirmed), func.sum(Stat.correct))
+        .filter(Stat.period == sql_models.FEEDBACK_PERIOD_TOTAL)
+        .group_by(column)
+        .order_by(column)
+        .all()
+    )
+
+
+def get_by_diagnosis(db: Session) -> list[dict]:
+    """Матрица ошибок по диагнозу системы: подтвержден врачом / отклонен."""
+    return [
+        {
+            "system_diagnosis": diagnosis,
+            "total_confirmed": confirmed,
+            "correct_predictions": correct,
+            "incorrect_predictions": confirmed - correct,
+            "accuracy_percentage": _accuracy(confirmed, correct),
+        }
+        for diagnosis, confirmed, correct in _breakdown(db, Stat.system_diagnosis)
+    ]
+
+
+def get_by_model_version(db: Session) -> list[dict]:
+    return [
+        {
+            "model_version": version or None,
+            "total_confirmed": confirmed,
+            "correct_predictions": correct,
+            "accuracy_percentage": _accuracy(confirmed, correct),
+        }
+        for version, confirmed, correct in _breakdown(db, Stat.model_version)
+    ]
+
+
+def rebuild_feedback_stats(db: Session) -> int:
+    """
+    Пересчитывает агрегаты с нуля по подтвержденным результатам: дневные
+    строки — одним GROUP BY в БД, недельные и итоговые — из дневных.
+    Не делает commit. Возвращает число подтвержденных результатов.
+    """
+    db.query(Stat).delete(synchronize_session=False)
+
+    day = func.date(sql_models.Analysis.date_of_analysis)
+    rows = (
+        db.query(
+            day,
+            func.coalesce(sql_models.Result.model_version, ""),
+            func.coalesce(sql_models.Result.system_diagnosis, ""),
+            func.count(),
+            func.sum(case((sql_models.Result.feedback_correct == 1, 1), else_=0)),
+        )
+        .join(sql_models.Analysis, sql_models.Analysis.id == sql_models.Result.analysis_id)
+        .filter(sql_models.Result.is_confirmed == True)  # noqa: E712
+        .group_by(day, sql_models.Result.model_version, sql_models.Result.system_diagnosis)
+        .all()
+    )
+
+    totals: dict[tuple, list] = {}
+    for day_value, model_version, diagnosis, confirmed, correct in rows:
+        day_of_analysis = datetime.date.fromisoformat(str(day_value)) if day_value is not None else None
+        for period, period_start in _period_keys(day_of_analysis):
+            bucket = totals.setdefault((period, period_start, model_version, diagnosis), [0, 0])
+            bucket[0] += confirmed
+            bucket[1] += correct
+
+    db.bulk_insert_mappings(Stat, [
+        {"period": period, "period_start": period_start, "model_version": model_version,
+         "system_diagnosis": diagnosis, "confirmed": confirmed, "correct": correct}
+        for (period, period_start, model_version, diagnosis), (confirmed, correct) in totals.items()
+    ])
+    return sum(row[3] for row in rows)
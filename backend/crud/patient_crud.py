@@ -0,0 +1,153 @@
+# Файл: crud/patient_crud.py
+#
+# Поиск пациентов по мере ввода: префикс MRN, фамилии и имени.
+# SQLite: полнотекстовый индекс FTS5 patients_fts, синхронизируется с
+# таблицей patients триггерами (см. create_search_index).
+# Другие СУБД: сравнение префиксов по lower() (индексы — там же).
+
+import re
+from typing import List
+
+from sqlalchemy import and_, func, or_, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from models import sql_models
+
+Patient = sql_models.Patient
+
+# --- Конфигурация поиска ---
+SEARCH_LIMIT_DEFAULT = 10
+SEARCH_LIMIT_MAX = 50
+SEARCH_MAX_TERMS = 4
+
+SEARCH_COLUMNS = ("medical_record_number", "last_name", "first_name")
+# Уровни совпадения по первому слову запроса, от лучшего к худшему: точная
+# фамилия, начало фамилии, начало имени, любое поле (MRN). Остальные слова
+# запроса — начало слова в любом поле
+SEARCH_TIERS = ('{last_name} : "%s"', '{last_name} : "%s"*', '{first_name} : "%s"*', '"%s"*')
+
+_TERM = re.compile(r"[^\W_]+")
+
+
+# --- Индекс (вызывается миграцией 6) ---
+def _fold_sql(expr: str) -> str:
+    """Ё -> Е в SQL (remove_diacritics токенизатора unicode61 ее не снимает)."""
+    return f"replace(replace({expr}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def create_search_index(conn: Connection) -> None:
+    """Создает индекс поиска пациентов и заполняет его по существующим строкам."""
+    if conn.dialect.name != "sqlite":
+        for column in SEARCH_COLUMNS:
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_patients_{column}_prefix "
+                f"ON patients (lower({column}) text_pattern_ops)"
+            ))
+        return
+
+    # Таблица хранит свою (нормализованную) копию полей; rowid = patients.id.
+    # prefix: готовые индексы префиксов длиной 1-6 — запрос "иван*" не объединяет
+    # списки документов всех слов на "иван" (+17% к размеру БД)
+    columns = ", ".join(SEARCH_COLUMNS)
+    conn.execute(text(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS patients_fts USING fts5({columns}, "
+        "tokenize='unicode61 remove_diacritics 2', prefix='1 2 3 4 5 6')"
+    ))
+    new_values = ", ".join(_fold_sql(f"new.{c}") for c in SEARCH_COLUMNS)
+    delete_old = "DELETE FROM patients_fts WHERE rowid = old.id;"
+    insert_new = f"INSERT INTO patients_fts (rowid, {columns}) VALUES (new.id, {new_values});"
+    conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS patients_fts_ai AFTER INSERT ON patients "
+                      f"BEGIN {insert_new} END"))
+    conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS patients_fts_ad AFTER DELETE ON patients "
+                      f"BEGIN {delete_old} END"))
+    # Только поля поиска: history_version меняется при каждом новом анализе
+    conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS patients_fts_au AFTER UPDATE OF {columns} ON patients "
+                      f"BEGIN {delete_old} {insert_new} END"))
+
+    conn.execute(text("DELETE FROM patients_fts"))
+    conn.execute(text(
+        f"INSERT INTO patients_fts (rowid, {columns}) "
+        f"SELECT id, {', '.join(_fold_sql(c) for c in SEARCH_COLUMNS)} FROM patients"
+    ))
+
+
+# --- Поиск ---
+def _terms(query: str) -> List[str]:
+    return _TERM.findall(query.lower().replace("ё", "е"))[:SEARCH_MAX_TERMS]
+
+
+def _mrn_prefix_stmt(prefix: str, limit: int):
+    """MRN, начинающиеся с prefix (диапазон по уникальному индексу MRN)."""
+    return (
+        select(Patient)
+        .filter(Patient.medical_record_number >= prefix,
+                Patient.medical_record_number < prefix + "\U0010ffff")
+        .order_by(Patient.medical_record_number)
+        .limit(limit)
+    )
+
+
+def _fts_ranked_stmt(terms: List[str], limit: int):
+    """
+    id лучших limit совпадений в индексе FTS. Для каждого уровня SEARCH_TIERS
+    читаются первые limit совпадений (чтение останавливается сразу, без
+    перебора всех совпадений короткого префикса), пациент относится к лучшему
+    из своих уровней. Внутри уровня берутся первые по rowid и выдаются по алфавиту.
+    """
+    rest = " ".join(f'"{term}"*' for term in terms[1:])
+    tiers = " UNION ALL ".join(
+        f"SELECT * FROM (SELECT rowid AS id, {tier} AS tier, last_name, first_name FROM patients_fts "
+        f"WHERE patients_fts MATCH :match_{tier} LIMIT :limit)"
+        for tier in range(len(SEARCH_TIERS))
+    )
+    return text(
+        f"SELECT id, min(tier) AS tier, last_name, first_name FROM ({tiers}) "
+        "GROUP BY id ORDER BY tier, last_name, first_name, id LIMIT :limit"
+    ).bindparams(limit=limit, **{f"match_{tier}": f"{pattern % terms[0]} {rest}".strip()
+                                 for tier, pattern in enumerate(SEARCH_TIERS)})
+
+
+def _like_stmt(terms: List[str], limit: int):
+    """Без FTS: каждое слово запроса — префикс MRN, фамилии или имени."""
+    columns = [getattr(Patient, c) for c in SEARCH_COLUMNS]
+    return (
+        select(Patient)
+        .filter(and_(*(or_(*(func.lower(c).like(term + "%") for c in columns)) for term in terms)))
+        .order_by(Patient.last_name, Patient.first_name, Patient.id)
+        .limit(limit)
+    )
+
+
+def search_patients(db: Session, query: str, limit: int = SEARCH_LIMIT_DEFAULT):
+    """
+    Сначала пациенты, чей MRN начинается с запроса, затем совпадения по словам
+    (см. _fts_ranked_stmt; без FTS — по алфавиту). Объекты загружаются только для ответа.
+    """
+    terms = _terms(query)
+    if not terms:
+        return []
+    # MRN как введен, затем в верхнем регистре ("mrn-00"): иначе слово "mrn"
+    # совпало бы в индексе FTS с каждым пациентом
+    patients = []
+    for prefix in dict.fromkeys((query.strip(), query.strip().upper())):
+        seen = {p.id for p in patients}
+        patients += [p for p in db.scalars(_mrn_prefix_stmt(prefix, limit)) if p.id not in seen]
+        if len(patients) >= limit:
+            return patients[:limit]
+
+    if db.get_bind().dialect.name == "sqlite":
+        ids = [row.id for row in db.execute(_fts_ranked_stmt(terms, limit + len(patients)))]
+        by_id = {p.id: p for p in db.scalars(select(Patient).filter(Patient.id.in_(ids)))}
+        text_hits = [by_id[i] for i in ids if i in by_id]
+    else:
+        text_hits = db.scalars(_like_stmt(terms, limit)).all()
+
+    seen = {p.id for p in patients}
+    return [*patients, *(p for p in text_hits if p.id not in seen)][:limit]
+
+
+async def search_patients_async(db: AsyncSession, query: str, limit: int = SEARCH_LIMIT_DEFAULT):
+    """См. search_patients."""
+    return await db.run_sync(search_patients, query, limit)
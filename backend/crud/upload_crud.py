@@ -0,0 +1,130 @@
+# Файл: crud/upload_crud.py
+
+import datetime
+import math
+import uuid
+
+from sqlalchemy import Integer, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import sql_models
+
+
+def chunk_count(db_session: sql_models.UploadSession) -> int:
+    """Сколько блоков должно быть в сессии."""
+    return max(1, math.ceil(db_session.total_size / db_session.chunk_size))
+
+
+def expected_chunk_size(db_session: sql_models.UploadSession, chunk_index: int) -> int:
+    """Ожидаемый размер блока (последний блок может быть короче)."""
+    offset = chunk_index * db_session.chunk_size
+    return min(db_session.chunk_size, db_session.total_size - offset)
+
+
+def create_upload_session(db: Session, owner_id: int, patient_mrn: str, filename: str,
+                          total_size: int, chunk_size: int):
+    db_session = sql_models.UploadSession(
+        id=uuid.uuid4().hex,
+        owner_id=owner_id,
+        patient_mrn=patient_mrn,
+        filename=filename,
+        total_size=total_size,
+        chunk_size=chunk_size,
+        status=sql_models.UPLOAD_STATUS_OPEN
+    )
+    db.add(db_session)
+    db.commit()
+    db.refresh(db_session)
+    return db_session
+
+
+def get_upload_session(db: Session, session_id: str):
+    return db.query(sql_models.UploadSession).filter(sql_models.UploadSession.id == session_id).first()
+
+
+def record_chunk(db: Session, session_id: str, chunk_index: int, size: int) -> bool:
+    """
+    Отмечает блок как полученный. Статус сессии проверяется в том же запросе
+    (INSERT ... SELECT), что и вставка: к сессии, которую уже завершает
+    /complete, блок не добавится. Повторная загрузка того же блока (например,
+    после обрыва связи) не создает дубликат. False — сессия не открыта.
+    """
+    UploadSession = sql_models.UploadSession
+    insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    stmt = insert(sql_models.UploadChunk).from_select(
+        ["session_id", "chunk_index", "size"],
+        select(UploadSession.id, literal(chunk_index, Integer), literal(size, Integer))
+        .where(UploadSession.id == session_id, UploadSession.status == sql_models.UPLOAD_STATUS_OPEN)
+    )
+    recorded = db.execute(stmt.on_conflict_do_update(
+        index_elements=["session_id", "chunk_index"],
+        set_={"size": stmt.excluded.size}
+    )).rowcount
+    db.commit()
+    return recorded == 1
+
+
+def get_received_chunks(db: Session, session_id: str) -> list[int]:
+    rows = (
+        db.query(sql_models.UploadChunk.chunk_index)
+        .filter(sql_models.UploadChunk.session_id == session_id)
+        .order_by(sql_models.UploadChunk.chunk_index)
+        .all()
+    )
+    return [row.chunk_index for row in rows]
+
+
+def claim_upload_session(db: Session, session_id: str) -> bool:
+    """
+    Атомарно переводит открытую сессию в 'completing'. False — сессию уже
+    завершает (или завершил) другой запрос.
+    """
+    claimed = (
+        db.query(sql_models.UploadSession)
+        .filter(sql_models.UploadSession.id == session_id,
+                sql_models.UploadSession.status == sql_models.UPLOAD_STATUS_OPEN)
+        .update({sql_models.UploadSession.status: sql_models.UPLOAD_STATUS_COMPLETING}, synchronize_session=False)
+    )
+    db.commit()
+    return claimed == 1
+
+
+def release_upload_session(db: Session, session_id: str) -> None:
+    """Возвращает сессию в 'open' после неудачного завершения (можно повторить)."""
+    (
+        db.query(sql_models.UploadSession)
+        .filter(sql_models.UploadSession.id == session_id,
+                sql_models.UploadSession.status == sql_models.UPLOAD_STATUS_COMPLETING)
+        .update({sql_models.UploadSession.status: sql_models.UPLOAD_STATUS_OPEN}, synchronize_session=False)
+    )
+    db.commit()
+
+
+def complete_upload_session(db: Session, db_session: sql_models.UploadSession, analysis_id: int):
+    db_session.status = sql_models.UPLOAD_STATUS_COMPLETE
+    db_session.analysis_id = analysis_id
+    db.query(sql_models.UploadChunk).filter(sql_models.UploadChunk.session_id == db_session.id).delete()
+    db.commit()
+    db.refresh(db_session)
+    return db_session
+
+
+def delete_upload_session(db: Session, db_session: sql_models.UploadSession) -> None:
+    db.delete(db_session)
+    db.commit()
+
+
+def get_expired_upload_sessions(db: Session, max_age_hours: int):
+    """
+    Незавершенные сессии старше max_age_hours (для очистки), в том числе
+    оставшиеся в 'completing' после сбоя процесса во время завершения.
+    """
+    threshold = datetime.datetime.utcnow() - datetime.timedelta(hours=max_age_hours)
+    return (
+        db.query(sql_models.UploadSession)
+        .filter(sql_models.UploadSession.status.in_([sql_models.UPLOAD_STATUS_OPEN,
+                                                     sql_models.UPLOAD_STATUS_COMPLETING]),
+                sql_models.UploadSession.created_at < threshold)
+        .all()
+    )
@@ -1,8 +1,15 @@
 # Файл: crud/user_crud.py
 
+import datetime
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from models import sql_models, pydantic_models
 from core.security import get_password_hash
+from core.passwords import get_password_hash_async
+from core import user_cache
+from database import run_write
 
 
 # Функция для получения пользователя по имени
@@ -20,7 +27,6 @@ def create_user(db: Session, user: pydantic_models.UserCreate):
     # passlib/bcrypt обрабатывает усечение до 72 байт автоматически.
 
     # Хешируем оригинальный пароль
-    print(user)
     hashed_password = get_password_hash(user.password)
 
     db_user = sql_models.User(
@@ -40,6 +46,28 @@ def get_all_users(db: Session, skip: int = 0, limit: int = 100):
     """
     return db.query(sql_models.User).offset(skip).limit(limit).all()
 
+def update_user_password_hash(db: Session, user_id: int, hashed_password: str):
+    """Сохраняет пересчитанный хеш пароля (смена стоимости bcrypt)."""
+    db.query(sql_models.User).filter(sql_models.User.id == user_id).update(
+        {sql_models.User.hashed_password: hashed_password}, synchronize_session=False
+    )
+    db.commit()
+
+
+# --- Сброс кэша авторизации (core/user_cache.py) ---
+def _record_invalidation(db: Session, user_id: int):
+    """
+    Добавляет запись в журнал user_invalidations (в текущей транзакции) и
+    удаляет записи старше двух TTL кэша: процесс, не читавший журнал
+    дольше TTL, очищает кэш целиком и старые записи ему не нужны.
+    """
+    horizon = datetime.datetime.utcnow() - datetime.timedelta(seconds=2 * user_cache.USER_CACHE_TTL_SECONDS)
+    db.query(sql_models.UserInvalidation).filter(
+        sql_models.UserInvalidation.created_at < horizon
+    ).delete(synchronize_session=False)
+    db.add(sql_models.UserInvalidation(user_id=user_id))
+
+
 # --- НОВАЯ ФУНКЦИЯ: Обновление роли пользователя ---
 def update_user_role(db: Session, user_id: int, new_role: str):
     """
@@ -48,6 +76,61 @@ def update_user_role(db: Session, user_id: int, new_role: str):
     db_user = db.query(sql_models.User).filter(sql_models.User.id == user_id).first()
     if db_user:
         db_user.role = new_role
+        _record_invalidation(db, user_id)
+        db.commit()
+        user_cache.get_cache().invalidate(user_id)
+        db.refresh(db_user)
+    return db_user
+
+
+def set_user_active(db: Session, user_id: int, is_active: bool):
+    """
+    Блокирует (is_active=False) или разблокирует пользователя по его ID.
+    """
+    db_user = db.query(sql_models.User).filter(sql_models.User.id == user_id).first()
+    if db_user:
+        db_user.is_active = is_active
+        _record_invalidation(db, user_id)
         db.commit()
+        user_cache.get_cache().invalidate(user_id)
         db.refresh(db_user)
-    return db_user
\ No newline at end of file
+    return db_user
+
+# --- Асинхронные версии для обработчиков API (AsyncSession) ---
+
+async def get_user_by_username_async(db: AsyncSession, username: str):
+    stmt = select(sql_models.User).filter(sql_models.User.username == username)
+    return (await db.scalars(stmt)).first()
+
+
+async def get_user_by_id_async(db: AsyncSession, user_id: int):
+    return await db.get(sql_models.User, user_id)
+
+
+async def create_user_async(db: AsyncSession, user: pydantic_models.UserCreate):
+    db_user = sql_models.User(
+        username=user.username,
+        hashed_password=await get_password_hash_async(user.password),
+        role=user.role
+    )
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    return db_user
+
+
+async def get_all_users_async(db: AsyncSession, skip: int = 0, limit: int = 100):
+    stmt = select(sql_models.User).order_by(sql_models.User.id).offset(skip).limit(limit)
+    return (await db.scalars(stmt)).all()
+
+
+async def update_user_role_async(db: AsyncSession, user_id: int, new_role: str):
+    return await run_write(db, update_user_role, user_id, new_role)
+
+
+async def update_user_password_hash_async(db: AsyncSession, user_id: int, hashed_password: str):
+    await run_write(db, update_user_password_hash, user_id, hashed_password)
+
+
+async def set_user_active_async(db: AsyncSession, user_id: int, is_active: bool):
+    return await run_write(db, set_user_active, user_id, is_active)
@@ -1,17 +1,126 @@
 # Файл: main.py
+import time
+
+_import_started = time.perf_counter()
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI
-from database import init_db
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from database import init_db, async_engine, SessionLocal
+from core import tasks, inference, storage, passwords, metrics, sql_profiler
+
+from api.v1 import auth, analyses, admin, uploads, patients
+
+# --- Конфигурация запуска ---
+DATA_FOLDER = "data"
+# Сколько /readyz ждет ответа БД
+READINESS_DB_TIMEOUT = float(os.environ.get("READINESS_DB_TIMEOUT", "2"))
+
+# Время каждого этапа запуска в секундах (отдается в /readyz)
+startup_timings = {}
+_ready = False
+
+
+def ensure_admin_user() -> None:
+    """Создает тестового пользователя 'admin' (УДАЛИТЬ в продакшене!)."""
+    from crud import user_crud
+    from models.pydantic_models import UserCreate
+
+    db = SessionLocal()
+    try:
+        if not user_crud.get_user_by_username(db, "admin"):
+            admin_user = UserCreate(username="admin", password="password", role="admin")
+            user_crud.create_user(db, admin_user)
+            print("Тестовый пользователь 'admin' создан.")
+    except IntegrityError:
+        pass  # Одновременно создан другим процессом (uvicorn --workers N)
+    finally:
+        db.close()
+
+
+def _run_startup() -> None:
+    """Вся работа запуска: один раз на процесс, до приема запросов."""
+    def step(name, fn):
+        started = time.perf_counter()
+        fn()
+        startup_timings[name] = round(time.perf_counter() - started, 3)
+
+    step("dirs", lambda: (os.makedirs(DATA_FOLDER, exist_ok=True), storage.ensure_dirs()))
+    step("db", init_db)  # Создание таблиц и миграции схемы
+    step("admin", ensure_admin_user)
+    # Модель нужна и в режиме queue (версия модели входит в ключ кэша результатов)
+    step("model", inference.get_engine)
+    if inference.CV_WARMUP and tasks.INFERENCE_MODE == "inprocess":
+        step("warmup", inference.warmup)
+    # Встроенный воркер очереди CV (в режиме INFERENCE_MODE=inprocess) подхватывает
+    # и задачи, оставшиеся в очереди после перезапуска
+    step("workers", tasks.start)
 
-from api.v1 import auth, analyses, admin
 
-# Инициализация БД (создание таблиц)
-init_db()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _ready
+    started = time.perf_counter()
+    # В потоке: синхронная работа с БД и моделью не требует event loop
+    await asyncio.to_thread(_run_startup)
+    startup_timings["total"] = round(time.perf_counter() - started, 3)
+    _ready = True
+    print(f"Импорт приложения: {startup_timings['import']:.2f} с, запуск: {startup_timings['total']:.2f} с "
+          f"({', '.join(f'{k} {v:.2f}' for k, v in startup_timings.items() if k not in ('import', 'total'))})")
+    try:
+        yield
+    finally:
+        _ready = False  # /readyz отвечает 503, пока процесс завершается
+        tasks.shutdown()
+        inference.shutdown()
+        storage.shutdown()
+        passwords.shutdown()
 
-app = FastAPI(title="Система Компьютерного Зрения для Медицинской Диагностики")
 
-app.mount("/data", StaticFiles(directory="data"), name="data")
+app = FastAPI(title="Система Компьютерного Зрения для Медицинской Диагностики", lifespan=lifespan)
+
+# Каталог создается при запуске (см. _run_startup)
+app.mount("/data", StaticFiles(directory=DATA_FOLDER, check_dir=False), name="data")
+
+
+# --- Проверки для оркестратора ---
+@app.get("/healthz", tags=["Health"], summary="Процесс жив (liveness)")
+async def healthz():
+    return {"status": "ok"}
+
+
+@app.get("/readyz", tags=["Health"], summary="Процесс готов принимать запросы (readiness)")
+async def readyz():
+    """
+    503, пока запуск не завершен или процесс завершается, и если БД не
+    ответила за READINESS_DB_TIMEOUT секунд.
+    """
+    if not _ready:
+        return JSONResponse(status_code=503, content={"status": "starting", "startup": startup_timings})
+    try:
+        async with async_engine.connect() as conn:
+            await asyncio.wait_for(conn.execute(text("SELECT 1")), READINESS_DB_TIMEOUT)
+    except Exception as e:
+        return JSONResponse(status_code=503, content={"status": "db_unavailable", "error": str(e)})
+    return {"status": "ready", "startup": startup_timings}
+
+
+# --- Метрики Prometheus (см. core/metrics.py) ---
+@app.get("/metrics", tags=["Health"], summary="Метрики процесса в формате Prometheus",
+         include_in_schema=False)
+def get_metrics():
+    # Синхронный обработчик (в пуле потоков): сбор считает задачи очереди в БД
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Метрики отключены (METRICS_ENABLED=0).")
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 
 app.add_middleware(
     CORSMiddleware,
@@ -21,6 +130,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if sql_profiler.SQL_PROFILER != "off":
+    # Профилировщик SQL (отладка, тесты): см. core/sql_profiler.py
+    app.add_middleware(sql_profiler.SQLProfilerMiddleware)
+
+if metrics.METRICS_ENABLED:
+    # Последним: внешний слой, учитывает и ответы CORS
+    metrics.instrument_db()
+    app.add_middleware(metrics.MetricsMiddleware, router=app.router)
+
 
 # Регистрация роутера авторизации
 app.include_router(
@@ -37,18 +155,8 @@ app.include_router( # НОВЫЙ РОУТЕР
 
 app.include_router(admin.router) # НОВЫЙ РОУТЕР
 
-# --- Вспомогательный маршрут для создания тестового пользователя (УДАЛИТЬ в продакшене!) ---
-from crud import user_crud
-from models.pydantic_models import UserCreate
-from database import get_db, SessionLocal
-from core.security import get_password_hash
+app.include_router(uploads.router)  # Возобновляемая (блочная) загрузка
 
-# Создание тестового пользователя (например, администратора) при запуске
-try:
-    db = SessionLocal()
-    if not user_crud.get_user_by_username(db, "admin"):
-        admin_user = UserCreate(username="admin", password="password", role="admin")
-        user_crud.create_user(db, admin_user)
-        print("Тестовый пользователь 'admin' создан.")
-finally:
-    db.close()
\ No newline at end of file
+app.include_router(patients.router)  # История пациента и назначение лечения (Клиницист)
+
+startup_timings["import"] = round(time.perf_counter() - _import_started, 3)
@@ -0,0 +1,231 @@
+# Файл: manage.py
+#
+# Служебные команды (из каталога backend):
+#     python -m manage migrate          — применить миграции схемы к БД
+#     python -m manage status           — примененные и ожидающие миграции
+#     python -m manage check-indexes    — EXPLAIN QUERY PLAN для запросов crud/analysis_crud.py
+#     python -m manage rebuild-metrics  — пересчитать агрегаты метрик обратной связи с нуля
+#     python -m manage export-results   — выгрузить подтвержденные результаты (NDJSON/CSV/Parquet)
+#     python -m manage sweep-blobs      — удалить файлы хранилища и пирамиды, на которые ничего не ссылается
+
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import migrations
+from core import export, query_plan
+from core.pagination import encode_cursor, decode_cursor
+from crud import analysis_crud, export_crud, metrics_crud
+from models import sql_models
+
+
+def cmd_migrate(args) -> int:
+    from database import engine
+    applied = migrations.upgrade(engine)
+    if not applied:
+        print("Схема актуальна.")
+    print(f"Версия схемы: {migrations.current_version(engine)}")
+    return 0
+
+
+def cmd_status(args) -> int:
+    from database import engine
+    applied = migrations.get_applied_versions(engine)
+    for m in migrations.MIGRATIONS:
+        mark = "применена" if m.version in applied else "ожидает"
+        print(f"{m.version:>4}  {mark:<10} {m.description}")
+    return 0
+
+
+def cmd_rebuild_metrics(args) -> int:
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        confirmed = metrics_crud.rebuild_feedback_stats(db)
+        db.commit()
+        print(f"Агрегаты пересчитаны, подтвержденных результатов: {confirmed}")
+        print(metrics_crud.get_totals(db))
+    finally:
+        db.close()
+    return 0
+
+
+def cmd_sweep_blobs(args) -> int:
+    from core import storage
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        removed = storage.sweep_orphans(db, min_age_seconds=args.min_age_hours * 3600, dry_run=args.dry_run)
+    finally:
+        db.close()
+    prefix = "Будет удалено" if args.dry_run else "Удалено"
+    print(f"{prefix}: записей blob {removed['blobs']}, файлов {removed['files']}, пирамид {removed['pyramids']}")
+    return 0
+
+
+def cmd_export_results(args) -> int:
+    """
+    Выгрузка для переобучения модели: строки читаются курсором порциями
+    и сразу пишутся в файл (или stdout при --output -).
+    """
+    from database import SessionLocal
+    try:
+        export.ensure_format(args.format)
+    except export.ExportFormatUnavailable as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    filters = {"date_from": args.date_from, "date_to": args.date_to, "model_version": args.model_version}
+    fields = export_crud.EXPORT_FIELDS
+    output = args.output or export.filename(args.format)
+    exported = 0
+    db = SessionLocal()
+    try:
+        batches = export_crud.iter_confirmed_results(db, batch_size=args.batch_size, **filters)
+        if args.format == "parquet":
+            writer = export.ParquetWriter(sys.stdout.buffer if output == "-" else output,
+                                          fields, export_crud.EXPORT_TYPES)
+            for rows in batches:
+                writer.write(rows)
+                exported += len(rows)
+            writer.close()
+        else:
+            stream = sys.stdout.buffer if output == "-" else open(output, "wb")
+            try:
+                if args.format == "csv":
+                    stream.write(export.csv_chunk([fields]))
+                for rows in batches:
+                    stream.write(export.ndjson_chunk(fields, rows) if args.format == "ndjson"
+                                 else export.csv_chunk(rows))
+                    exported += len(rows)
+            finally:
+                if stream is not sys.stdout.buffer:
+                    stream.close()
+    finally:
+        db.close()
+    print(f"Выгружено результатов: {exported} -> {output}", file=sys.stderr)
+    return 0
+
+
+def _seed(db) -> None:
+    """Небольшой набор данных: планам SQLite достаточно схемы и индексов."""
+    db.add_all([
+        sql_models.User(id=1, username="diag", role="diagnostician"),
+        sql_models.Patient(id=1, medical_record_number="MRN-1"),
+    ])
+    now = datetime.datetime.utcnow()
+    for i in range(1, 6):
+        db.add(sql_models.Analysis(id=i, patient_id=1, diagnostician_id=1, image_path=f"{i}.png",
+                                   date_of_analysis=now - datetime.timedelta(days=i)))
+        db.add(sql_models.Result(analysis_id=i, system_diagnosis="-", is_confirmed=i % 2 == 0,
+                                 feedback_correct=1 if i % 2 == 0 else -1))
+    db.commit()
+
+
+def _crud_calls(db):
+    """Запросы чтения и обновления из crud/analysis_crud.py, которые должны идти по индексам."""
+    cursor = decode_cursor(encode_cursor(datetime.datetime.utcnow() - datetime.timedelta(days=2), 2))
+    day_ago = datetime.datetime.utcnow() - datetime.timedelta(days=3)
+    return [
+        ("get_patient_by_mrn", lambda: analysis_crud.get_patient_by_mrn(db, "MRN-1")),
+        ("get_analysis_by_id", lambda: analysis_crud.get_analysis_by_id(db, 1)),
+        ("get_analyses_for_diagnostician", lambda: analysis_crud.get_analyses_for_diagnostician(db, 1)),
+        ("get_analyses_for_diagnostician (cursor)",
+         lambda: analysis_crud.get_analyses_for_diagnostician(db, 1, cursor=cursor)),
+        ("get_analyses_for_diagnostician (confirmed, date_from)",
+         lambda: analysis_crud.get_analyses_for_diagnostician(db, 1, confirmed=True, date_from=day_ago)),
+        ("get_patient_history_by_mrn", lambda: analysis_crud.get_patient_history_by_mrn(db, "MRN-1")),
+        ("get_patient_history_by_mrn (cursor)",
+         lambda: analysis_crud.get_patient_history_by_mrn(db, "MRN-1", cursor=cursor)),
+        ("get_all_analyses", lambda: analysis_crud.get_all_analyses(db)),
+        ("get_all_analyses (cursor, confirmed=false)",
+         lambda: analysis_crud.get_all_analyses(db, cursor=cursor, confirmed=False)),
+        ("get_all_analyses (confirmed=true)", lambda: analysis_crud.get_all_analyses(db, confirmed=True)),
+        ("get_feedback_metrics", lambda: analysis_crud.get_feedback_metrics(db)),
+        ("update_analysis_conclusion", lambda: analysis_crud.update_analysis_conclusion(db, 1, "ok", 1)),
+        ("update_analysis_treatment_plan",
+         lambda: analysis_crud.update_analysis_treatment_plan(db, 2, "План", 1)),
+    ]
+
+
+def cmd_check_indexes(args) -> int:
+    """
+    Выполняет запросы analysis_crud на временной SQLite-БД со всеми миграциями
+    и проверяет их планы. Код выхода 1, если хотя бы один запрос читает
+    таблицу целиком или сортирует без индекса.
+    """
+    failed = 0
+    with tempfile.TemporaryDirectory() as workdir:
+        engine = create_engine(f"sqlite:///{os.path.join(workdir, 'check.db')}")
+        migrations.upgrade(engine)
+        db = sessionmaker(bind=engine)()
+        _seed(db)
+
+        for name, call in _crud_calls(db):
+            db.expire_all()
+            with query_plan.capture_statements(engine) as statements:
+                call()
+
+            problems = []
+            plans = []
+            for statement, parameters in statements:
+                plan = query_plan.explain(engine, statement, parameters)
+                if plan:
+                    plans.append((statement, plan))
+                    problems += query_plan.plan_problems(plan)
+
+            failed += bool(problems)
+            print(f"[{'FAIL' if problems else ' OK '}] {name}")
+            for problem in problems:
+                print(f"         {problem}")
+            if args.verbose:
+                for statement, plan in plans:
+                    print("         " + " ".join(statement.split())[:160])
+                    for line in plan:
+                        print(f"           {line}")
+        db.close()
+        engine.dispose()
+
+    print(f"Проверено запросов: {len(_crud_calls(None))}, с проблемами: {failed}")
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Служебные команды backend")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("migrate", help="Применить миграции схемы").set_defaults(fn=cmd_migrate)
+    commands.add_parser("status", help="Состояние миграций").set_defaults(fn=cmd_status)
+    check = commands.add_parser("check-indexes", help="Проверить планы запросов analysis_crud")
+    check.add_argument("-v", "--verbose", action="store_true", help="Показать SQL и полные планы")
+    check.set_defaults(fn=cmd_check_indexes)
+    commands.add_parser("rebuild-metrics", help="Пересчитать агрегаты метрик обратной связи").set_defaults(
+        fn=cmd_rebuild_metrics)
+    export_results = commands.add_parser("export-results", help="Выгрузить подтвержденные результаты")
+    export_results.add_argument("--format", choices=export.FORMATS, default="ndjson")
+    export_results.add_argument("-o", "--output", default=None,
+                                help="Файл выгрузки (по умолчанию confirmed_results_<время>.<формат>; - — stdout)")
+    export_results.add_argument("--date-from", type=datetime.date.fromisoformat, default=None,
+                                help="Дата анализа от, YYYY-MM-DD (включительно)")
+    export_results.add_argument("--date-to", type=datetime.date.fromisoformat, default=None,
+                                help="Дата анализа до, YYYY-MM-DD (не включительно)")
+    export_results.add_argument("--model-version", default=None)
+    export_results.add_argument("--batch-size", type=int, default=export.EXPORT_BATCH_SIZE,
+                                help="Строк в порции курсора")
+    export_results.set_defaults(fn=cmd_export_results)
+    sweep = commands.add_parser("sweep-blobs", help="Удалить файлы хранилища без ссылок")
+    sweep.add_argument("--min-age-hours", type=float, default=24,
+                       help="Не трогать файлы моложе (их может сохранять незавершенная загрузка)")
+    sweep.add_argument("--dry-run", action="store_true", help="Только посчитать, ничего не удалять")
+    sweep.set_defaults(fn=cmd_sweep_blobs)
+
+    args = parser.parse_args()
+    sys.exit(args.fn(args))
+
+
+if __name__ == "__main__":
+    main()
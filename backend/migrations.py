@@ -0,0 +1,204 @@
+# Файл: migrations.py
+#
+# Версионирование схемы БД. create_all создает только отсутствующие таблицы,
+# поэтому новые колонки и индексы существующих таблиц добавляются миграциями.
+# Примененные версии хранятся в таблице schema_migrations.
+#
+# Применяется автоматически в init_db(); вручную: python -m manage migrate
+
+import datetime
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Union
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+from sqlalchemy.orm import Session
+
+from models.sql_models import Base
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[Connection], None]
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str):
+    """Регистрирует функцию миграции. Версии применяются по возрастанию."""
+    def decorator(fn: Callable[[Connection], None]):
+        MIGRATIONS.append(Migration(version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return fn
+    return decorator
+
+
+# --- Хелперы (идемпотентны: на новой БД create_all уже создал объекты) ---
+# Описания колонок и индексов зафиксированы в самих миграциях, а не берутся
+# из моделей: примененная миграция не должна меняться вместе с моделью.
+DialectSQL = Union[str, Dict[str, str]]
+
+
+def _for_dialect(conn: Connection, sql: DialectSQL) -> str:
+    """SQL-фрагмент, общий для всех диалектов, либо {имя диалекта: фрагмент}."""
+    return sql if isinstance(sql, str) else sql[conn.dialect.name]
+
+
+def add_column(conn: Connection, table_name: str, column_name: str, ddl: DialectSQL) -> None:
+    """Добавляет колонку (ddl — тип и ограничения), если ее еще нет."""
+    existing = {column["name"] for column in inspect(conn).get_columns(table_name)}
+    if column_name in existing:
+        return
+    conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {_for_dialect(conn, ddl)}"))
+
+
+def create_index(conn: Connection, index_name: str, table_name: str, columns: List[str],
+                 unique: bool = False, where: Optional[DialectSQL] = None) -> None:
+    """Создает индекс (where — условие частичного индекса), если его еще нет."""
+    sql = (f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {index_name} "
+           f"ON {table_name} ({', '.join(columns)})")
+    if where is not None:
+        sql += f" WHERE {_for_dialect(conn, where)}"
+    conn.execute(text(sql))
+
+
+# --- Миграции ---
+@migration(1, "Хранилище blob и статус обработки анализа")
+def _blob_store_and_status(conn: Connection) -> None:
+    add_column(conn, "analyses", "image_digest", "VARCHAR")
+    add_column(conn, "analyses", "status", "VARCHAR")
+    add_column(conn, "analyses", "error_message", "VARCHAR")
+    add_column(conn, "results", "model_version", "VARCHAR")
+    create_index(conn, "ix_analyses_image_digest", "analyses", ["image_digest"])
+
+    # Старые анализы выполнялись синхронно: есть результат — done, иначе failed
+    conn.execute(text(
+        "UPDATE analyses SET status = 'done' WHERE status IS NULL "
+        "AND EXISTS (SELECT 1 FROM results WHERE results.analysis_id = analyses.id)"
+    ))
+    conn.execute(text(
+        "UPDATE analyses SET status = 'failed', error_message = 'Нет результата CV' WHERE status IS NULL"
+    ))
+
+
+@migration(2, "Маски сегментации в RLE")
+def _segmentation_rle(conn: Connection) -> None:
+    add_column(conn, "results", "segmentation_rle", {"sqlite": "BLOB", "postgresql": "BYTEA"})
+
+
+@migration(3, "Индексы списков анализов и метрик обратной связи")
+def _listing_indexes(conn: Connection) -> None:
+    create_index(conn, "ix_analyses_date_id", "analyses", ["date_of_analysis", "id"])
+    create_index(conn, "ix_analyses_diagnostician_date_id", "analyses", ["diagnostician_id", "date_of_analysis", "id"])
+    create_index(conn, "ix_analyses_patient_date_id", "analyses", ["patient_id", "date_of_analysis", "id"])
+    create_index(conn, "ix_results_analysis_id", "results", ["analysis_id"])
+    create_index(conn, "ix_results_confirmed_feedback", "results", ["is_confirmed", "feedback_correct"],
+                 where={"sqlite": "is_confirmed = 1", "postgresql": "is_confirmed = true"})
+
+
+@migration(4, "Агрегаты метрик обратной связи")
+def _feedback_stats(conn: Connection) -> None:
+    # Таблица создана create_all; заполняем ее по уже подтвержденным результатам
+    from crud import metrics_crud
+    metrics_crud.rebuild_feedback_stats(Session(bind=conn))
+
+
+@migration(5, "Версия истории пациента")
+def _patient_history_version(conn: Connection) -> None:
+    add_column(conn, "patients", "history_version", "INTEGER DEFAULT '0' NOT NULL")
+
+
+@migration(6, "Полнотекстовый поиск пациентов")
+def _patient_search_index(conn: Connection) -> None:
+    from crud import patient_crud
+    patient_crud.create_search_index(conn)
+
+
+@migration(7, "План лечения и клиницист анализа")
+def _treatment_plan(conn: Connection) -> None:
+    add_column(conn, "results", "treatment_plan", "VARCHAR")
+    add_column(conn, "analyses", "clinician_id", "INTEGER")
+
+
+@migration(8, "Один результат на анализ")
+def _unique_result_per_analysis(conn: Connection) -> None:
+    # Дубликаты могли записать два воркера, обработавшие одну задачу: остается
+    # подтвержденный результат, иначе самый ранний
+    deleted = conn.execute(text(
+        "DELETE FROM results WHERE EXISTS (SELECT 1 FROM results AS other "
+        "WHERE other.analysis_id = results.analysis_id AND ("
+        "COALESCE(other.is_confirmed, false) > COALESCE(results.is_confirmed, false) "
+        "OR (COALESCE(other.is_confirmed, false) = COALESCE(results.is_confirmed, false) "
+        "AND other.id < results.id)))"
+    )).rowcount
+    if deleted:
+        from crud import metrics_crud
+        metrics_crud.rebuild_feedback_stats(Session(bind=conn))
+    conn.execute(text("DROP INDEX IF EXISTS ix_results_analysis_id"))
+    create_index(conn, "ix_results_analysis_id", "results", ["analysis_id"], unique=True)
+
+
+# --- Запуск ---
+def _ensure_version_table(engine: Engine) -> None:
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, description VARCHAR, applied_at TIMESTAMP)"
+        ))
+
+
+def get_applied_versions(engine: Engine) -> set:
+    _ensure_version_table(engine)
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def current_version(engine: Engine) -> int:
+    return max(get_applied_versions(engine), default=0)
+
+
+def _create_tables(engine: Engine, attempts: int = 5) -> None:
+    """
+    create_all с повтором: при первом запуске таблицы одновременно создают
+    несколько процессов (uvicorn --workers N, воркеры CV), и проигравший
+    получает "table already exists". Повторный create_all их пропустит.
+    """
+    for attempt in range(attempts):
+        try:
+            Base.metadata.create_all(bind=engine)
+            return
+        except (OperationalError, ProgrammingError, IntegrityError):
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.2 * (attempt + 1))
+
+
+def upgrade(engine: Engine) -> List[Migration]:
+    """
+    Создает отсутствующие таблицы и применяет непримененные миграции,
+    каждую в своей транзакции. Запись версии вставляется первой: если
+    миграцию параллельно применяет другой процесс (API и воркеры стартуют
+    одновременно), вставка упирается в первичный ключ, и миграция пропускается.
+    """
+    _create_tables(engine)
+    applied = get_applied_versions(engine)
+
+    done = []
+    for m in MIGRATIONS:
+        if m.version in applied:
+            continue
+        try:
+            with engine.begin() as conn:
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)"),
+                    {"v": m.version, "d": m.description, "t": datetime.datetime.utcnow()}
+                )
+                m.apply(conn)
+        except IntegrityError:
+            continue  # Уже применена другим процессом
+        print(f"Миграция {m.version} применена: {m.description}")
+        done.append(m)
+    return done
@@ -49,6 +49,7 @@ class ResultInDB(ResultBase):
     diagnostician_conclusion: Optional[str] = None
     is_confirmed: bool = False
     feedback_correct: int = -1
+    treatment_plan: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -78,11 +79,19 @@ class PatientBase(BaseModel):
         from_attributes = True
 
 
+# --- Схема результата поиска пациентов (подсказки при вводе) ---
+class PatientSearchHit(PatientBase):
+    id: int
+    date_of_birth: Optional[str] = None
+
+
 # --- Схема анализа с полными данными (для истории) ---
 class AnalysisFull(BaseModel):
     id: int
     date_of_analysis: datetime
     image_path: str
+    image_digest: Optional[str] = None  # SHA-256 изображения в хранилище
+    status: Optional[str] = None  # queued / running / done / failed
     patient: PatientBase  # <-- Теперь использует исправленный PatientBase
     results: Optional[ResultInDB] = None
 
@@ -90,6 +99,20 @@ class AnalysisFull(BaseModel):
         from_attributes = True
 
 
+# --- Страница списка анализов (курсорная пагинация) ---
+class AnalysisPage(BaseModel):
+    items: list[AnalysisFull]
+    next_cursor: Optional[str] = None  # None — это последняя страница
+
+
+# --- Схема статуса фоновой обработки анализа ---
+class AnalysisStatus(BaseModel):
+    analysis_id: int
+    status: str  # queued / running / done / failed
+    error_message: Optional[str] = None
+    system_diagnosis: Optional[str] = None  # Заполняется после завершения CV
+
+
 # --- Схема для обновления заключения ---
 class ConclusionUpdate(BaseModel):
     conclusion: str
@@ -109,7 +132,6 @@ class ClinicianAnalysis(BaseModel):
     id: int
     date_of_analysis: datetime
     image_path: str
-    # Assuming ResultInDB now includes 'treatment_plan' and other fields
     results: Optional[ResultInDB] = None
     diagnostician: Optional[UserBase] = None  # Кто подтвердил окончательный диагноз
 
@@ -121,6 +143,7 @@ class ClinicianAnalysis(BaseModel):
 class PatientHistory(BaseModel):
     patient: PatientBase
     analyses: list[ClinicianAnalysis]
+    next_cursor: Optional[str] = None  # Курсор следующей страницы анализов
 
 
 # --- Схема запроса для обновления плана лечения ---
@@ -130,8 +153,124 @@ class TreatmentUpdate(BaseModel):
 class UserRoleUpdate(BaseModel):
     role: str # Ожидаемые значения: 'diagnostician', 'clinician', 'admin'
 
+class UserActiveUpdate(BaseModel):
+    is_active: bool # False — учетная запись заблокирована
+
 # --- Схема для метрик модели ---
 class ModelMetrics(BaseModel):
     total_confirmed: int
     correct_predictions: int
     accuracy_percentage: float
+
+
+class ModelMetricsPoint(ModelMetrics):
+    period_start: str  # YYYY-MM-DD: день или понедельник недели (по дате анализа)
+
+
+class DiagnosisMetrics(ModelMetrics):
+    system_diagnosis: str
+    incorrect_predictions: int
+
+
+class ModelVersionMetrics(ModelMetrics):
+    model_version: Optional[str] = None  # None — результаты до учета версий
+
+
+# --- Схемы очереди инференса ---
+class InferenceJob(BaseModel):
+    id: int
+    analysis_id: int
+    status: str  # pending / leased / done / dead
+    attempts: int
+    max_attempts: int
+    last_error: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class JobQueueStats(BaseModel):
+    pending: int
+    leased: int
+    done: int
+    dead: int
+
+
+# --- Схема статистики кэша результатов CV ---
+class CacheStats(BaseModel):
+    # Счетчики попаданий и промахов — процесса process_id, а не всех процессов API
+    counters_scope: str
+    process_id: int
+    memory_hits: int
+    disk_hits: int
+    misses: int
+    hit_rate: float
+    memory_items: int
+    disk_items: int
+    disk_bytes: int
+    max_bytes: int
+
+
+class UserCacheStats(BaseModel):
+    hits: int
+    misses: int
+    hit_rate: float
+    invalidations: int
+    items: int
+    max_items: int
+
+
+# --- Схемы возобновляемой загрузки ---
+class UploadSessionCreate(BaseModel):
+    patient_mrn: str
+    filename: str
+    total_size: int  # Полный размер файла, байт
+    chunk_size: int = 8 * 1024 * 1024  # Размер блока, байт
+
+
+class UploadSessionStatus(BaseModel):
+    id: str
+    patient_mrn: str
+    filename: str
+    total_size: int
+    chunk_size: int
+    chunk_count: int
+    received_chunks: list[int]
+    received_bytes: int
+    status: str  # open / complete
+    analysis_id: Optional[int] = None
+
+
+# --- Схемы пирамиды изображения (тайловый просмотрщик) ---
+class PyramidLevel(BaseModel):
+    level: int  # 0 — полное разрешение, каждый следующий в 2 раза меньше
+    width: int
+    height: int
+    cols: int  # Количество тайлов по горизонтали
+    rows: int  # Количество тайлов по вертикали
+
+
+class PyramidInfo(BaseModel):
+    width: int
+    height: int
+    channels: int
+    tile_size: int
+    levels: list[PyramidLevel]
+
+
+# --- Схемы статистики маски сегментации ---
+class SegmentationRegion(BaseModel):
+    area: int  # Пикселей маски
+    bbox: list[int]  # [x0, y0, x1, y1), координаты маски
+    centroid: list[float]  # [x, y]
+
+
+class SegmentationRegions(BaseModel):
+    mask_width: int
+    mask_height: int
+    total_area: int
+    coverage: float  # Доля площади маски, 0..1
+    region_count: int
+    regions: list[SegmentationRegion]  # По убыванию площади (не больше limit)
@@ -1,12 +1,34 @@
 # models/sql_models.py
 
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Float
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, ForeignKey, DateTime, Float, LargeBinary, UniqueConstraint, Index
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 import datetime
 
 Base = declarative_base()
 
+# --- Статусы обработки анализа моделью CV ---
+ANALYSIS_STATUS_QUEUED = "queued"    # Файл сохранен, анализ ожидает очереди
+ANALYSIS_STATUS_RUNNING = "running"  # Модель CV обрабатывает изображение
+ANALYSIS_STATUS_DONE = "done"        # Результаты CV сохранены
+ANALYSIS_STATUS_FAILED = "failed"    # Ошибка при обработке
+
+# --- Статусы задач очереди инференса ---
+JOB_STATUS_PENDING = "pending"  # Ожидает свободного воркера
+JOB_STATUS_LEASED = "leased"    # Захвачена воркером (до lease_expires_at)
+JOB_STATUS_DONE = "done"        # Успешно выполнена
+JOB_STATUS_DEAD = "dead"        # Исчерпаны попытки (dead-letter)
+
+# --- Периоды агрегатов обратной связи ---
+FEEDBACK_PERIOD_TOTAL = "total"  # За все время (period_start = "")
+FEEDBACK_PERIOD_DAY = "day"      # По дням (period_start = дата анализа)
+FEEDBACK_PERIOD_WEEK = "week"    # По неделям (period_start = понедельник)
+
+# --- Статусы сессий возобновляемой загрузки ---
+UPLOAD_STATUS_OPEN = "open"          # Принимает блоки
+UPLOAD_STATUS_COMPLETING = "completing"  # Файл собирается, анализ создается (один запрос /complete)
+UPLOAD_STATUS_COMPLETE = "complete"  # Файл собран, анализ создан
+
 
 class User(Base):
     __tablename__ = "users"
@@ -15,7 +37,8 @@ class User(Base):
     hashed_password = Column(String)
     role = Column(String)  # 'diagnostician', 'clinician', 'admin'
     is_active = Column(Boolean, default=True)
-    analyses_assigned = relationship("Analysis", back_populates="diagnostician")
+    analyses_assigned = relationship("Analysis", back_populates="diagnostician",
+                                     foreign_keys="Analysis.diagnostician_id")
 
 
 class Patient(Base):
@@ -25,6 +48,18 @@ class Patient(Base):
     last_name = Column(String)
     date_of_birth = Column(String)
     medical_record_number = Column(String, unique=True, index=True)
+    # Растет при каждом изменении истории анализов (ETag и кэш GET /v1/patients/{mrn}/history)
+    history_version = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+class Blob(Base):
+    """Файл в контентно-адресуемом хранилище (один на уникальное содержимое)."""
+    __tablename__ = "blobs"
+    digest = Column(String, primary_key=True)  # SHA-256 содержимого (hex)
+    path = Column(String)  # Путь к файлу на диске
+    size = Column(Integer)  # Размер в байтах
+    ref_count = Column(Integer, default=0)  # Сколько анализов ссылается на файл
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
 
 class Analysis(Base):
@@ -33,22 +68,116 @@ class Analysis(Base):
     patient_id = Column(Integer, ForeignKey("patients.id"))
     diagnostician_id = Column(Integer, ForeignKey("users.id"))
     date_of_analysis = Column(DateTime, default=datetime.datetime.utcnow)
-    image_path = Column(String)  # Путь к оригинальному файлу
+    image_path = Column(String)  # Путь к оригинальному файлу (blob в хранилище)
+    image_digest = Column(String, ForeignKey("blobs.digest"), nullable=True, index=True)  # SHA-256 изображения
+    status = Column(String, default=ANALYSIS_STATUS_QUEUED)  # Статус обработки CV
+    error_message = Column(String, nullable=True)  # Текст ошибки, если status == 'failed'
+    clinician_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # Кто назначил лечение
 
     patient = relationship("Patient")
     results = relationship("Result", back_populates="analysis", uselist=False)
-    diagnostician = relationship("User", back_populates="analyses_assigned")
+    diagnostician = relationship("User", back_populates="analyses_assigned", foreign_keys=[diagnostician_id])
+
+    # Индексы под курсорную пагинацию списков (сортировка по дате и id)
+    __table_args__ = (
+        Index("ix_analyses_date_id", "date_of_analysis", "id"),
+        Index("ix_analyses_diagnostician_date_id", "diagnostician_id", "date_of_analysis", "id"),
+        Index("ix_analyses_patient_date_id", "patient_id", "date_of_analysis", "id"),
+    )
 
 
 class Result(Base):
     __tablename__ = "results"
     id = Column(Integer, primary_key=True, index=True)
-    analysis_id = Column(Integer, ForeignKey("analyses.id"))
+    # Один результат на анализ: повторная запись (два воркера по одной задаче) отклоняется БД
+    analysis_id = Column(Integer, ForeignKey("analyses.id"), unique=True, index=True)
     system_diagnosis = Column(String)
-    system_segmentation_path = Column(String)  # Путь к маске CV
+    system_segmentation_path = Column(String, nullable=True)  # Путь к PNG-маске (старые результаты)
+    # Маска CV в формате RLE (core/rle.py); загружается только при обращении
+    segmentation_rle = deferred(Column(LargeBinary, nullable=True))
+    model_version = Column(String, nullable=True)  # Версия модели CV, давшей результат
 
     diagnostician_conclusion = Column(String, nullable=True)  # Окончательное заключение
     is_confirmed = Column(Boolean, default=False)
     feedback_correct = Column(Integer, default=-1)  # -1: нет, 0: ошибочно, 1: корректно
+    treatment_plan = Column(String, nullable=True)  # План лечения (Клиницист)
+
+    analysis = relationship("Analysis", back_populates="results")
+
+    # Частичный индекс для метрик обратной связи: только подтвержденные результаты
+    __table_args__ = (
+        Index("ix_results_confirmed_feedback", "is_confirmed", "feedback_correct",
+              sqlite_where=is_confirmed == True, postgresql_where=is_confirmed == True),  # noqa: E712
+    )
+
+class InferenceJob(Base):
+    """Персистентная задача очереди инференса (одна на анализ)."""
+    __tablename__ = "inference_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    analysis_id = Column(Integer, ForeignKey("analyses.id"), unique=True, index=True)
+    status = Column(String, default=JOB_STATUS_PENDING, index=True)
+    attempts = Column(Integer, default=0)  # Сколько раз задача была захвачена
+    max_attempts = Column(Integer, default=3)
+    available_at = Column(DateTime, default=datetime.datetime.utcnow)  # Не раньше (для backoff)
+    lease_owner = Column(String, nullable=True)  # ID воркера, захватившего задачу
+    lease_expires_at = Column(DateTime, nullable=True)  # После истечения задачу может забрать другой воркер
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+    analysis = relationship("Analysis")
+
+
+class UploadSession(Base):
+    """Сессия возобновляемой (блочной) загрузки большого файла."""
+    __tablename__ = "upload_sessions"
+    id = Column(String, primary_key=True)  # UUID сессии
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
+    patient_mrn = Column(String)
+    filename = Column(String)
+    total_size = Column(BigInteger)  # Полный размер файла, байт
+    chunk_size = Column(Integer)  # Размер блока (последний может быть меньше)
+    status = Column(String, default=UPLOAD_STATUS_OPEN)
+    analysis_id = Column(Integer, ForeignKey("analyses.id"), nullable=True)  # После завершения
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    chunks = relationship("UploadChunk", cascade="all, delete-orphan")
+
+
+class UploadChunk(Base):
+    """Полученный блок сессии загрузки."""
+    __tablename__ = "upload_chunks"
+    __table_args__ = (UniqueConstraint("session_id", "chunk_index"),)
+    id = Column(Integer, primary_key=True)
+    session_id = Column(String, ForeignKey("upload_sessions.id"), index=True)
+    chunk_index = Column(Integer)
+    size = Column(Integer)
+
+
+class FeedbackStat(Base):
+    """
+    Агрегат обратной связи врачей по результатам CV. Обновляется в той же
+    транзакции, что и подтверждение заключения (crud/metrics_crud.py),
+    поэтому метрики читаются без подсчета по таблице results.
+    """
+    __tablename__ = "feedback_stats"
+    __table_args__ = (UniqueConstraint("period", "period_start", "model_version", "system_diagnosis"),)
+    id = Column(Integer, primary_key=True)
+    period = Column(String, nullable=False)  # total / day / week
+    period_start = Column(String(10), nullable=False, default="")  # YYYY-MM-DD (по дате анализа)
+    model_version = Column(String, nullable=False, default="")  # "" — версия неизвестна
+    system_diagnosis = Column(String, nullable=False, default="")
+    confirmed = Column(Integer, nullable=False, default=0)  # Подтвержденных результатов
+    correct = Column(Integer, nullable=False, default=0)  # Из них вывод системы корректен
+
 
-    analysis = relationship("Analysis", back_populates="results")
\ No newline at end of file
+class UserInvalidation(Base):
+    """
+    Журнал изменений пользователей (роль, блокировка) для сброса кэша
+    авторизации во всех процессах API (core/user_cache.py). Пишется в той
+    же транзакции, что и изменение; старые записи удаляются там же.
+    """
+    __tablename__ = "user_invalidations"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
@@ -0,0 +1,51 @@
+# Файл: worker.py
+#
+# Отдельный процесс-воркер очереди инференса.
+# Запуск (из каталога backend, можно несколько экземпляров на разных ядрах/хостах):
+#     INFERENCE_MODE=queue python -m worker --concurrency 16
+
+import argparse
+import signal
+
+from database import init_db
+from core import inference, metrics, tasks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воркер очереди CV инференса")
+    parser.add_argument("--concurrency", type=int, default=tasks.CV_MAX_WORKERS,
+                        help="Сколько задач обрабатывать одновременно (слотов пула)")
+    parser.add_argument("--lease-seconds", type=int, default=tasks.CV_JOB_LEASE_SECONDS)
+    parser.add_argument("--poll-interval", type=float, default=tasks.CV_POLL_INTERVAL)
+    parser.add_argument("--once", action="store_true", help="Захватить задачи на все слоты, выполнить их и выйти")
+    parser.add_argument("--metrics-port", type=int, default=0,
+                        help="Порт GET /metrics для Prometheus (0 — не отдавать метрики)")
+    args = parser.parse_args()
+
+    init_db()
+    if args.metrics_port and metrics.METRICS_ENABLED:
+        metrics.instrument_db()
+        metrics.serve(args.metrics_port)
+    if inference.CV_WARMUP:
+        inference.warmup()  # Модель загружена до первой задачи
+    worker = tasks.Worker(
+        concurrency=args.concurrency,
+        lease_seconds=args.lease_seconds,
+        poll_interval=args.poll_interval
+    )
+
+    if args.once:
+        print(f"Обработано задач: {worker.run_once()}")
+        return
+
+    # Корректное завершение по Ctrl+C / docker stop
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    signal.signal(signal.SIGINT, lambda *_: worker.stop())
+
+    print(f"Воркер {worker.worker_id} запущен.")
+    worker.run()
+    print(f"Воркер {worker.worker_id} остановлен.")
+
+
+if __name__ == "__main__":
+    main()
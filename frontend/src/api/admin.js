@@ -13,8 +13,19 @@ export const updateRole = async (userId, newRole) => {
     return response.data;
 };
 
-export const fetchAllAnalyses = async () => {
-    const response = await axios.get('/v1/admin/analyses/all');
+// Блокировка (isActive = false) или разблокировка пользователя
+export const setUserActive = async (userId, isActive) => {
+    const response = await axios.patch(`/v1/admin/users/${userId}/active`, {
+        is_active: isActive
+    });
+    return response.data;
+};
+
+// Возвращает страницу { items: [...], next_cursor }
+export const fetchAllAnalyses = async (cursor = null) => {
+    const response = await axios.get('/v1/admin/analyses/all', {
+        params: { cursor: cursor || undefined },
+    });
     return response.data;
 };
 
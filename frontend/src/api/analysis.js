@@ -24,12 +24,15 @@ export const uploadAnalysis = async (file, patientMrn) => {
 
 // --- Функция для получения списка анализов (для истории) ---
 /**
- * Получает историю анализов для текущего диагноста.
- * (Этот маршрут мы еще не реализовали на FastAPI, но готовим функцию)
+ * Получает страницу истории анализов текущего диагноста (новые сначала).
+ * @param {string|null} cursor - next_cursor предыдущей страницы (null — первая страница).
+ * @param {object} filters - { confirmed, date_from, date_to, limit }.
+ * @returns {Promise<object>} { items: [...], next_cursor }
  */
-export const fetchAnalysisHistory = async () => {
-    // Предполагаемый маршрут
-    const response = await axios.get('/v1/analyses/my_history');
+export const fetchAnalysisHistory = async (cursor = null, filters = {}) => {
+    const response = await axios.get('/v1/analyses/my_history', {
+        params: { ...filters, cursor: cursor || undefined },
+    });
     return response.data;
 };
 
@@ -57,13 +60,23 @@ export const confirmDiagnosis = async (analysisId, conclusion, isCorrect) => {
 };
 
 
+/**
+ * Подсказки при вводе: пациенты, у которых MRN, фамилия или имя начинаются со слов запроса.
+ */
+export const searchPatients = async (query, limit = 10) => {
+    const response = await axios.get('/v1/patients/search', { params: { q: query, limit } });
+    return response.data;
+};
+
 /**
  * Получает полную историю анализов пациента по MRN.
  */
-export const fetchPatientHistory = async (mrn) => {
+export const fetchPatientHistory = async (mrn, cursor = null) => {
     // Используем новый маршрут /v1/patients/
-    const response = await axios.get(`/v1/patients/${mrn}/history`);
-    return response.data; // Возвращает объект { patient: {...}, analyses: [...] }
+    const response = await axios.get(`/v1/patients/${mrn}/history`, {
+        params: { cursor: cursor || undefined },
+    });
+    return response.data; // Возвращает объект { patient: {...}, analyses: [...], next_cursor }
 };
 
 /**
@@ -75,4 +88,50 @@ export const prescribeTreatment = async (analysisId, treatmentPlan) => {
         treatment_plan: treatmentPlan,
     });
     return response.data;
-};
\ No newline at end of file
+};
+/**
+ * Получает уровни пирамиды изображения (размеры и количество тайлов).
+ */
+export const fetchPyramid = async (analysisId) => {
+    const response = await axios.get(`/v1/analyses/${analysisId}/pyramid`);
+    return response.data; // { width, height, tile_size, levels: [{ level, width, height, cols, rows }] }
+};
+
+/**
+ * Загружает один тайл как Blob. Тайлы неизменны (Cache-Control: immutable),
+ * поэтому повторные запросы обслуживает кэш браузера.
+ */
+export const fetchTile = async (analysisId, level, x, y) => {
+    const response = await axios.get(
+        `/v1/analyses/${analysisId}/tiles/${level}/${x}/${y}`,
+        { responseType: 'blob' }
+    );
+    return response.data;
+};
+
+/**
+ * Загружает миниатюру снимка (до 256x256) как Blob.
+ */
+export const fetchThumbnail = async (analysisId) => {
+    const response = await axios.get(`/v1/analyses/${analysisId}/thumbnail`, { responseType: 'blob' });
+    return response.data;
+};
+
+/**
+ * Загружает наложение маски сегментации (PNG с прозрачностью) в заданном разрешении.
+ */
+export const fetchSegmentationOverlay = async (analysisId, width, height) => {
+    const response = await axios.get(`/v1/analyses/${analysisId}/segmentation/overlay`, {
+        params: { width, height },
+        responseType: 'blob',
+    });
+    return response.data;
+};
+
+/**
+ * Получает статистику областей маски: площадь, рамки, центры.
+ */
+export const fetchSegmentationRegions = async (analysisId, limit = 10) => {
+    const response = await axios.get(`/v1/analyses/${analysisId}/segmentation/regions`, { params: { limit } });
+    return response.data;
+};
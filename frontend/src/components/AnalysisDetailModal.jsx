@@ -1,7 +1,7 @@
 // src/components/AnalysisDetailModal.jsx
 import React, { useState } from 'react';
-
-const API_BASE_URL = "http://127.0.0.1:8000";
+import TiledImageViewer from './TiledImageViewer';
+import SegmentationOverlay from './SegmentationOverlay';
 
 const AnalysisDetailModal = ({ analysis, onClose, onConfirm }) => {
     const [conclusion, setConclusion] = useState(analysis.results.diagnostician_conclusion || '');
@@ -10,10 +10,6 @@ const AnalysisDetailModal = ({ analysis, onClose, onConfirm }) => {
 
     const isConfirmed = analysis.results.is_confirmed;
 
-    // В реальной жизни пути к файлам должны быть настроены через статические маршруты FastAPI
-    const originalImageUrl = `${API_BASE_URL}/${analysis.image_path}`;
-    const segmentationImageUrl = `${API_BASE_URL}/${analysis.results.system_segmentation_path}`;
-
     const handleConfirm = async () => {
         if (!conclusion.trim()) {
             alert("Заключение не может быть пустым.");
@@ -37,13 +33,13 @@ const AnalysisDetailModal = ({ analysis, onClose, onConfirm }) => {
                 <div style={styles.imageContainer}>
                     <div style={styles.imageBox}>
                         <h4>Оригинальный Снимок</h4>
-                        {/* ⚠️ Примечание: Для работы этого тега бэкенд должен отдавать статические файлы! */}
-                        <img src={originalImageUrl} alt="Оригинальный снимок" style={styles.image} />
+                        {/* Снимок загружается тайлами: только видимая область текущего масштаба */}
+                        <TiledImageViewer analysisId={analysis.id} />
                     </div>
                     <div style={styles.imageBox}>
                         <h4>Сегментация CV (Аномалии)</h4>
-                        {/* ⚠️ Заглушечный путь к маске, замените на реальную маску */}
-                        <img src={segmentationImageUrl} alt="Маска сегментации" style={styles.image} />
+                        {/* Маска хранится в RLE и рисуется сервером поверх миниатюры */}
+                        <SegmentationOverlay analysisId={analysis.id} />
                     </div>
                 </div>
 
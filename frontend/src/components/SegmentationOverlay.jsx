@@ -0,0 +1,74 @@
+// src/components/SegmentationOverlay.jsx
+import React, { useEffect, useState } from 'react';
+import { fetchThumbnail, fetchSegmentationOverlay, fetchSegmentationRegions } from '../api/analysis';
+
+/**
+ * Миниатюра снимка с наложенной маской сегментации и сводкой по областям.
+ * Маска рисуется на сервере в разрешении миниатюры (из RLE).
+ */
+const SegmentationOverlay = ({ analysisId }) => {
+    const [thumbnailUrl, setThumbnailUrl] = useState(null);
+    const [overlayUrl, setOverlayUrl] = useState(null);
+    const [stats, setStats] = useState(null);
+    const [error, setError] = useState(null);
+
+    useEffect(() => {
+        let thumbUrl = null;
+        let maskUrl = null;
+
+        const load = async () => {
+            try {
+                const thumbnail = await fetchThumbnail(analysisId);
+                thumbUrl = URL.createObjectURL(thumbnail);
+                const bitmap = await createImageBitmap(thumbnail);
+                const overlay = await fetchSegmentationOverlay(analysisId, bitmap.width, bitmap.height);
+                maskUrl = URL.createObjectURL(overlay);
+                setThumbnailUrl(thumbUrl);
+                setOverlayUrl(maskUrl);
+                setStats(await fetchSegmentationRegions(analysisId, 5));
+            } catch (e) {
+                setError("Маска сегментации недоступна.");
+            }
+        };
+        load();
+
+        return () => {
+            if (thumbUrl) URL.revokeObjectURL(thumbUrl);
+            if (maskUrl) URL.revokeObjectURL(maskUrl);
+        };
+    }, [analysisId]);
+
+    if (error) return <p>{error}</p>;
+    if (!thumbnailUrl) return <p>Загрузка маски...</p>;
+
+    return (
+        <div>
+            <div style={styles.stack}>
+                <img src={thumbnailUrl} alt="Снимок" style={styles.image} />
+                <img src={overlayUrl} alt="Маска сегментации" style={{ ...styles.image, ...styles.overlay }} />
+            </div>
+            {stats && (
+                <p style={styles.stats}>
+                    Областей: {stats.region_count}, площадь маски: {(stats.coverage * 100).toFixed(1)}%
+                </p>
+            )}
+        </div>
+    );
+};
+
+const styles = {
+    stack: {
+        position: 'relative', display: 'inline-block'
+    },
+    image: {
+        display: 'block', maxWidth: '100%', border: '1px solid #ccc'
+    },
+    overlay: {
+        position: 'absolute', top: 0, left: 0, width: '100%', height: '100%'
+    },
+    stats: {
+        fontSize: '0.9em', color: '#555'
+    }
+};
+
+export default SegmentationOverlay;
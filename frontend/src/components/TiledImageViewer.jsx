@@ -0,0 +1,105 @@
+// src/components/TiledImageViewer.jsx
+import React, { useEffect, useRef, useState } from 'react';
+import { fetchPyramid, fetchTile } from '../api/analysis';
+
+const VIEWPORT_HEIGHT = 400;
+
+/**
+ * Просмотрщик больших снимков: загружает только тайлы, попадающие в видимую
+ * область, на текущем уровне пирамиды (0 — полное разрешение).
+ */
+const TiledImageViewer = ({ analysisId }) => {
+    const [pyramid, setPyramid] = useState(null);
+    const [level, setLevel] = useState(null);
+    const [viewport, setViewport] = useState({ left: 0, top: 0, width: 0, height: VIEWPORT_HEIGHT });
+    const [tileUrls, setTileUrls] = useState({});
+    const [error, setError] = useState(null);
+    const containerRef = useRef(null);
+    const requestedRef = useRef(new Set());
+
+    // 1. Метаданные пирамиды; начинаем с самого мелкого уровня
+    useEffect(() => {
+        fetchPyramid(analysisId)
+            .then((data) => {
+                setPyramid(data);
+                setLevel(data.levels.length - 1);
+            })
+            .catch(() => setError("Тайлы для этого снимка недоступны."));
+    }, [analysisId]);
+
+    // Освобождаем object URL при закрытии
+    const tileUrlsRef = useRef(tileUrls);
+    tileUrlsRef.current = tileUrls;
+    useEffect(() => () => Object.values(tileUrlsRef.current).forEach(URL.revokeObjectURL), []);
+
+    const updateViewport = () => {
+        const el = containerRef.current;
+        if (el) {
+            setViewport({ left: el.scrollLeft, top: el.scrollTop, width: el.clientWidth, height: el.clientHeight });
+        }
+    };
+
+    useEffect(updateViewport, [level]);
+
+    // 2. Загружаем только видимые тайлы текущего уровня
+    useEffect(() => {
+        if (!pyramid || level === null) return;
+        const info = pyramid.levels[level];
+        const size = pyramid.tile_size;
+        const x0 = Math.floor(viewport.left / size);
+        const y0 = Math.floor(viewport.top / size);
+        const x1 = Math.min(info.cols - 1, Math.floor((viewport.left + viewport.width) / size));
+        const y1 = Math.min(info.rows - 1, Math.floor((viewport.top + viewport.height) / size));
+
+        for (let y = y0; y <= y1; y++) {
+            for (let x = x0; x <= x1; x++) {
+                const key = `${level}/${x}/${y}`;
+                if (requestedRef.current.has(key)) continue;
+                requestedRef.current.add(key);
+                fetchTile(analysisId, level, x, y)
+                    .then((blob) => setTileUrls((urls) => ({ ...urls, [key]: URL.createObjectURL(blob) })))
+                    .catch(() => requestedRef.current.delete(key));
+            }
+        }
+    }, [analysisId, pyramid, level, viewport]);
+
+    if (error) return <p>{error}</p>;
+    if (!pyramid || level === null) return <p>Загрузка снимка...</p>;
+
+    const info = pyramid.levels[level];
+    const size = pyramid.tile_size;
+    const visibleTiles = Object.keys(tileUrls).filter((key) => key.startsWith(`${level}/`));
+
+    return (
+        <div>
+            <div style={styles.toolbar}>
+                <button onClick={() => setLevel(Math.max(0, level - 1))} disabled={level === 0}>+</button>
+                <button onClick={() => setLevel(Math.min(pyramid.levels.length - 1, level + 1))}
+                        disabled={level === pyramid.levels.length - 1}>&minus;</button>
+                <span> {info.width}&times;{info.height}</span>
+            </div>
+            <div ref={containerRef} onScroll={updateViewport} style={styles.viewport}>
+                <div style={{ position: 'relative', width: info.width, height: info.height }}>
+                    {visibleTiles.map((key) => {
+                        const [, x, y] = key.split('/').map(Number);
+                        return (
+                            <img key={key} src={tileUrls[key]} alt=""
+                                 style={{ position: 'absolute', left: x * size, top: y * size }} />
+                        );
+                    })}
+                </div>
+            </div>
+        </div>
+    );
+};
+
+const styles = {
+    toolbar: {
+        display: 'flex', gap: '5px', alignItems: 'center', marginBottom: '5px'
+    },
+    viewport: {
+        height: `${VIEWPORT_HEIGHT}px`, overflow: 'auto', border: '1px solid #ccc', backgroundColor: '#111'
+    }
+};
+
+export default TiledImageViewer;
@@ -24,7 +24,7 @@ const UploadForm = ({ onUploadSuccess }) => {
         try {
             const result = await uploadAnalysis(file, patientMrn);
 
-            setMessage(`✅ Анализ успешно запущен! ID: ${result.analysis_id}. Диагноз системы: ${result.system_diagnosis}`);
+            setMessage(`✅ Анализ поставлен в очередь! ID: ${result.analysis_id}. Статус: ${result.status}`);
 
             // Сброс формы
             setFile(null);
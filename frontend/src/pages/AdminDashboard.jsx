@@ -2,7 +2,7 @@
 
 import React, { useState, useEffect } from 'react';
 import { useAuth } from '../context/AuthContext';
-import { fetchAllUsers, updateRole, fetchAllAnalyses, fetchModelMetrics } from '../api/admin';
+import { fetchAllUsers, updateRole, setUserActive, fetchAllAnalyses, fetchModelMetrics } from '../api/admin';
 
 const AdminDashboard = () => {
     const { user, logout, token } = useAuth(); // Добавляем 'token' для защищенной загрузки
@@ -52,7 +52,7 @@ const AdminDashboard = () => {
             ]);
 
             setUsers(usersData);
-            setAnalyses(analysesData);
+            setAnalyses(analysesData.items);
             setMetrics(metricsData);
         } catch (e) {
             console.error("Ошибка загрузки данных администратора:", e);
@@ -86,6 +86,17 @@ const AdminDashboard = () => {
         }
     };
 
+    // --- Обработчик блокировки пользователя ---
+    const handleActiveChange = async (userId, isActive) => {
+        try {
+            await setUserActive(userId, isActive);
+            alert(`Пользователь ID ${userId} ${isActive ? 'разблокирован' : 'заблокирован'}`);
+            loadData(); // Перезагружаем данные
+        } catch (e) {
+            alert(`Ошибка изменения статуса: ${e.response?.data?.detail || 'Неизвестная ошибка'}`);
+        }
+    };
+
     // --- Рендеринг: Управление Пользователями ---
     const renderUserManagement = () => (
         <table style={styles.table}>
@@ -94,6 +105,7 @@ const AdminDashboard = () => {
                     <th style={styles.th}>ID</th>
                     <th style={styles.th}>Логин</th>
                     <th style={styles.th}>Текущая Роль</th>
+                    <th style={styles.th}>Статус</th>
                     <th style={styles.th}>Действия</th>
                 </tr>
             </thead>
@@ -103,6 +115,7 @@ const AdminDashboard = () => {
                         <td style={styles.td}>{u.id}</td>
                         <td style={styles.td}>{u.username}</td>
                         <td style={styles.td}>**{u.role}**</td>
+                        <td style={styles.td}>{u.is_active ? 'Активен' : 'Заблокирован'}</td>
                         <td style={styles.td}>
                             {/* Кнопки активны, только если это не текущий пользователь-админ */}
                             {u.id !== user.id && (
@@ -123,6 +136,9 @@ const AdminDashboard = () => {
                                             Сделать Админом
                                         </button>
                                     )}
+                                    <button onClick={() => handleActiveChange(u.id, !u.is_active)} style={{ ...styles.actionButton, backgroundColor: u.is_active ? '#6c757d' : '#28a745', marginLeft: '5px' }}>
+                                        {u.is_active ? 'Заблокировать' : 'Разблокировать'}
+                                    </button>
                                 </>
                             )}
                             {u.id === user.id && <span style={{ color: '#6c757d' }}>Текущий пользователь (Вы)</span>}
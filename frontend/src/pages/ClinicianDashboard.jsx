@@ -1,38 +1,72 @@
 // src/pages/ClinicianDashboard.jsx (НОВЫЙ ФАЙЛ)
-import React, { useState } from 'react';
+import React, { useEffect, useState } from 'react';
 import { useAuth } from '../context/AuthContext';
-import { fetchPatientHistory, prescribeTreatment } from '../api/analysis';
+import { fetchPatientHistory, prescribeTreatment, searchPatients } from '../api/analysis';
 
 // Новый компонент для ввода лечения
 import TreatmentForm from '../components/TreatmentForm';
 
+const SEARCH_DEBOUNCE_MS = 200; // Подсказки запрашиваются после паузы в наборе
+
 const ClinicianDashboard = () => {
     const { user, logout } = useAuth();
     const [mrn, setMrn] = useState('');
     const [patientData, setPatientData] = useState(null); // { patient, analyses }
     const [isLoading, setIsLoading] = useState(false);
     const [error, setError] = useState(null);
+    const [suggestions, setSuggestions] = useState([]); // Подсказки по MRN / ФИО
+
+    // --- 0. Подсказки при вводе ---
+    useEffect(() => {
+        const query = mrn.trim();
+        if (!query) {
+            setSuggestions([]);
+            return;
+        }
+        let cancelled = false; // Ответ на устаревший запрос не показываем
+        const timer = setTimeout(async () => {
+            try {
+                const hits = await searchPatients(query);
+                if (!cancelled) setSuggestions(hits);
+            } catch (e) {
+                console.error("Ошибка поиска подсказок:", e.response?.data || e);
+            }
+        }, SEARCH_DEBOUNCE_MS);
+        return () => {
+            cancelled = true;
+            clearTimeout(timer);
+        };
+    }, [mrn]);
 
     // --- 1. Обработка Поиска ---
-    const handleSearch = async (e) => {
-        e.preventDefault();
-        if (!mrn.trim()) return;
-
+    const loadHistory = async (value) => {
         setIsLoading(true);
         setError(null);
         setPatientData(null);
+        setSuggestions([]);
 
         try {
-            const data = await fetchPatientHistory(mrn.trim());
+            const data = await fetchPatientHistory(value);
             setPatientData(data);
         } catch (e) {
             console.error("Ошибка поиска пациента:", e.response?.data || e);
-            setError(`Пациент с MRN ${mrn} не найден.`);
+            setError(`Пациент с MRN ${value} не найден.`);
         } finally {
             setIsLoading(false);
         }
     };
 
+    const handleSearch = async (e) => {
+        e.preventDefault();
+        if (!mrn.trim()) return;
+        await loadHistory(mrn.trim());
+    };
+
+    const handleSelectSuggestion = async (patient) => {
+        setMrn(patient.medical_record_number);
+        await loadHistory(patient.medical_record_number);
+    };
+
     // --- 2. Обработка Назначения Лечения (передается в TreatmentForm) ---
     const handlePrescribe = async (analysisId, treatmentPlan) => {
         try {
@@ -65,7 +99,7 @@ const ClinicianDashboard = () => {
                     type="text"
                     value={mrn}
                     onChange={(e) => setMrn(e.target.value)}
-                    placeholder="Введите MRN пациента (Medical Record Number)"
+                    placeholder="MRN, фамилия или имя пациента"
                     style={styles.input}
                     disabled={isLoading}
                 />
@@ -74,6 +108,18 @@ const ClinicianDashboard = () => {
                 </button>
             </form>
 
+            {suggestions.length > 0 && !isLoading && mrn.trim() !== patientData?.patient.medical_record_number && (
+                <ul style={styles.suggestions}>
+                    {suggestions.map((patient) => (
+                        <li key={patient.id} style={styles.suggestion} onClick={() => handleSelectSuggestion(patient)}>
+                            <b>{patient.medical_record_number}</b>{' '}
+                            {[patient.last_name, patient.first_name].filter(Boolean).join(' ')}
+                            {patient.date_of_birth && ` (${patient.date_of_birth})`}
+                        </li>
+                    ))}
+                </ul>
+            )}
+
             {error && <p style={styles.errorText}>{error}</p>}
 
             {/* Отображение Истории Пациента */}
@@ -123,6 +169,8 @@ const styles = {
     input: { padding: '10px', flexGrow: 1, borderRadius: '4px', border: '1px solid #ddd' },
     searchButton: { padding: '10px 20px', backgroundColor: '#007bff', color: 'white', border: 'none', borderRadius: '4px', cursor: 'pointer', fontWeight: 'bold' },
     errorText: { color: 'red', marginTop: '10px' },
+    suggestions: { listStyle: 'none', margin: '-25px 0 30px', padding: 0, border: '1px solid #ddd', borderRadius: '4px' },
+    suggestion: { padding: '8px 15px', cursor: 'pointer', borderBottom: '1px solid #eee' },
     historySection: { marginTop: '20px', border: '2px solid #007bff', padding: '20px', borderRadius: '8px' },
     analysisCard: { border: '1px solid #eee', padding: '15px', borderRadius: '5px', marginTop: '15px', backgroundColor: '#f9f9f9' },
     diagnosisText: { fontStyle: 'italic', color: '#555' }
@@ -11,6 +11,7 @@ const DiagnosticianDashboard = () => {
     const { user, logout } = useAuth();
     const [history, setHistory] = useState([]);
     const [historyLoading, setHistoryLoading] = useState(true);
+    const [nextCursor, setNextCursor] = useState(null); // Курсор следующей страницы истории
     const [selectedAnalysis, setSelectedAnalysis] = useState(null); // Анализ, который просматривается в модальном окне
 
     // --- Загрузка истории ---
@@ -18,7 +19,8 @@ const DiagnosticianDashboard = () => {
         setHistoryLoading(true);
         try {
             const data = await fetchAnalysisHistory();
-            setHistory(data);
+            setHistory(data.items);
+            setNextCursor(data.next_cursor);
         } catch (e) {
             console.error("Ошибка загрузки истории:", e);
         } finally {
@@ -26,6 +28,17 @@ const DiagnosticianDashboard = () => {
         }
     };
 
+    // --- Следующая страница истории ---
+    const loadMoreHistory = async () => {
+        try {
+            const data = await fetchAnalysisHistory(nextCursor);
+            setHistory((items) => [...items, ...data.items]);
+            setNextCursor(data.next_cursor);
+        } catch (e) {
+            console.error("Ошибка загрузки истории:", e);
+        }
+    };
+
     useEffect(() => {
         loadHistory();
     }, []);
@@ -110,6 +123,9 @@ const DiagnosticianDashboard = () => {
                     </tbody>
                 </table>
             )}
+            {!historyLoading && nextCursor && (
+                <button style={styles.actionButton} onClick={loadMoreHistory}>Показать еще</button>
+            )}
 
             {/* Модальное окно деталей анализа */}
             {selectedAnalysis && (